@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Run all data-path benchmarks"""
+
+import sys
+
+import bench_merge_count
+import bench_profiles
+import bench_report
+import bench_trackhub
+import harness
+
+benchmarks = bench_merge_count.benchmarks + bench_report.benchmarks + bench_trackhub.benchmarks + bench_profiles.benchmarks
+
+if __name__ == '__main__':
+    sys.exit(harness.main(benchmarks))
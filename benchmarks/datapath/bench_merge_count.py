@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Benchmark lxpipe merge-count"""
+
+import os
+import sys
+
+import harness
+
+from labxpipe_scripts import lxpipe_merge_count
+
+def setup_merge_count(project):
+    path_out = os.path.join(project['path_work'], 'merge_count')
+    argv = ['lxpipe-merge-count', '--pipeline', project['path_pipeline'], '--path_config', project['path_config'], '--http_url', project['http_url'], '--fontools_path_main', project['path_work']]
+    def run():
+        with harness.working_dir(path_out):
+            if lxpipe_merge_count.main(argv):
+                raise RuntimeError('merge-count failed')
+    return run
+
+benchmarks = [harness.Benchmark('merge_count', setup_merge_count, parts=('counts',))]
+
+if __name__ == '__main__':
+    sys.exit(harness.main(benchmarks))
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Benchmark binary profile reading"""
+
+import os
+import sys
+
+import harness
+
+from labxpipe import profiles
+
+def get_paths(project):
+    return [os.path.join(project['path_output'], r, 'profiling', f'genome_{strand}.bin') for r in project['run_refs'] for strand in ['plus', 'minus']]
+
+def setup_query(project):
+    paths = get_paths(project)
+    def run():
+        profiles.open_profile.cache_clear()
+        profiles.query(paths, project['path_genome'], 'chr1', 1000, 11000)
+    return run
+
+def setup_sum(project):
+    paths = get_paths(project)
+    def run():
+        profiles.open_profile.cache_clear()
+        for chrom, values in profiles.sum_profiles(paths, project['path_genome']):
+            pass
+    return run
+
+benchmarks = [
+    harness.Benchmark('profile_query', setup_query, parts=('profiles',)),
+    harness.Benchmark('profile_sum', setup_sum, parts=('profiles',)),
+]
+
+if __name__ == '__main__':
+    sys.exit(harness.main(benchmarks))
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Benchmark lxpipe report and lxpipe extract"""
+
+import os
+import sys
+
+import harness
+
+from labxpipe_scripts import lxpipe_extract
+from labxpipe_scripts import lxpipe_report
+
+def setup_report(report_format):
+    def setup(project):
+        argv = ['lxpipe-report', '--pipeline', project['path_pipeline'], '--path_config', project['path_config'], '--http_url', project['http_url'], '--report_format', report_format]
+        def run():
+            if lxpipe_report.main(argv):
+                raise RuntimeError('report failed')
+        return run
+    return setup
+
+def setup_extract(project):
+    # Files are moved: Created before each round
+    path_extract = os.path.join(project['path_work'], 'extract')
+    os.makedirs(path_extract, exist_ok=True)
+    for f in os.listdir(path_extract):
+        os.remove(os.path.join(path_extract, f))
+    for run_ref in project['run_refs']:
+        path = os.path.join(project['path_output'], run_ref, 'extracting')
+        os.makedirs(path, exist_ok=True)
+        open(os.path.join(path, 'data.txt'), 'wt').close()
+    argv = ['lxpipe-extract', '--pipeline', project['path_pipeline'], '--path_config', project['path_config'], '--http_url', project['http_url'], '--files', 'extracting,data.txt', '--path_extract', path_extract, '--label', '--reference']
+    def run():
+        if lxpipe_extract.main(argv):
+            raise RuntimeError('extract failed')
+    return run
+
+benchmarks = [
+    harness.Benchmark('report_csv', setup_report('csv'), parts=('reports',)),
+    harness.Benchmark('report_xls', setup_report('xls'), parts=('reports',)),
+    harness.Benchmark('extract', setup_extract, parts=(), setup_each=True),
+]
+
+if __name__ == '__main__':
+    sys.exit(harness.main(benchmarks))
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Benchmark lxpipe trackhub config generation and profile sum"""
+
+import os
+import sys
+
+import harness
+
+import labxdb
+from labxpipe import manifest
+from labxpipe import profiles
+from labxpipe_scripts import lxpipe_trackhub
+
+def setup_config(project):
+    path_config = os.path.join(project['path_work'], 'trackhub_config.json')
+    def run():
+        # Cold directory listings
+        manifest.manifests.clear()
+        dbl = labxdb.DBLink(project['http_url'])
+        lxpipe_trackhub.make_config(runs=project['run_refs'], levels=['sample', 'replicate'], path_trackhub_config=path_config, dbl=dbl, path_root_bams=[project['path_output']], bam_folder=['aligning'], bam_names=['accepted_hits.bam'])
+    return run
+
+def setup_sum(project):
+    paths = [os.path.join(project['path_output'], r, 'profiling', 'genome_plus.bin') for r in project['run_refs']]
+    path_bigwig = os.path.join(project['path_work'], 'sum.bw')
+    def run():
+        profiles.open_profile.cache_clear()
+        lxpipe_trackhub.write_summed_profiles(paths, project['path_genome'], path_bigwig)
+    return run
+
+benchmarks = [
+    harness.Benchmark('trackhub_config', setup_config, parts=('bams',)),
+    harness.Benchmark('trackhub_sum', setup_sum, parts=('profiles',)),
+]
+
+if __name__ == '__main__':
+    sys.exit(harness.main(benchmarks))
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Synthetic project outputs: GeneAbacus count CSVs, step reports, fon1 annotations and binary profiles.
+
+Run outputs are hard links to a few templates to keep large projects (thousands of runs) small on disk."""
+
+import datetime
+import json
+import os
+
+import numpy as np
+import zstandard as zstd
+
+count_multis = [1, 2, 900]
+
+def get_names(num_gene, transcripts_per_gene=2):
+    genes = [f'ENSBENG{i:011d}' for i in range(num_gene)]
+    transcripts = [f'ENSBENT{i * transcripts_per_gene + j:011d}' for i in range(num_gene) for j in range(transcripts_per_gene)]
+    return genes, transcripts
+
+def write_fon1(path, num_gene, transcripts_per_gene=2, seed=0):
+    """fon1 JSON (zstd compressed if path ends with .zst) of transcripts with their gene."""
+    rnd = np.random.default_rng(seed)
+    genes, transcripts = get_names(num_gene, transcripts_per_gene)
+    starts = rnd.integers(0, 10000000, len(transcripts))
+    lengths = rnd.integers(300, 5000, len(transcripts))
+    features = []
+    for i, transcript in enumerate(transcripts):
+        igene = i // transcripts_per_gene
+        features.append({
+            'transcript_stable_id': transcript,
+            'gene_stable_id': genes[igene],
+            'gene_name': f'gene{igene}',
+            'chrom': f'chr{igene % 25 + 1}',
+            'strand': '+' if igene % 2 == 0 else '-',
+            'coords': [int(starts[i]), int(starts[i] + lengths[i])],
+        })
+    data = json.dumps({'fon_version': 1, 'features': features}).encode()
+    if path.endswith('.zst'):
+        data = zstd.ZstdCompressor(level=3).compress(data)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def write_counts(path, names, seed=0):
+    """GeneAbacus count CSV: name, length, then count and rpkm per multiplicity. Second line is total."""
+    rnd = np.random.default_rng(seed)
+    lengths = rnd.integers(300, 5000, len(names))
+    counts = rnd.negative_binomial(1, 0.01, (len(names), len(count_multis))).cumsum(axis=1)
+    totals = counts.sum(axis=0)
+    rpkms = counts * 1e9 / lengths[:, None] / totals[None, :]
+    header = ['name', 'length'] + [f'{c}_{m}' for m in count_multis for c in ['count', 'rpkm']]
+    with open(path, 'wt') as f:
+        f.write(','.join(header) + '\n')
+        f.write(','.join(['total', str(lengths.sum())] + [v for t in totals for v in [str(t), '1000000000']]) + '\n')
+        for name, length, count, rpkm in zip(names, lengths.tolist(), counts.tolist(), rpkms.tolist()):
+            f.write(name + ',' + str(length) + ',' + ','.join([f'{c},{r:.6g}' for c, r in zip(count, rpkm)]) + '\n')
+
+def write_reports(path_run, name, features, seed=0):
+    """Step reports of a mRNA-seq run (preparing, aligning and counting per feature) and completion."""
+    rnd = np.random.default_rng(seed)
+    num_input = int(rnd.integers(10000000, 50000000))
+    num_prepared = int(num_input * 0.95)
+    num_unique, num_multi = int(num_prepared * 0.8), int(num_prepared * 0.1)
+    reports = {
+        'preparing': {'input': num_input, 'output': num_prepared, 'ops_r1': {'trim': {'trim_exact': num_input // 3, 'trim_align': num_input // 5}, 'length': {'removed': num_input - num_prepared}}},
+        'aligning': {'input': num_prepared, 'align_unique': num_unique, 'align_multi': num_multi, 'output': num_unique + num_multi},
+    }
+    for step_name, report in reports.items():
+        os.makedirs(os.path.join(path_run, step_name), exist_ok=True)
+        json.dump(report, open(os.path.join(path_run, step_name, step_name + '_report.json'), 'wt'), sort_keys=True, indent=4)
+    os.makedirs(os.path.join(path_run, 'counting'), exist_ok=True)
+    for feature in features:
+        json.dump({'input': num_unique + num_multi, 'output': num_unique}, open(os.path.join(path_run, 'counting', feature + '_report.json'), 'wt'), sort_keys=True, indent=4)
+    start = datetime.datetime(2024, 1, 1)
+    completion = []
+    for step_name in ['preparing', 'aligning', 'counting']:
+        end = start + datetime.timedelta(minutes=int(rnd.integers(5, 120)))
+        completion.append({'step_name': step_name, 'start': start.strftime('%Y-%m-%d %H:%M:%S'), 'end': end.strftime('%Y-%m-%d %H:%M:%S'), 'status': 'done'})
+        start = end
+    os.makedirs(os.path.join(path_run, 'log'), exist_ok=True)
+    json.dump(completion, open(os.path.join(path_run, 'log', name + '_compl.json'), 'wt'), sort_keys=True, indent=4)
+
+def write_profile(path, genome_size, seed=0):
+    """Binary profile (little-endian float64 per position)."""
+    rnd = np.random.default_rng(seed)
+    values = np.zeros(genome_size, dtype='<f8')
+    idx = rnd.integers(0, genome_size, genome_size // 100)
+    values[idx] = rnd.integers(1, 100, len(idx))
+    values.tofile(path)
+
+def write_genome(path, genome_size, num_chrom=5):
+    sizes = [genome_size // num_chrom] * num_chrom
+    sizes[-1] += genome_size - sum(sizes)
+    with open(path, 'wt') as f:
+        for i, size in enumerate(sizes):
+            f.write(f'chr{i + 1}\t{size}\n')
+
+def link(path_template, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.link(path_template, path)
+
+def get_db(run_refs, runs_per_replicate=1, replicates_per_sample=2):
+    """LabxDB records and tree (one project) of runs."""
+    data = {'run': [], 'replicate': [], 'sample': [], 'tree': []}
+    project = {'project_ref': 'BNJ000001', 'project_name': 'bench', 'label_short': 'Bench', 'label_long': 'Benchmark', 'children': []}
+    data['tree'].append(project)
+    for i, run_ref in enumerate(run_refs):
+        ireplicate = i // runs_per_replicate
+        isample = ireplicate // replicates_per_sample
+        if i % runs_per_replicate == 0:
+            if ireplicate % replicates_per_sample == 0:
+                sample = {'sample_ref': f'BNS{isample:06d}', 'label_short': f'sample {isample}', 'label_long': None, 'track_priority': None, 'track_color': None, 'species': 'bench', 'adapter_3p': None, 'adapter_5p': None, 'children': []}
+                project['children'].append(sample)
+                data['sample'].append({k: v for k, v in sample.items() if k != 'children'})
+            replicate = {'replicate_ref': f'BNP{ireplicate:06d}', 'sample_ref': sample['sample_ref'], 'label_short': f'sample {isample} rep {ireplicate % replicates_per_sample + 1}', 'label_long': None, 'replicate_order': ireplicate % replicates_per_sample + 1, 'children': []}
+            sample['children'].append(replicate)
+            data['replicate'].append({k: v for k, v in replicate.items() if k != 'children'})
+        run = {'run_ref': run_ref, 'replicate_ref': replicate['replicate_ref'], 'run_order': i % runs_per_replicate + 1, 'quality_scores': 'Illumina 1.8', 'directional': True, 'paired': False, 'r1_strand': '+', 'max_read_length': 100, 'failed': False}
+        replicate['children'].append(run)
+        data['run'].append(run)
+    return data
+
+def make_project(path_work, num_run, num_gene=60000, transcripts_per_gene=2, genome_size=1000000, num_template=4, parts=('counts', 'reports', 'profiles', 'bams')):
+    """Project of num_run runs in path_work: Returns paths and LabxDB data."""
+    path_output = os.path.join(path_work, 'output')
+    path_annots = os.path.join(path_work, 'annots')
+    path_templates = os.path.join(path_work, 'templates')
+    for p in [path_output, path_annots, path_templates]:
+        os.makedirs(p, exist_ok=True)
+    run_refs = [f'BNR{i:06d}' for i in range(num_run)]
+    features = ['gene', 'transcript']
+    genes, transcripts = get_names(num_gene, transcripts_per_gene)
+    path_genome = os.path.join(path_annots, 'genome.tab')
+    write_genome(path_genome, genome_size)
+    # Templates
+    num_template = min(num_template, num_run)
+    if 'counts' in parts:
+        write_fon1(os.path.join(path_annots, 'bench_cdna.fon1.json.zst'), num_gene, transcripts_per_gene)
+        write_fon1(os.path.join(path_annots, 'bench_union2gene.fon1.json.zst'), num_gene, transcripts_per_gene)
+        for t in range(num_template):
+            write_counts(os.path.join(path_templates, f'gene_{t}.csv'), genes, seed=t)
+            write_counts(os.path.join(path_templates, f'transcript_{t}.csv'), transcripts, seed=t)
+    if 'profiles' in parts:
+        for t in range(num_template):
+            for strand in ['plus', 'minus']:
+                write_profile(os.path.join(path_templates, f'genome_{strand}_{t}.bin'), genome_size, seed=t * 2 + (strand == 'minus'))
+    # Runs
+    for i, run_ref in enumerate(run_refs):
+        t = i % num_template
+        path_run = os.path.join(path_output, run_ref)
+        if 'counts' in parts:
+            for feature in features:
+                link(os.path.join(path_templates, f'{feature}_{t}.csv'), os.path.join(path_run, 'counting', feature + '.csv'))
+        if 'reports' in parts:
+            write_reports(path_run, 'bench', features, seed=i)
+        if 'profiles' in parts:
+            for strand in ['plus', 'minus']:
+                link(os.path.join(path_templates, f'genome_{strand}_{t}.bin'), os.path.join(path_run, 'profiling', f'genome_{strand}.bin'))
+        if 'bams' in parts:
+            os.makedirs(os.path.join(path_run, 'aligning'), exist_ok=True)
+            open(os.path.join(path_run, 'aligning', 'accepted_hits.bam'), 'wb').close()
+    # Config and pipeline
+    path_config = os.path.join(path_work, 'config.json')
+    json.dump({'ref_info_source': ['db'], 'path_annots': path_annots, 'path_cache': os.path.join(path_work, 'cache')}, open(path_config, 'wt'), indent=4)
+    path_pipeline = os.path.join(path_work, 'bench.json')
+    pipeline = {
+        'name': 'bench',
+        'path_output': path_output,
+        'logging_level': 'info',
+        'run_refs': run_refs,
+        'analysis': [
+            {'step_name': 'preparing', 'step_function': 'readknead', 'force': False},
+            {'step_name': 'aligning', 'step_function': 'star', 'force': False},
+            {'step_name': 'counting', 'step_function': 'geneabacus', 'force': False, 'features': [
+                {'name': 'gene', 'path_json': 'bench_union2gene.fon1.json.zst', 'fon_name': 'gene_stable_id'},
+                {'name': 'transcript', 'path_json': 'bench_cdna.fon1.json.zst', 'fon_name': 'transcript_stable_id'},
+            ]},
+        ],
+    }
+    json.dump(pipeline, open(path_pipeline, 'wt'), indent=4)
+    return {
+        'path_work': path_work,
+        'path_output': path_output,
+        'path_annots': path_annots,
+        'path_genome': path_genome,
+        'path_config': path_config,
+        'path_pipeline': path_pipeline,
+        'run_refs': run_refs,
+        'features': features,
+        'db': get_db(run_refs),
+    }
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Measure wall time and peak memory of benchmarks as the number of runs grows, and compare to a baseline.
+
+A benchmark is a function taking the project (see generate.make_project) and returning the function to time,
+as setup in pytest-benchmark's pedantic mode. Wall time is measured without tracemalloc, and the peak of
+Python (and NumPy) allocations in a separate round with tracemalloc."""
+
+import argparse
+import contextlib
+import gc
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+import tracemalloc
+
+import generate
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'orchestration'))
+import labxdb_server
+
+class Benchmark:
+    def __init__(self, name, setup, parts=('counts', 'reports', 'profiles', 'bams'), setup_each=False):
+        self.name = name
+        self.setup = setup
+        self.parts = parts
+        self.setup_each = setup_each
+
+@contextlib.contextmanager
+def working_dir(path):
+    cwd = os.getcwd()
+    os.makedirs(path, exist_ok=True)
+    os.chdir(path)
+    try:
+        yield path
+    finally:
+        os.chdir(cwd)
+
+def measure(benchmark, project, rounds=3):
+    walls = []
+    fn = None
+    for r in range(rounds):
+        if fn is None or benchmark.setup_each:
+            fn = benchmark.setup(project)
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        walls.append(time.perf_counter() - start)
+    if benchmark.setup_each:
+        fn = benchmark.setup(project)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'name': benchmark.name, 'runs': len(project['run_refs']), 'wall_min': min(walls), 'wall_mean': sum(walls) / len(walls), 'peak': peak, 'rounds': rounds}
+
+def compare(results, baseline, max_ratio):
+    """Regressions: Results slower or using more memory than max_ratio times the baseline."""
+    base = {(b['name'], b['runs']): b for b in baseline}
+    regressions = []
+    for r in results:
+        b = base.get((r['name'], r['runs']))
+        if b is None:
+            continue
+        for key in ['wall_min', 'peak']:
+            if b[key] > 0 and r[key] / b[key] > max_ratio:
+                regressions.append(f"{r['name']} ({r['runs']} runs): {key} {r[key]:.4g} vs. {b[key]:.4g} (x{r[key] / b[key]:.2f})")
+    return regressions
+
+def main(benchmarks, argv=None):
+    if argv is None:
+        argv = sys.argv
+    parser = argparse.ArgumentParser(description='Data-path benchmarks.')
+    parser.add_argument('-n', '--runs', dest='runs', action='store', default='10,100', help='Number(s) of runs (comma separated, i.e. 10,100,1000,5000)')
+    parser.add_argument('-b', '--benchmarks', dest='names', action='store', help='Benchmark(s) to run (comma separated, default: all)')
+    parser.add_argument('-g', '--genes', dest='num_gene', action='store', type=int, default=60000, help='Number of genes')
+    parser.add_argument('-s', '--genome_size', dest='genome_size', action='store', type=int, default=1000000, help='Genome size of profiles')
+    parser.add_argument('-r', '--rounds', dest='rounds', action='store', type=int, default=3, help='Number of timed rounds')
+    parser.add_argument('--path_work', dest='path_work', action='store', default='bench_datapath', help='Path to work directory (replaced)')
+    parser.add_argument('--keep', dest='keep', action='store_true', help='Keep work directories')
+    parser.add_argument('-o', '--output', dest='path_output', action='store', help='Path to JSON results')
+    parser.add_argument('-c', '--compare', dest='path_baseline', action='store', help='Path to JSON results to compare with')
+    parser.add_argument('-m', '--max_ratio', dest='max_ratio', action='store', type=float, default=1.2, help='Maximum ratio to baseline before reporting a regression')
+    args = parser.parse_args(argv[1:])
+
+    if args.names is not None:
+        names = [n.strip() for n in args.names.split(',')]
+        benchmarks = [b for b in benchmarks if b.name in names]
+    parts = set([p for b in benchmarks for p in b.parts])
+
+    # Quiet LabxPipe logging
+    logging.disable(logging.WARNING)
+
+    results = []
+    print('\t'.join(['name', 'runs', 'wall_min', 'wall_mean', 'peak_mib']))
+    for num_run in [int(n) for n in args.runs.split(',')]:
+        path_work = os.path.abspath(os.path.join(args.path_work, str(num_run)))
+        if os.path.exists(path_work):
+            shutil.rmtree(path_work)
+        project = generate.make_project(path_work, num_run, num_gene=args.num_gene, genome_size=args.genome_size, parts=parts)
+        server = labxdb_server.start(project['db'])
+        project['http_url'] = server.url
+        try:
+            for benchmark in benchmarks:
+                r = measure(benchmark, project, args.rounds)
+                results.append(r)
+                print(f"{r['name']}\t{r['runs']}\t{r['wall_min']:.4f}\t{r['wall_mean']:.4f}\t{r['peak'] / 2**20:.1f}", flush=True)
+        finally:
+            server.shutdown()
+            server.server_close()
+        if not args.keep:
+            shutil.rmtree(path_work)
+
+    if args.path_output is not None:
+        json.dump(results, open(args.path_output, 'wt'), indent=4)
+    if args.path_baseline is not None:
+        regressions = compare(results, json.load(open(args.path_baseline)), args.max_ratio)
+        for r in regressions:
+            print(f'REGRESSION: {r}', file=sys.stderr)
+        if len(regressions) > 0:
+            return 1
+    return 0
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Benchmark orchestration of lxpipe run on synthetic runs with stub executables and a stand-in LabxDB.
+
+Reported per number of runs:
+    makespan       Wall time of lxpipe run
+    tool_time      Sum of the wall time of top-level tool calls
+    lower_bound    Makespan if LabxPipe had no overhead: max(longest run, tool_time / workers)
+    overhead_run   Worker time not spent in tools per run: (makespan * workers - tool_time) / runs
+    efficiency     lower_bound / makespan
+    cpu            CPU time of lxpipe run and all its children
+    util_alloc     cpu / (makespan * workers * processors)
+    util_host      cpu / (makespan * host cores)
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import labxdb_server
+import stubs
+
+presets = {
+    'mrna': [
+        {'step_name': 'preparing', 'step_function': 'readknead', 'force': False, 'ops_r1': [{'name': 'rename', 'base36': True}, {'name': 'length', 'min_length': 20}], 'zip_fastq_out': 'zstd'},
+        {'step_name': 'aligning', 'step_function': 'star', 'force': False, 'index': 'genome', 'output_type': ['SAM'], 'compress_sam': True},
+        {'step_name': 'counting', 'step_function': 'geneabacus', 'force': False, 'inputs': [{'step': 'aligning', 'fname': 'accepted_hits.sam.zst', 'type': 'sam'}], 'features': [
+            {'name': 'transcript', 'path_json': 'features.json', 'fon_name': 'transcript_stable_id', 'read_min_overlap': 10},
+            {'name': 'gene', 'path_json': 'features.json', 'fon_name': 'gene_stable_id', 'read_min_overlap': 10},
+        ]},
+        {'step_name': 'cleaning', 'force': False, 'steps': [{'step_name': 'preparing', 'pattern': '*.fastq.zst'}]},
+    ],
+    'chip': [
+        {'step_name': 'preparing', 'step_function': 'readknead', 'force': False, 'ops_r1': [{'name': 'rename', 'base36': True}, {'name': 'length', 'min_length': 20}], 'zip_fastq_out': 'zstd'},
+        {'step_name': 'genomic_aligning', 'step_function': 'bowtie2', 'force': False, 'index': 'genome', 'output': 'accepted_hits.sam', 'options': ['--no-unal'], 'create_bam': True},
+        {'step_name': 'profiling', 'step_function': 'geneabacus', 'force': False, 'inputs': [{'step': 'genomic_aligning', 'fname': 'accepted_hits.bam', 'type': 'bam'}], 'features': [
+            {'name': 'genome', 'path_tab': 'genome.tab', 'path_genome': 'genome.tab', 'profile_formats': ['bedgraph'], 'create_bigwig': True, 'bigwig_writer': 'bg2bw'},
+        ]},
+        {'step_name': 'cleaning', 'force': False, 'steps': [{'step_name': 'genomic_aligning', 'pattern': '*.sam'}]},
+    ],
+}
+
+def write_fastq(path, num_read, read_length=50):
+    bases = 'ACGT'
+    with open(path, 'wt') as f:
+        for i in range(num_read):
+            seq = ''.join([bases[(i * 7 + j * 13) % 4] for j in range(read_length)])
+            f.write(f'@read{i} 1:N:0\n{seq}\n+\n{"I" * read_length}\n')
+
+def make_tree(path_work, num_run, num_read, analysis):
+    """Synthetic runs, LabxDB data, global config and pipeline."""
+    path_seq = os.path.join(path_work, 'seq')
+    path_annots = os.path.join(path_work, 'annots')
+    os.makedirs(path_annots)
+    # Annotations
+    with open(os.path.join(path_annots, 'genome.tab'), 'wt') as f:
+        f.write(''.join([f'{c}\t{s}\n' for c, s in stubs.default_genome]))
+    json.dump([], open(os.path.join(path_annots, 'features.json'), 'wt'))
+    # Runs (FASTQ shared with hard links)
+    path_template = os.path.join(path_work, 'template.fastq')
+    write_fastq(path_template, num_read)
+    data = {'run': [], 'replicate': [], 'sample': []}
+    run_refs = []
+    for i in range(num_run):
+        run_ref, replicate_ref, sample_ref = f'BNR{i:06d}', f'BNP{i:06d}', f'BNS{i:06d}'
+        os.makedirs(os.path.join(path_seq, run_ref))
+        os.link(path_template, os.path.join(path_seq, run_ref, f'{run_ref}_R1.fastq'))
+        data['run'].append({'run_ref': run_ref, 'replicate_ref': replicate_ref, 'run_order': 1, 'quality_scores': 'Illumina 1.8', 'directional': True, 'paired': False, 'r1_strand': '+', 'max_read_length': 50, 'failed': False})
+        data['replicate'].append({'replicate_ref': replicate_ref, 'sample_ref': sample_ref, 'label_short': f'bench_{i}'})
+        data['sample'].append({'sample_ref': sample_ref, 'adapter_3p': 'TruSeq Index', 'adapter_5p': None})
+        run_refs.append(run_ref)
+    # Global config
+    path_config = os.path.join(path_work, 'config.json')
+    json.dump({'path_seq_run': path_seq, 'ref_info_source': ['db'], 'path_annots': path_annots, 'fastq_exts': ['.fastq', '.fastq.zst'], 'adaptors': {'TruSeq Index': 'AGATCGGAAGAGCACACGTCTGAA'}}, open(path_config, 'wt'), indent=4)
+    # Pipeline
+    path_pipeline = os.path.join(path_work, 'pipeline.json')
+    pipeline = {
+        'name': 'bench',
+        'path_output': os.path.join(path_work, 'output'),
+        'path_star_index': path_annots,
+        'path_bowtie2_index': path_annots,
+        'logging_level': 'info',
+        'run_refs': run_refs,
+        'analysis': analysis,
+    }
+    json.dump(pipeline, open(path_pipeline, 'wt'), indent=4)
+    return data, path_config, path_pipeline, pipeline['path_output']
+
+def read_calls(path_log):
+    calls = []
+    if os.path.exists(path_log):
+        with open(path_log, 'rt') as f:
+            for line in f:
+                calls.append(json.loads(line))
+    return calls
+
+def get_run_ref(path, path_output):
+    rel = os.path.relpath(path, path_output)
+    if rel.startswith('..'):
+        return None
+    return rel.split(os.sep)[0]
+
+def count_done(path_output, run_refs, num_step):
+    num_done = 0
+    for run_ref in run_refs:
+        path_compl = os.path.join(path_output, run_ref, 'log', 'bench_compl.json')
+        if os.path.exists(path_compl) and len([s for s in json.load(open(path_compl)) if s['status'] == 'done']) == num_step:
+            num_done += 1
+    return num_done
+
+def bench(path_work, num_run, num_read, analysis, num_worker, num_processor, lxpipe_cmd, path_profile=None, db_delay=0.):
+    data, path_config, path_pipeline, path_output = make_tree(path_work, num_run, num_read, analysis)
+    path_bin = stubs.install(os.path.join(path_work, 'bin'))
+    path_log = os.path.join(path_work, 'calls.jsonl')
+    server = labxdb_server.start(data, delay=db_delay)
+    env = {
+        **os.environ,
+        'PATH': path_bin + os.pathsep + os.environ.get('PATH', ''),
+        'HTS_CONFIG_PATH': path_config,
+        'LABXDB_HTTP_URL': server.url,
+        'LXPIPE_BENCH_LOG': path_log,
+        'XDG_CACHE_HOME': os.path.join(path_work, 'cache'),
+    }
+    if path_profile is not None:
+        env['LXPIPE_BENCH_PROFILE'] = os.path.abspath(path_profile)
+    # Run
+    start = time.time()
+    p = subprocess.Popen(lxpipe_cmd + ['run', '--pipeline', path_pipeline, '--worker', str(num_worker), '--processor', str(num_processor)], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    stderr = p.stderr.read()
+    pid, status, rusage = os.wait4(p.pid, 0)
+    makespan = time.time() - start
+    p.returncode = os.waitstatus_to_exitcode(status)
+    server.shutdown()
+    # Tool calls (nested calls, e.g. decompression by a tool, are included in their parent)
+    calls = [c for c in read_calls(path_log) if c['depth'] == 0]
+    tool_time = sum([c['end'] - c['start'] for c in calls])
+    run_times = {}
+    for c in calls:
+        run_ref = get_run_ref(c['path_output'], path_output)
+        run_times[run_ref] = run_times.get(run_ref, 0.) + c['end'] - c['start']
+    num_slot = min(num_worker, num_run)
+    lower_bound = max(max(run_times.values(), default=0.), tool_time / num_slot)
+    cpu = rusage.ru_utime + rusage.ru_stime
+    db_stats = server.get_stats()
+    return {
+        'runs': num_run,
+        'done': count_done(path_output, [r['run_ref'] for r in data['run']], len(analysis)),
+        'returncode': p.returncode,
+        'stderr': stderr.decode(errors='replace')[-2000:] if p.returncode != 0 else '',
+        'workers': num_worker,
+        'processors': num_processor,
+        'tool_calls': len(calls),
+        'makespan': makespan,
+        'tool_time': tool_time,
+        'lower_bound': lower_bound,
+        'overhead_run': (makespan * num_slot - tool_time) / num_run,
+        'efficiency': lower_bound / makespan if makespan > 0 else 0.,
+        'cpu': cpu,
+        'util_alloc': cpu / (makespan * num_slot * num_processor),
+        'util_host': cpu / (makespan * os.cpu_count()),
+        'db_queries': db_stats['num_query'],
+        'db_time': db_stats['time_query'],
+    }
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    parser = argparse.ArgumentParser(description='Benchmark lxpipe run orchestration with stub executables.')
+    parser.add_argument('-n', '--runs', dest='runs', action='store', default='10,100', help='Number(s) of runs (comma separated, i.e. 10,100,1000,10000)')
+    parser.add_argument('-w', '--worker', dest='num_worker', action='store', type=int, default=4, help='Number of run in parallel')
+    parser.add_argument('-p', '--processor', dest='num_processor', action='store', type=int, default=2, help='Number of processor per run')
+    parser.add_argument('-e', '--preset', dest='preset', action='store', choices=sorted(presets.keys()), default='mrna', help='Pipeline')
+    parser.add_argument('-a', '--analysis', dest='path_analysis', action='store', help='Path to JSON list of steps (replaces preset)')
+    parser.add_argument('-r', '--reads', dest='num_read', action='store', type=int, default=1000, help='Number of reads per run')
+    parser.add_argument('-f', '--profile', dest='path_profile', action='store', help='Path to JSON CPU/sleep/IO profile of tools (see stubs.py)')
+    parser.add_argument('--db_delay', dest='db_delay', action='store', type=float, default=0., help='LabxDB delay per query (s)')
+    parser.add_argument('--path_work', dest='path_work', action='store', default='bench_run', help='Path to work directory (replaced)')
+    parser.add_argument('--lxpipe', dest='lxpipe', action='store', default='lxpipe', help='lxpipe command')
+    parser.add_argument('--keep', dest='keep', action='store_true', help='Keep work directories')
+    parser.add_argument('-o', '--output', dest='path_output', action='store', help='Path to JSON results')
+    args = parser.parse_args(argv[1:])
+
+    if args.path_analysis is None:
+        analysis = presets[args.preset]
+    else:
+        analysis = json.load(open(args.path_analysis))
+    lxpipe_cmd = args.lxpipe.split()
+    if shutil.which(lxpipe_cmd[0]) is None:
+        print(f'ERROR: {lxpipe_cmd[0]} not found', file=sys.stderr)
+        return 1
+
+    results = []
+    columns = ['runs', 'done', 'makespan', 'tool_time', 'lower_bound', 'overhead_run', 'efficiency', 'cpu', 'util_alloc', 'util_host', 'db_queries']
+    print('\t'.join(columns))
+    for num_run in [int(n) for n in args.runs.split(',')]:
+        path_work = os.path.abspath(os.path.join(args.path_work, str(num_run)))
+        if os.path.exists(path_work):
+            shutil.rmtree(path_work)
+        os.makedirs(path_work)
+        r = bench(path_work, num_run, args.num_read, analysis, args.num_worker, args.num_processor, lxpipe_cmd, args.path_profile, args.db_delay)
+        results.append(r)
+        print('\t'.join([f'{r[c]:.3f}' if isinstance(r[c], float) else str(r[c]) for c in columns]), flush=True)
+        if r['returncode'] != 0:
+            print(r['stderr'], file=sys.stderr)
+        if not args.keep:
+            shutil.rmtree(path_work)
+    if args.path_output is not None:
+        json.dump(results, open(args.path_output, 'wt'), indent=4)
+    return max([abs(r['returncode']) for r in results])
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Stand-in LabxDB HTTP server serving runs, replicates, samples and their tree from a JSON file."""
+
+import argparse
+import http.server
+import json
+import sys
+import threading
+import time
+import urllib.parse
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, data=None):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Query-status', status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_query(self, method):
+        start = time.time()
+        if self.server.delay > 0:
+            time.sleep(self.server.delay)
+        path = [p for p in urllib.parse.urlparse(self.path).path.split('/') if len(p) > 0]
+        # Drop http_path prefix
+        while len(path) > 0 and path[0] not in self.server.tables and path[0] not in ['tree', '_stats']:
+            path = path[1:]
+        if path == ['_stats']:
+            self.reply('OK', self.server.get_stats())
+            return
+        if method == 'GET' and len(path) == 3 and path[1] == 'get-ref':
+            record = self.server.refs[path[0]].get(path[2])
+            if record is None:
+                self.reply(f'{path[0]} {path[2]} not found')
+            else:
+                self.reply('OK', [[record]])
+        elif method == 'POST' and len(path) == 1:
+            length = int(self.headers.get('Content-Length', 0))
+            form = urllib.parse.parse_qs(self.rfile.read(length).decode())
+            if path[0] == 'tree':
+                self.reply('OK', self.server.search_tree(form.get('search_criterion', [])))
+            else:
+                self.reply('OK', self.server.search(path[0], form.get('search_criterion', []), form.get('sort_criterion', [])))
+        else:
+            self.reply(f'Unknown query {self.path}')
+        self.server.add_query(time.time() - start)
+
+    def do_GET(self):
+        self.handle_query('GET')
+
+    def do_POST(self):
+        self.handle_query('POST')
+
+class Server(http.server.ThreadingHTTPServer):
+    """LabxDB stand-in: data is {"run": [...], "replicate": [...], "sample": [...], "tree": [...]}.
+    The tree is a list of projects with samples, replicates and runs as children."""
+    daemon_threads = True
+    tables = ['run', 'replicate', 'sample']
+
+    def __init__(self, data, host='127.0.0.1', port=0, delay=0.):
+        super().__init__((host, port), Handler)
+        self.data = data
+        self.refs = {t: {r[t + '_ref']: r for r in data.get(t, [])} for t in self.tables}
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.num_query = 0
+        self.time_query = 0.
+
+    @property
+    def url(self):
+        return f'http://{self.server_address[0]}:{self.server_address[1]}'
+
+    def search(self, table, search_criteria, sort_criteria):
+        """Criteria as 'level field EQUAL value' and 'level field ASC|DESC'."""
+        records = self.data.get(table, [])
+        for criterion in search_criteria:
+            level, field, operator, value = criterion.split(' ', 3)
+            if operator != 'EQUAL':
+                raise ValueError(f'Unsupported operator {operator}')
+            records = [r for r in records if str(r.get(field)) == value]
+        for criterion in reversed(sort_criteria):
+            level, field, order = criterion.split(' ')
+            records = sorted(records, key=lambda r: r.get(field), reverse=order == 'DESC')
+        return records
+
+    def search_tree(self, search_criteria):
+        """Projects restricted to the records matching any criterion 'level field EQUAL value' (with their ancestors and descendants)."""
+        criteria = {}
+        for criterion in search_criteria:
+            level, field, operator, value = criterion.split(' ', 3)
+            criteria.setdefault(int(level), {}).setdefault(field, set()).add(value)
+        def prune(node, level, matched):
+            matched = matched or any([str(node.get(f)) in values for f, values in criteria.get(level, {}).items()])
+            children = [c for c in [prune(c, level + 1, matched) for c in node.get('children', [])] if c is not None]
+            if matched or len(children) > 0:
+                if 'children' in node:
+                    return {**node, 'children': children}
+                return node
+        return [p for p in [prune(p, 0, False) for p in self.data.get('tree', [])] if p is not None]
+
+    def add_query(self, duration):
+        with self.lock:
+            self.num_query += 1
+            self.time_query += duration
+
+    def get_stats(self):
+        with self.lock:
+            return {'num_query': self.num_query, 'time_query': self.time_query}
+
+def start(data, host='127.0.0.1', port=0, delay=0.):
+    """Start server in a thread."""
+    server = Server(data, host, port, delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    parser = argparse.ArgumentParser(description='Stand-in LabxDB HTTP server.')
+    parser.add_argument('-d', '--data', dest='path_data', action='store', required=True, help='Path to JSON data')
+    parser.add_argument('--host', dest='host', action='store', default='127.0.0.1', help='Host')
+    parser.add_argument('--port', dest='port', action='store', type=int, default=8080, help='Port')
+    parser.add_argument('--delay', dest='delay', action='store', type=float, default=0., help='Delay per query (s)')
+    args = parser.parse_args(argv[1:])
+
+    server = Server(json.load(open(args.path_data)), args.host, args.port, args.delay)
+    print(f'Serving at {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    sys.exit(main())
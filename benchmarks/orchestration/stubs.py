@@ -0,0 +1,584 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Stub executables (STAR, bowtie2, readknead, geneabacus, samtools, bg2bw and zstd) writing correctly named outputs and logs.
+
+The tool is selected by the name of the executable (symlink to this file). The cost of each call is set in the JSON file
+LXPIPE_BENCH_PROFILE: {"default": {...}, "STAR": {...}, ...} with keys:
+    cpu            CPU seconds per call, shared by the threads of the tool
+    cpu_per_mread  CPU seconds per million input reads, shared by the threads of the tool
+    sleep          Wall seconds per call (waiting for I/O)
+    io             Bytes written (and removed) next to the output
+    fsync          Flush the io bytes to disk
+    align_rate     Proportion of aligned reads (aligners)
+    multi_rate     Proportion of aligned reads mapped to multiple loci (aligners)
+    features       Number of features counted from JSON annotations (geneabacus)
+Each call is appended to the JSON lines file LXPIPE_BENCH_LOG."""
+
+import gzip
+import json
+import os
+import random
+import resource
+import struct
+import subprocess
+import sys
+import time
+
+tools = ['STAR', 'bowtie2', 'readknead', 'geneabacus', 'samtools', 'bg2bw', 'zstd', 'zstdcat']
+
+default_profile = {'cpu': 0., 'cpu_per_mread': 0., 'sleep': 0., 'io': 0, 'fsync': False, 'align_rate': 0.9, 'multi_rate': 0.1, 'features': 100}
+
+# Genome of SAM header and profiles
+default_genome = [('chr1', 200000), ('chr2', 100000)]
+
+zstd_magic = b'\x28\xb5\x2f\xfd'
+zstd_max_block = 128 * 1024
+
+# Profile
+
+def get_profile(tool):
+    profile = dict(default_profile)
+    if 'LXPIPE_BENCH_PROFILE' in os.environ:
+        config = json.load(open(os.environ['LXPIPE_BENCH_PROFILE']))
+        profile.update(config.get('default', {}))
+        profile.update(config.get(tool, {}))
+    return profile
+
+def spin(seconds):
+    end = time.process_time() + seconds
+    x = 0
+    while time.process_time() < end:
+        for i in range(10000):
+            x += i
+
+def burn(seconds, num_thread=1):
+    """Use seconds of CPU shared by num_thread processes."""
+    if seconds <= 0:
+        return
+    num_thread = max(1, num_thread)
+    share = seconds / num_thread
+    pids = []
+    for i in range(num_thread - 1):
+        pid = os.fork()
+        if pid == 0:
+            spin(share)
+            os._exit(0)
+        pids.append(pid)
+    spin(share)
+    for pid in pids:
+        os.waitpid(pid, 0)
+
+def write_io(path_dir, nbytes, fsync=False):
+    if nbytes <= 0:
+        return
+    path = os.path.join(path_dir, f'.bench_io_{os.getpid()}')
+    chunk = b'\0' * min(nbytes, 1024 * 1024)
+    with open(path, 'wb') as f:
+        written = 0
+        while written < nbytes:
+            f.write(chunk[:nbytes - written])
+            written += len(chunk)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.remove(path)
+
+def spend(profile, path_dir, num_thread=1, num_read=0):
+    burn(profile['cpu'] + profile['cpu_per_mread'] * num_read / 1e6, num_thread)
+    if profile['sleep'] > 0:
+        time.sleep(profile['sleep'])
+    write_io(path_dir, int(profile['io']), profile['fsync'])
+
+def log_call(tool, start, num_thread, num_read, path_output):
+    """Append call to LXPIPE_BENCH_LOG (a single write is atomic in append mode)."""
+    if 'LXPIPE_BENCH_LOG' not in os.environ:
+        return
+    rs = resource.getrusage(resource.RUSAGE_SELF)
+    rc = resource.getrusage(resource.RUSAGE_CHILDREN)
+    record = {
+        'tool': tool,
+        'start': start,
+        'end': time.time(),
+        'cpu': rs.ru_utime + rs.ru_stime + rc.ru_utime + rc.ru_stime,
+        'num_thread': num_thread,
+        'num_read': num_read,
+        'path_output': os.path.abspath(path_output),
+        'depth': int(os.environ.get('LXPIPE_BENCH_DEPTH', '0')),
+        'pid': os.getpid(),
+    }
+    fd = os.open(os.environ['LXPIPE_BENCH_LOG'], os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, (json.dumps(record) + '\n').encode())
+    finally:
+        os.close(fd)
+
+# Options
+
+def get_value(argv, name, default=None):
+    if name in argv:
+        return argv[argv.index(name) + 1]
+    return default
+
+def get_values(argv, name):
+    """Values following a multi-value option (until next --option)."""
+    if name not in argv:
+        return []
+    values = []
+    for a in argv[argv.index(name) + 1:]:
+        if a.startswith('--'):
+            break
+        values.append(a)
+    return values
+
+def get_num_thread(value):
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return 1
+
+# zstd frames with raw (uncompressed) blocks: Readable by zstd
+
+def zstd_encode(data):
+    # Frame header: No content size or checksum, 128 KiB window
+    out = [zstd_magic, b'\x00', bytes([7 << 3])]
+    for i in range(0, max(len(data), 1), zstd_max_block):
+        block = data[i:i + zstd_max_block]
+        last = i + zstd_max_block >= len(data)
+        out.append(struct.pack('<I', (len(block) << 3) | int(last))[:3])
+        out.append(block)
+    return b''.join(out)
+
+def zstd_decode(data):
+    out = []
+    pos = 0
+    while pos < len(data):
+        if data[pos:pos + 4] != zstd_magic:
+            raise ValueError('Not a zstd frame')
+        descriptor = data[pos + 4]
+        if descriptor != 0:
+            raise ValueError('Only frames written by the zstd stub are supported')
+        pos += 6
+        while True:
+            header = struct.unpack('<I', data[pos:pos + 3] + b'\0')[0]
+            pos += 3
+            if (header >> 1) & 3 != 0:
+                raise ValueError('Only raw blocks are supported')
+            size = header >> 3
+            out.append(data[pos:pos + size])
+            pos += size
+            if header & 1:
+                break
+    return b''.join(out)
+
+# Input/Output
+
+def read_file(path, command=None):
+    """Content of path, decompressed by command or according to magic bytes."""
+    if command:
+        env = {**os.environ, 'LXPIPE_BENCH_DEPTH': str(int(os.environ.get('LXPIPE_BENCH_DEPTH', '0')) + 1)}
+        return subprocess.run(command + [path], stdout=subprocess.PIPE, check=True, env=env).stdout
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data.startswith(zstd_magic):
+        return zstd_decode(data)
+    elif data.startswith(b'\x1f\x8b'):
+        return gzip.decompress(data)
+    return data
+
+def write_file(path, data, command=None):
+    """Write data to path, through command (i.e. ReadKnead fq_command_out) if defined."""
+    if command:
+        env = {**os.environ, 'LXPIPE_BENCH_DEPTH': str(int(os.environ.get('LXPIPE_BENCH_DEPTH', '0')) + 1)}
+        subprocess.run(command + [path], input=data, check=True, env=env)
+    else:
+        with open(path, 'wb') as f:
+            f.write(data)
+
+def read_fastqs(paths, command=None):
+    records = []
+    for path in paths:
+        lines = read_file(path, command).splitlines()
+        records.extend([lines[i:i + 4] for i in range(0, len(lines) - 3, 4)])
+    return records
+
+def count_sam_reads(data):
+    return sum([1 for l in data.splitlines() if len(l) > 0 and not l.startswith(b'@')])
+
+def make_sam(records, align_rate, multi_rate, genome=default_genome, seed=0):
+    """Synthetic alignments of reads: (SAM, number of unique, number of multi, unaligned records)."""
+    rnd = random.Random(seed)
+    lines = [b'@HD\tVN:1.6\tSO:unsorted']
+    lines.extend([f'@SQ\tSN:{c}\tLN:{s}'.encode() for c, s in genome])
+    num_unique, num_multi = 0, 0
+    unaligned = []
+    for record in records:
+        name = record[0][1:].split()[0]
+        r = rnd.random()
+        if r < align_rate:
+            nh = 2 if r < align_rate * multi_rate else 1
+            if nh == 1:
+                num_unique += 1
+            else:
+                num_multi += 1
+            for ih in range(nh):
+                chrom, size = genome[rnd.randrange(len(genome))]
+                flag = (16 if rnd.random() < 0.5 else 0) | (256 if ih > 0 else 0)
+                seq = record[1]
+                pos = rnd.randrange(1, max(2, size - len(seq)))
+                lines.append(b'\t'.join([name, str(flag).encode(), chrom.encode(), str(pos).encode(), b'255', f'{len(seq)}M'.encode(), b'*', b'0', b'0', seq, record[3], f'NH:i:{nh}'.encode()]))
+        else:
+            unaligned.append(record)
+    return b'\n'.join(lines) + b'\n', num_unique, num_multi, unaligned
+
+def read_genome(path):
+    genome = []
+    with open(path, 'rt') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) >= 2 and not line.startswith('#'):
+                genome.append((fields[0], int(fields[1])))
+    return genome
+
+# Tools
+
+def run_star(argv):
+    if '--version' in argv:
+        print('2.7.11a')
+        return 0
+    start = time.time()
+    profile = get_profile('STAR')
+    prefix = get_value(argv, '--outFileNamePrefix', './')
+    num_thread = get_num_thread(get_value(argv, '--runThreadN'))
+    if get_value(argv, '--runMode') == 'genomeGenerate':
+        path_dir = get_value(argv, '--genomeDir', '.')
+        spend(profile, path_dir, num_thread)
+        open(os.path.join(path_dir, 'SA'), 'wb').close()
+        log_call('STAR', start, num_thread, 0, path_dir)
+        return 0
+    fqs = get_values(argv, '--readFilesIn')
+    command = get_values(argv, '--readFilesCommand')
+    records = read_fastqs(fqs[0].split(','), command)
+    sam, num_unique, num_multi, unaligned = make_sam(records, profile['align_rate'], profile['multi_rate'])
+    spend(profile, os.path.dirname(prefix) or '.', num_thread, len(records))
+    # Output
+    output_type = get_values(argv, '--outSAMtype') or ['SAM']
+    if output_type[0] == 'BAM' and 'SortedByCoordinate' in output_type:
+        write_file(prefix + 'Aligned.sortedByCoord.out.bam', sam)
+    if output_type[0] == 'BAM' and 'Unsorted' in output_type:
+        write_file(prefix + 'Aligned.out.bam', sam)
+    if output_type[0] == 'SAM':
+        write_file(prefix + 'Aligned.out.sam', sam)
+    if get_value(argv, '--outReadsUnmapped') == 'Fastx':
+        write_file(prefix + 'Unmapped.out.mate1', b''.join([b'\n'.join(r) + b'\n' for r in unaligned]))
+    open(prefix + 'SJ.out.tab', 'wt').close()
+    with open(prefix + 'Log.out', 'wt') as f:
+        f.write('STAR version=2.7.11a\n##### Command Line:\n' + ' '.join(['STAR'] + argv) + '\n')
+    with open(prefix + 'Log.progress.out', 'wt') as f:
+        f.write('ALL DONE!\n')
+    num_input = len(records)
+    with open(prefix + 'Log.final.out', 'wt') as f:
+        rows = [
+            ('Number of input reads', num_input),
+            ('Average input read length', len(records[0][1]) if num_input > 0 else 0),
+            ('UNIQUE READS:', None),
+            ('Uniquely mapped reads number', num_unique),
+            ('Uniquely mapped reads %', f'{100. * num_unique / max(num_input, 1):.2f}%'),
+            ('MULTI-MAPPING READS:', None),
+            ('Number of reads mapped to multiple loci', num_multi),
+            ('% of reads mapped to multiple loci', f'{100. * num_multi / max(num_input, 1):.2f}%'),
+            ('UNMAPPED READS:', None),
+            ('Number of reads unmapped: other', len(unaligned)),
+        ]
+        for name, value in rows:
+            if value is None:
+                f.write(f'{name}\n')
+            else:
+                f.write(f'{name.rjust(50)} |\t{value}\n')
+    log_call('STAR', start, num_thread, num_input, prefix)
+    return 0
+
+def run_bowtie2(argv):
+    if '--version' in argv:
+        print(f'{os.path.abspath(sys.argv[0])}-align-s version 2.5.1\n64-bit')
+        return 0
+    start = time.time()
+    profile = get_profile('bowtie2')
+    num_thread = get_num_thread(get_value(argv, '--threads', get_value(argv, '-p')))
+    path_sam = get_value(argv, '-S')
+    if '-U' in argv:
+        records = read_fastqs(get_value(argv, '-U').split(','))
+        paired = False
+    else:
+        records = read_fastqs(get_value(argv, '-1').split(','))
+        paired = True
+    sam, num_unique, num_multi, unaligned = make_sam(records, profile['align_rate'], profile['multi_rate'])
+    spend(profile, os.path.dirname(os.path.abspath(path_sam)), num_thread, len(records))
+    write_file(path_sam, sam)
+    for option in ['--un', '--un-gz', '--un-conc', '--un-conc-gz']:
+        if option in argv:
+            write_file(get_value(argv, option), b''.join([b'\n'.join(r) + b'\n' for r in unaligned]))
+    # Summary (stderr)
+    n = len(records)
+    pc = lambda v: f'{100. * v / max(n, 1):.2f}%'
+    if paired:
+        lines = [f'{n} reads; of these:', f'  {n} ({pc(n)}) were paired; of these:', f'    {len(unaligned)} ({pc(len(unaligned))}) aligned concordantly 0 times', f'    {num_unique} ({pc(num_unique)}) aligned concordantly exactly 1 time', f'    {num_multi} ({pc(num_multi)}) aligned concordantly >1 times']
+        if '--no-discordant' not in argv:
+            lines.extend(['    ----', f'    {len(unaligned)} pairs aligned concordantly 0 times; of these:', '      0 (0.00%) aligned discordantly 1 time'])
+        if '--no-mixed' not in argv:
+            lines.extend(['    ----', f'    {len(unaligned)} pairs aligned 0 times concordantly or discordantly; of these:', f'      {2 * len(unaligned)} mates make up the pairs; of these:', f'        {2 * len(unaligned)} (100.00%) aligned 0 times', '        0 (0.00%) aligned exactly 1 time', '        0 (0.00%) aligned >1 times'])
+    else:
+        lines = [f'{n} reads; of these:', f'  {n} ({pc(n)}) were unpaired; of these:', f'    {len(unaligned)} ({pc(len(unaligned))}) aligned 0 times', f'    {num_unique} ({pc(num_unique)}) aligned exactly 1 time', f'    {num_multi} ({pc(num_multi)}) aligned >1 times']
+    lines.append(f'{pc(num_unique + num_multi)} overall alignment rate')
+    sys.stderr.write('\n'.join(lines) + '\n')
+    log_call('bowtie2', start, num_thread, n, path_sam)
+    return 0
+
+def run_readknead(argv):
+    if '--version' in argv:
+        print('0.7.0')
+        return 0
+    start = time.time()
+    profile = get_profile('readknead')
+    num_thread = get_num_thread(get_value(argv, '--num_worker'))
+    command_in = get_value(argv, '--fq_command_in')
+    command_in = command_in.split(',') if command_in else None
+    command_out = get_value(argv, '--fq_command_out')
+    command_out = command_out.split(',') if command_out else None
+    path_out = get_value(argv, '--fq_path_out')
+    num_input, num_output = 0, 0
+    for end in ['r1', 'r2']:
+        if f'--fq_fnames_{end}' not in argv:
+            continue
+        records = read_fastqs(get_value(argv, f'--fq_fnames_{end}').split(','), command_in)
+        num_input += len(records)
+        if path_out is not None and f'--fq_fname_out_{end}' in argv:
+            write_file(os.path.join(path_out, get_value(argv, f'--fq_fname_out_{end}')), b''.join([b'\n'.join(r) + b'\n' for r in records]), command_out)
+        num_output += len(records)
+    spend(profile, path_out or '.', num_thread, num_input)
+    for option in ['--stats_in_path', '--stats_out_path']:
+        if option in argv:
+            os.makedirs(get_value(argv, option), exist_ok=True)
+    if '--report_path' in argv:
+        json.dump({'input': num_input, 'output': num_output, 'label': get_value(argv, '--label')}, open(get_value(argv, '--report_path'), 'wt'), sort_keys=True, indent=4, separators=(',', ': '))
+    print(f'Processed {num_input} reads')
+    log_call('readknead', start, num_thread, num_input, path_out or '.')
+    return 0
+
+def run_geneabacus(argv):
+    if '--version' in argv:
+        print('0.4.0')
+        return 0
+    start = time.time()
+    profile = get_profile('geneabacus')
+    num_thread = get_num_thread(get_value(argv, '--num_worker'))
+    # Input
+    command = get_value(argv, '--sam_command_in')
+    command = command.split(',') if command else None
+    num_input = 0
+    sam = b''
+    for option in ['--path_sam', '--path_bam']:
+        for path in (get_value(argv, option) or '').split(','):
+            if len(path) > 0:
+                data = read_file(path, command if option == '--path_sam' else None)
+                num_input += count_sam_reads(data)
+                sam += data
+    # Features
+    path_features = get_value(argv, '--path_features')
+    if get_value(argv, '--format_features') == 'tab':
+        features = read_genome(path_features)
+    else:
+        features = [(f'feature{i}', 1000) for i in range(int(profile['features']))]
+    path_report = get_value(argv, '--path_report')
+    path_dir = os.path.dirname(os.path.abspath(path_report or get_value(argv, '--count_path') or '.'))
+    spend(profile, path_dir, num_thread, num_input)
+    # Counts
+    count_multis = (get_value(argv, '--count_multis') or '1,2,900').split(',')
+    if get_value(argv, '--count_path') is not None:
+        rnd = random.Random(num_input)
+        counts = [rnd.randrange(0, max(1, 2 * num_input // max(1, len(features)))) for f in features]
+        total_length = sum([l for n, l in features])
+        with open(get_value(argv, '--count_path'), 'wt') as f:
+            f.write(','.join(['name', 'length'] + [f'{c}_{m}' for m in count_multis for c in ['count', 'rpkm']]) + '\n')
+            f.write(','.join(['total', str(total_length)] + [v for m in count_multis for v in [str(num_input), '1000000000']]) + '\n')
+            for (name, length), count in zip(features, counts):
+                rpkm = count * 1e9 / length / max(num_input, 1)
+                f.write(','.join([name, str(length)] + [v for m in count_multis for v in [str(count), f'{rpkm:g}']]) + '\n')
+    # Profiles
+    profile_paths = (get_value(argv, '--profile_paths') or '').split(',')
+    profile_formats = (get_value(argv, '--profile_formats') or '').split(',')
+    for path, fmt in zip(profile_paths, profile_formats):
+        if len(path) == 0:
+            continue
+        if fmt.startswith('binary'):
+            data = b''.join([struct.pack('<d', 0.) * size for name, size in features])
+            if fmt == 'binary+zstd':
+                data = zstd_encode(data)
+            elif fmt != 'binary':
+                raise ValueError(f'Unsupported profile format {fmt}')
+            write_file(path, data)
+        elif fmt == 'bedgraph':
+            write_file(path, ''.join([f'{name}\t0\t{size}\t{num_input / max(size, 1):g}\n' for name, size in features]).encode())
+        elif fmt == 'csv':
+            write_file(path, ''.join([f'{name},{num_input / max(size, 1):g}\n' for name, size in features]).encode())
+        else:
+            raise ValueError(f'Unsupported profile format {fmt}')
+    if get_value(argv, '--path_sam_out') is not None:
+        write_file(get_value(argv, '--path_sam_out'), sam)
+    if path_report is not None:
+        json.dump({'input': num_input, 'output': num_input}, open(path_report, 'wt'), sort_keys=True, indent=4, separators=(',', ': '))
+    log_call('geneabacus', start, num_thread, num_input, path_report or path_dir)
+    return 0
+
+def run_samtools(argv):
+    if len(argv) == 0 or argv[0] in ['version', '--version']:
+        print('samtools 1.17\nUsing htslib 1.17')
+        return 0
+    start = time.time()
+    profile = get_profile('samtools')
+    command = argv[0]
+    num_thread = get_num_thread(get_value(argv, '-@'))
+    path_input = argv[-1]
+    if command == 'index':
+        spend(profile, os.path.dirname(os.path.abspath(path_input)), num_thread)
+        open(path_input + '.bai', 'wb').close()
+        path_output = path_input + '.bai'
+        num_read = 0
+    elif command == 'stats':
+        data = read_file(path_input) if path_input != '-' else sys.stdin.buffer.read()
+        num_read = count_sam_reads(data)
+        spend(profile, '.', num_thread, num_read)
+        print(f'SN\traw total sequences:\t{num_read}')
+        path_output = '.'
+    else:
+        # view, sort, fixmate, markdup...: Alignments are copied
+        path_output = get_value(argv, '-o', argv[-1] if len(argv) > 2 and not argv[-2].startswith('-') else None)
+        if path_output == path_input:
+            path_input = argv[-2]
+        data = read_file(path_input)
+        num_read = count_sam_reads(data)
+        spend(profile, os.path.dirname(os.path.abspath(path_output)), num_thread, num_read)
+        write_file(path_output, data)
+    log_call('samtools', start, num_thread, num_read, path_output)
+    return 0
+
+def run_bg2bw(argv):
+    if len(argv) == 0:
+        print('bg2bw 1.6.0')
+        return 0
+    start = time.time()
+    profile = get_profile('bg2bw')
+    path_output = get_value(argv, '--outfile')
+    data = read_file(get_value(argv, '--input'))
+    spend(profile, os.path.dirname(os.path.abspath(path_output)))
+    # bigWig magic followed by bedGraph
+    write_file(path_output, struct.pack('<I', 0x888FFC26) + data)
+    log_call('bg2bw', start, 1, 0, path_output)
+    return 0
+
+def run_zstd(argv, decompress=False, to_stdout=False):
+    if '--version' in argv or '-V' in argv:
+        print('*** Zstandard CLI (64-bit) v1.5.5 (stub) ***')
+        return 0
+    start = time.time()
+    profile = get_profile('zstd')
+    num_thread = 1
+    paths = []
+    path_output = None
+    remove = False
+    it = iter(argv)
+    for a in it:
+        if a in ['-d', '--decompress']:
+            decompress = True
+        elif a in ['-c', '--stdout']:
+            to_stdout = True
+        elif a in ['-dc', '-cd']:
+            decompress, to_stdout = True, True
+        elif a == '--rm':
+            remove = True
+        elif a == '-o':
+            path_output = next(it)
+        elif a.startswith('-T'):
+            num_thread = get_num_thread(a[2:])
+        elif a == '-' or not a.startswith('-'):
+            paths.append(a)
+    if len(paths) == 0:
+        paths = ['-']
+    if paths == ['-'] and path_output is None:
+        to_stdout = True
+    for path in paths:
+        if path == '-':
+            data = sys.stdin.buffer.read()
+        else:
+            with open(path, 'rb') as f:
+                data = f.read()
+        if decompress:
+            data = zstd_decode(data)
+        else:
+            data = zstd_encode(data)
+        if to_stdout:
+            sys.stdout.buffer.write(data)
+            sys.stdout.buffer.flush()
+        else:
+            if path_output is not None:
+                path_out = path_output
+            elif decompress:
+                path_out = path[:-4] if path.endswith('.zst') else path + '.out'
+            else:
+                path_out = path + '.zst'
+            write_file(path_out, data)
+            if remove and path != '-':
+                os.remove(path)
+    if path_output is None:
+        path_output = '.' if paths[0] == '-' else paths[0]
+    spend(profile, os.path.dirname(os.path.abspath(path_output)), num_thread)
+    log_call('zstd', start, num_thread, 0, path_output)
+    return 0
+
+def install(path_bin):
+    """Create stub executables in path_bin (symlinks to this file)."""
+    os.makedirs(path_bin, exist_ok=True)
+    for tool in tools:
+        path = os.path.join(path_bin, tool)
+        if os.path.lexists(path):
+            os.remove(path)
+        os.symlink(os.path.abspath(__file__), path)
+    return path_bin
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    tool = os.path.basename(argv[0])
+    if tool == 'STAR':
+        return run_star(argv[1:])
+    elif tool == 'bowtie2':
+        return run_bowtie2(argv[1:])
+    elif tool == 'readknead':
+        return run_readknead(argv[1:])
+    elif tool == 'geneabacus':
+        return run_geneabacus(argv[1:])
+    elif tool == 'samtools':
+        return run_samtools(argv[1:])
+    elif tool == 'bg2bw':
+        return run_bg2bw(argv[1:])
+    elif tool == 'zstd':
+        return run_zstd(argv[1:])
+    elif tool == 'zstdcat':
+        return run_zstd(argv[1:], decompress=True, to_stdout=True)
+    elif len(argv) == 3 and argv[1] == 'install':
+        install(argv[2])
+        return 0
+    else:
+        print(f'Usage: {tool} install PATH_BIN (or run as {", ".join(tools)})', file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
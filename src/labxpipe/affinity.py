@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Placement of concurrent runs on disjoint CPU sets, within a NUMA node when possible."""
+
+import os
+
+path_nodes = '/sys/devices/system/node'
+
+def parse_cpulist(cpulist):
+    """CPUs of Linux cpulist (i.e. "0-3,8,10-11")."""
+    cpus = []
+    for r in cpulist.strip().split(','):
+        if r == '':
+            continue
+        if '-' in r:
+            start, end = r.split('-')
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(r))
+    return cpus
+
+def format_cpulist(cpus):
+    ranges = []
+    for c in sorted(cpus):
+        if len(ranges) > 0 and ranges[-1][1] == c - 1:
+            ranges[-1][1] = c
+        else:
+            ranges.append([c, c])
+    return ','.join([f'{s}-{e}' if s != e else str(s) for s, e in ranges])
+
+def get_nodes(path=path_nodes):
+    """Available CPUs per NUMA node. Without NUMA information, all available CPUs are in node 0."""
+    available = os.sched_getaffinity(0)
+    nodes = {}
+    if os.path.isdir(path):
+        for d in sorted(os.listdir(path)):
+            if d.startswith('node') and d[4:].isdigit():
+                with open(os.path.join(path, d, 'cpulist')) as f:
+                    cpus = [c for c in parse_cpulist(f.read()) if c in available]
+                if len(cpus) > 0:
+                    nodes[int(d[4:])] = cpus
+    if len(nodes) == 0:
+        nodes[0] = sorted(available)
+    return nodes
+
+def get_cpu_sets(num_set, num_processor, nodes=None):
+    """Disjoint sets of num_processor CPUs. Each set is taken from the node with most free CPUs, and spans nodes only if
+    no node has enough free CPUs. Returns None if there are fewer CPUs than num_set x num_processor."""
+    if nodes is None:
+        nodes = get_nodes()
+    free = {n: list(cpus) for n, cpus in nodes.items()}
+    if sum([len(cpus) for cpus in free.values()]) < num_set * num_processor:
+        return None
+    cpu_sets = []
+    for i in range(num_set):
+        cpu_set = []
+        while len(cpu_set) < num_processor:
+            node = max(free, key=lambda n: (len(free[n]) >= num_processor - len(cpu_set), len(free[n])))
+            n = num_processor - len(cpu_set)
+            cpu_set.extend(free[node][:n])
+            free[node] = free[node][n:]
+        cpu_sets.append(sorted(cpu_set))
+    return cpu_sets
+
+def set_affinity(cpus, pid=0):
+    """Restrict process (and its future threads and children) to cpus. Memory is allocated on the node of the CPU
+    that first touches it, so runs placed within a node also keep their memory local."""
+    os.sched_setaffinity(pid, cpus)
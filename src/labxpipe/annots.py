@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Compact tables of FONtools annotations (fon1 or legacy fon2 JSON) through a cache."""
+
+import glob
+import hashlib
+import json
+import os
+import shutil
+import urllib.parse
+
+import numpy as np
+import pandas as pd
+import zstandard as zstd
+
+from . import utils
+from .counts import save_array
+
+def get_path_cached(path, path_cache):
+    st = os.stat(path)
+    key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+    return os.path.join(path_cache, 'annots', f'{key}_{st.st_size}_{st.st_mtime_ns}')
+
+def get_fname_table(columns):
+    return urllib.parse.quote(','.join(columns), safe='') + '.npy'
+
+def read_fon(path):
+    if path.endswith('.zst'):
+        return json.load(zstd.open(path, 'rt'))
+    else:
+        return json.load(open(path, 'rt'))
+
+def read_table(path, columns):
+    """Unique rows of annotation columns (in order of first occurrence) as structured array of fixed-width strings."""
+    annots = read_fon(path)
+    if 'features' in annots:
+        rows = [[a.get(c) for c in columns] for a in annots['features']]
+    else:
+        icolumns = [annots['columns'].index(c) for c in columns]
+        rows = [[a[i] for i in icolumns] for a in annots['annotations']]
+    df = pd.DataFrame(rows, columns=columns).drop_duplicates()
+    arrays = [df[c].fillna('').to_numpy(dtype=str) for c in columns]
+    table = np.empty(len(df), dtype=[(c, a.dtype) for c, a in zip(columns, arrays)])
+    for c, a in zip(columns, arrays):
+        table[c] = a
+    return table
+
+def load_table(path, columns, path_cache=None):
+    """Unique rows of annotation columns, memory-mapped from cache (created if missing or annotation modified)."""
+    if path_cache is None:
+        path_cache = utils.get_path_cache()
+    path_cached = get_path_cached(path, path_cache)
+    path_table = os.path.join(path_cached, get_fname_table(columns))
+    if not os.path.exists(path_table):
+        table = read_table(path, columns)
+        os.makedirs(path_cached, exist_ok=True)
+        save_array(path_table, table)
+        prefix = os.path.basename(path_cached).split('_')[0]
+        for p in glob.glob(os.path.join(os.path.dirname(path_cached), prefix + '_*')):
+            if p != path_cached:
+                shutil.rmtree(p, ignore_errors=True)
+    return np.load(path_table, mmap_mode='r')
@@ -0,0 +1,519 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Write bigWig files from bedGraph or profiles."""
+
+import collections
+import concurrent.futures
+import copy
+import errno
+import math
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+import zlib
+
+import numpy as np
+
+from . import compression
+from .interfaces import if_exe_bg2bw
+
+# GeneAbacus binary profiles: One value per position, features (chromosomes) in order of features file
+profile_dtype = np.dtype('<f8')
+
+bigwig_magic = 0x888FFC26
+bpt_magic = 0x78CA8C91
+cir_magic = 0x2468ACE0
+bigwig_version = 4
+header_size = 64
+zoom_header_size = 24
+summary_size = 40
+max_zoom_levels = 10
+zoom_increment = 4
+min_zoom_reduction = 10
+
+item_dtype = np.dtype([('start', '<u4'), ('end', '<u4'), ('value', '<f4')])
+summary_dtype = np.dtype([('chrom_id', '<u4'), ('start', '<u4'), ('end', '<u4'), ('valid_count', '<u4'), ('min', '<f4'), ('max', '<f4'), ('sum', '<f4'), ('sum_squares', '<f4')])
+
+def read_genome(path_genome):
+    """Chromosome names and sizes in file order."""
+    chrom_sizes = []
+    with open(path_genome, 'rt') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) > 1 and not line.startswith('#'):
+                chrom_sizes.append((fields[0], int(fields[1])))
+    return chrom_sizes
+
+def read_bedgraph(f):
+    """Intervals per chromosome (chromosomes must be grouped) from a bedGraph stream."""
+    chrom = None
+    fields = []
+    for line in f:
+        if line.startswith('track') or line.startswith('browser') or line.startswith('#'):
+            continue
+        cols = line.split()
+        if len(cols) < 4:
+            continue
+        if cols[0] != chrom:
+            if chrom is not None:
+                yield chrom, *fields_to_intervals(fields)
+            chrom = cols[0]
+            fields = []
+        fields.append(cols[1:4])
+    if chrom is not None:
+        yield chrom, *fields_to_intervals(fields)
+
+def fields_to_intervals(fields):
+    a = np.array(fields)
+    return a[:, 0].astype(np.int64), a[:, 1].astype(np.int64), a[:, 2].astype(np.float64)
+
+def read_profiles(path, chrom_sizes, num_decompress_processor=None):
+    """Values per chromosome from a binary profile (compressed or not)."""
+    cmd = compression.get_decompress_cmd(path, num_decompress_processor)
+    if cmd is None:
+        p = None
+        f = open(path, 'rb')
+    else:
+        p = subprocess.Popen(cmd + [path], stdout=subprocess.PIPE)
+        f = p.stdout
+    try:
+        for chrom, size in chrom_sizes:
+            values = np.empty(size, dtype=profile_dtype)
+            buf = memoryview(values.view(np.uint8))
+            pos = 0
+            while pos < len(buf):
+                n = f.readinto(buf[pos:])
+                if n == 0:
+                    raise ValueError(f'Profile {path} shorter than genome ({chrom})')
+                pos += n
+            yield chrom, values
+    finally:
+        f.close()
+        if p is not None:
+            p.wait()
+
+def profile_to_intervals(values):
+    """Runs of equal non-zero values."""
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, np.float64)
+    changes = np.flatnonzero(values[1:] != values[:-1]) + 1
+    starts = np.concatenate([[0], changes])
+    ends = np.concatenate([changes, [len(values)]])
+    run_values = values[starts]
+    keep = run_values != 0
+    return starts[keep], ends[keep], run_values[keep]
+
+def write_bedgraph(f, chrom, values):
+    """Write profile of chrom as bedGraph intervals. Returns number of intervals."""
+    starts, ends, run_values = profile_to_intervals(values)
+    for start, end, value in zip(starts.tolist(), ends.tolist(), run_values.tolist()):
+        f.write(f'{chrom}\t{start}\t{end}\t{value:.8g}\n')
+    return len(starts)
+
+def summarize(starts, ends, values, reduction):
+    """Zoom summary of intervals in bins of reduction bases."""
+    first = starts // reduction
+    nbins = (ends - 1) // reduction - first + 1
+    # Split intervals at bin boundaries
+    idx = np.repeat(np.arange(len(starts)), nbins)
+    bins = first[idx] + np.arange(len(idx)) - np.repeat(np.cumsum(nbins) - nbins, nbins)
+    s = np.maximum(starts[idx], bins * reduction)
+    e = np.minimum(ends[idx], (bins + 1) * reduction)
+    v = values[idx]
+    w = e - s
+    gs = np.concatenate([[0], np.flatnonzero(bins[1:] != bins[:-1]) + 1])
+    ge = np.concatenate([gs[1:], [len(bins)]])
+    return {'start': s[gs],
+            'end': e[ge - 1],
+            'valid_count': np.add.reduceat(w, gs),
+            'min': np.minimum.reduceat(v, gs),
+            'max': np.maximum.reduceat(v, gs),
+            'sum': np.add.reduceat(v * w, gs),
+            'sum_squares': np.add.reduceat(v * v * w, gs)}
+
+def merge_summaries(summary, reduction):
+    """Zoom summary from a finer summary (reduction must be a multiple of the finer reduction)."""
+    bins = summary['start'] // reduction
+    gs = np.concatenate([[0], np.flatnonzero(bins[1:] != bins[:-1]) + 1])
+    ge = np.concatenate([gs[1:], [len(bins)]])
+    return {'start': summary['start'][gs],
+            'end': summary['end'][ge - 1],
+            'valid_count': np.add.reduceat(summary['valid_count'], gs),
+            'min': np.minimum.reduceat(summary['min'], gs),
+            'max': np.maximum.reduceat(summary['max'], gs),
+            'sum': np.add.reduceat(summary['sum'], gs),
+            'sum_squares': np.add.reduceat(summary['sum_squares'], gs)}
+
+def to_records(chrom_id, summary):
+    records = np.empty(len(summary['start']), dtype=summary_dtype)
+    records['chrom_id'] = chrom_id
+    for k in summary:
+        records[k] = summary[k]
+    return records
+
+def pack_sections(chrom_id, records, starts, ends, items_per_slot, data_header=False):
+    """Compressed blocks of items_per_slot records."""
+    sections = []
+    for i in range(0, len(records), items_per_slot):
+        block = records[i:i + items_per_slot]
+        buf = block.tobytes()
+        if data_header:
+            # bedGraph section
+            buf = struct.pack('<IIIIIBBH', chrom_id, int(starts[i]), int(ends[i + len(block) - 1]), 0, 0, 1, 0, len(block)) + buf
+        sections.append((chrom_id, int(starts[i]), int(ends[i + len(block) - 1]), zlib.compress(buf), len(buf)))
+    return sections
+
+def process_chrom(chrom_id, starts, ends, values, reductions, items_per_slot):
+    """Data sections, zoom summaries and statistics of a chromosome."""
+    items = np.empty(len(starts), dtype=item_dtype)
+    items['start'] = starts
+    items['end'] = ends
+    items['value'] = values
+    spans = ends - starts
+    result = {'sections': pack_sections(chrom_id, items, starts, ends, items_per_slot, data_header=True),
+              'item_count': len(items),
+              'valid_count': int(spans.sum()),
+              'min': float(values.min()),
+              'max': float(values.max()),
+              'sum': float((values * spans).sum()),
+              'sum_squares': float((values * values * spans).sum()),
+              'zooms': []}
+    summary = None
+    for reduction in reductions:
+        if summary is None:
+            summary = summarize(starts, ends, values, reduction)
+        else:
+            summary = merge_summaries(summary, reduction)
+        result['zooms'].append(to_records(chrom_id, summary))
+    return result
+
+def count_levels(block_size, item_count):
+    levels = 1
+    while item_count > block_size:
+        item_count = (item_count + block_size - 1) // block_size
+        levels += 1
+    return levels
+
+def write_bpt(f, chroms, block_size=256):
+    """Chromosome B+ tree. chroms: List of (name, id, size) sorted by name."""
+    keys = [c[0].encode() for c in chroms]
+    key_size = max([len(k) for k in keys] + [1])
+    block_size = max(1, min(block_size, len(chroms)))
+    n = len(chroms)
+    f.write(struct.pack('<IIIIQQ', bpt_magic, block_size, key_size, 8, n, 0))
+    node_size = 4 + block_size * (key_size + 8)
+    levels = count_levels(block_size, n)
+    offset = f.tell()
+    # Index levels
+    for level in range(levels - 1, 0, -1):
+        slot_size = block_size ** level
+        node_items = slot_size * block_size
+        node_count = (n + node_items - 1) // node_items
+        next_child = offset + node_count * node_size
+        for i in range(0, n, node_items):
+            count = min(block_size, (n - i + slot_size - 1) // slot_size)
+            buf = [struct.pack('<BBH', 0, 0, count)]
+            for j in range(count):
+                buf.append(keys[i + j * slot_size].ljust(key_size, b'\0') + struct.pack('<Q', next_child))
+                next_child += node_size
+            buf.append(b'\0' * ((block_size - count) * (key_size + 8)))
+            f.write(b''.join(buf))
+        offset += node_count * node_size
+    # Leaf level
+    for i in range(0, max(n, 1), block_size):
+        count = min(block_size, n - i)
+        buf = [struct.pack('<BBH', 1, 0, count)]
+        for j in range(i, i + count):
+            buf.append(keys[j].ljust(key_size, b'\0') + struct.pack('<II', chroms[j][1], chroms[j][2]))
+        buf.append(b'\0' * ((block_size - count) * (key_size + 8)))
+        f.write(b''.join(buf))
+
+def write_cir_tree(f, items, block_size=256):
+    """R-tree index of blocks. items: List of (chrom_id, start, end, offset, size) sorted by chrom_id and start."""
+    n = len(items)
+    end_file_offset = f.tell()
+    if n > 0:
+        last = max([(it[0], it[2]) for it in items])
+        f.write(struct.pack('<IIQIIIIQII', cir_magic, block_size, n, items[0][0], items[0][1], last[0], last[1], end_file_offset, 1, 0))
+    else:
+        f.write(struct.pack('<IIQIIIIQII', cir_magic, block_size, 0, 0, 0, 0, 0, end_file_offset, 1, 0))
+    index_node_size = 4 + block_size * 24
+    leaf_node_size = 4 + block_size * 32
+    levels = count_levels(block_size, n)
+    offset = f.tell()
+    # Index levels
+    for level in range(levels - 1, 0, -1):
+        slot_size = block_size ** level
+        node_items = slot_size * block_size
+        node_count = (n + node_items - 1) // node_items
+        next_child = offset + node_count * index_node_size
+        for i in range(0, n, node_items):
+            count = min(block_size, (n - i + slot_size - 1) // slot_size)
+            buf = [struct.pack('<BBH', 0, 0, count)]
+            for j in range(count):
+                lo = i + j * slot_size
+                hi = min(n, lo + slot_size)
+                end = max([(it[0], it[2]) for it in items[lo:hi]])
+                buf.append(struct.pack('<IIIIQ', items[lo][0], items[lo][1], end[0], end[1], next_child))
+                if level == 1:
+                    next_child += leaf_node_size
+                else:
+                    next_child += index_node_size
+            buf.append(b'\0' * ((block_size - count) * 24))
+            f.write(b''.join(buf))
+        offset += node_count * index_node_size
+    # Leaf level
+    for i in range(0, max(n, 1), block_size):
+        count = min(block_size, n - i)
+        buf = [struct.pack('<BBH', 1, 0, count)]
+        for chrom_id, start, end, data_offset, data_size in items[i:i + count]:
+            buf.append(struct.pack('<IIIIQQ', chrom_id, start, chrom_id, end, data_offset, data_size))
+        buf.append(b'\0' * ((block_size - count) * 32))
+        f.write(b''.join(buf))
+
+class Writer:
+    """bigWig writer. Intervals are added per chromosome (in any chromosome order) and processed in parallel."""
+
+    def __init__(self, path, chrom_sizes, items_per_slot=1024, block_size=256, num_processor=1):
+        self.f = open(path, 'wb')
+        self.chrom_sizes = dict(chrom_sizes)
+        self.chrom_ids = {c: i for i, c in enumerate(sorted(self.chrom_sizes))}
+        self.items_per_slot = items_per_slot
+        self.block_size = block_size
+        self.num_processor = num_processor
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=num_processor)
+        self.pending = collections.deque()
+        self.added = set()
+        self.reductions = None
+        self.index = []
+        self.zooms = []
+        self.uncompress_buf_size = 0
+        self.item_count = 0
+        self.total = {'valid_count': 0, 'min': math.inf, 'max': -math.inf, 'sum': 0., 'sum_squares': 0.}
+        # Header, zoom headers and total summary are written on close
+        self.f.write(b'\0' * (header_size + max_zoom_levels * zoom_header_size + summary_size))
+        self.full_data_offset = self.f.tell()
+        self.f.write(struct.pack('<Q', 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.executor.shutdown(cancel_futures=True)
+            self.f.close()
+
+    def add(self, chrom, starts, ends, values):
+        if chrom not in self.chrom_ids:
+            raise ValueError(f'Chromosome {chrom} not found in chromosome sizes')
+        if chrom in self.added:
+            raise ValueError(f'Chromosome {chrom} added twice (input must be grouped by chromosome)')
+        self.added.add(chrom)
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        if len(starts) == 0:
+            return
+        if np.any(ends <= starts) or np.any(starts[1:] < ends[:-1]) or ends[-1] > self.chrom_sizes[chrom]:
+            raise ValueError(f'Intervals of {chrom} must be sorted, non-overlapping and within chromosome')
+        # Zoom levels set from first chromosome average span
+        if self.reductions is None:
+            reduction = max(min_zoom_reduction, int((ends - starts).mean()))
+            self.reductions = [reduction * zoom_increment ** i for i in range(max_zoom_levels)]
+        self.pending.append(self.executor.submit(process_chrom, self.chrom_ids[chrom], starts, ends, values, self.reductions, self.items_per_slot))
+        self.write_done(self.num_processor)
+
+    def add_profile(self, chrom, values):
+        self.add(chrom, *profile_to_intervals(values))
+
+    def write_done(self, max_pending=0):
+        while len(self.pending) > max_pending:
+            result = self.pending.popleft().result()
+            for chrom_id, start, end, data, size in result['sections']:
+                self.index.append((chrom_id, start, end, self.f.tell(), len(data)))
+                self.uncompress_buf_size = max(self.uncompress_buf_size, size)
+                self.f.write(data)
+            self.item_count += result['item_count']
+            self.total['valid_count'] += result['valid_count']
+            self.total['min'] = min(self.total['min'], result['min'])
+            self.total['max'] = max(self.total['max'], result['max'])
+            self.total['sum'] += result['sum']
+            self.total['sum_squares'] += result['sum_squares']
+            self.zooms.append(result['zooms'])
+
+    def write_zoom(self, records):
+        """Write zoom data and its index. Returns data and index offsets."""
+        data_offset = self.f.tell()
+        self.f.write(struct.pack('<I', len(records)))
+        # Compress in parallel (blocks don't span chromosomes)
+        jobs = []
+        chrom_starts = np.concatenate([[0], np.flatnonzero(records['chrom_id'][1:] != records['chrom_id'][:-1]) + 1, [len(records)]])
+        for i, j in zip(chrom_starts[:-1], chrom_starts[1:]):
+            block = records[i:j]
+            jobs.append(self.executor.submit(pack_sections, int(block['chrom_id'][0]), block, block['start'], block['end'], self.items_per_slot))
+        index = []
+        for job in jobs:
+            for chrom_id, start, end, data, size in job.result():
+                index.append((chrom_id, start, end, self.f.tell(), len(data)))
+                self.uncompress_buf_size = max(self.uncompress_buf_size, size)
+                self.f.write(data)
+        index_offset = self.f.tell()
+        write_cir_tree(self.f, index, self.block_size)
+        return data_offset, index_offset
+
+    def close(self):
+        self.write_done()
+        # Full data
+        self.index.sort()
+        full_index_offset = self.f.tell()
+        write_cir_tree(self.f, self.index, self.block_size)
+        # Zoom levels: From first level at least twice smaller than data, while decreasing
+        zoom_headers = []
+        if len(self.zooms) > 0:
+            previous_count = self.item_count
+            for ilevel, reduction in enumerate(self.reductions):
+                records = np.concatenate([z[ilevel] for z in self.zooms])
+                if len(zoom_headers) == 0 and len(records) * 2 > self.item_count:
+                    continue
+                if len(zoom_headers) > 0 and len(records) >= previous_count:
+                    break
+                records = records[np.lexsort((records['start'], records['chrom_id']))]
+                data_offset, index_offset = self.write_zoom(records)
+                zoom_headers.append((reduction, data_offset, index_offset))
+                previous_count = len(records)
+        # Chromosome tree
+        chrom_tree_offset = self.f.tell()
+        write_bpt(self.f, [(c, i, self.chrom_sizes[c]) for c, i in sorted(self.chrom_ids.items())], self.block_size)
+        # Header
+        self.f.seek(0)
+        total_summary_offset = header_size + max_zoom_levels * zoom_header_size
+        self.f.write(struct.pack('<IHHQQQHHQQIQ', bigwig_magic, bigwig_version, len(zoom_headers), chrom_tree_offset, self.full_data_offset, full_index_offset, 0, 0, 0, total_summary_offset, self.uncompress_buf_size, 0))
+        for reduction, data_offset, index_offset in zoom_headers:
+            self.f.write(struct.pack('<IIQQ', reduction, 0, data_offset, index_offset))
+        self.f.seek(total_summary_offset)
+        if self.total['valid_count'] > 0:
+            self.f.write(struct.pack('<Qdddd', self.total['valid_count'], self.total['min'], self.total['max'], self.total['sum'], self.total['sum_squares']))
+        else:
+            self.f.write(struct.pack('<Qdddd', 0, 0., 0., 0., 0.))
+        self.f.seek(self.full_data_offset)
+        self.f.write(struct.pack('<Q', len(self.index)))
+        self.f.close()
+        self.executor.shutdown()
+
+def bedgraph_to_bigwig(path_bedgraph, path_genome, path_bigwig, num_processor=1):
+    """Convert a bedGraph (path or text stream) to bigWig. Returns number of chromosomes with data."""
+    with Writer(path_bigwig, read_genome(path_genome), num_processor=num_processor) as writer:
+        if isinstance(path_bedgraph, str):
+            with open(path_bedgraph, 'rt') as f:
+                for chrom, starts, ends, values in read_bedgraph(f):
+                    writer.add(chrom, starts, ends, values)
+        else:
+            for chrom, starts, ends, values in read_bedgraph(path_bedgraph):
+                writer.add(chrom, starts, ends, values)
+        return len(writer.added)
+
+def tee_lines(f, fout):
+    for line in f:
+        fout.write(line)
+        yield line
+
+def convert_stream(path_fifo, path_bedgraph, path_genome, path_bigwig, keep_bedgraph, remove_empty, errors):
+    try:
+        with open(path_fifo, 'rt') as f:
+            try:
+                if keep_bedgraph:
+                    with open(path_bedgraph, 'wt') as fout:
+                        nchrom = bedgraph_to_bigwig(tee_lines(f, fout), path_genome, path_bigwig)
+                else:
+                    nchrom = bedgraph_to_bigwig(f, path_genome, path_bigwig)
+                if nchrom == 0 and remove_empty:
+                    os.remove(path_bigwig)
+            except Exception:
+                # Drain to not block the writer
+                for line in f:
+                    pass
+                raise
+    except Exception as e:
+        errors.append(e)
+
+def run_streamed(fn, kwargs, conversions, keep_bedgraph=True, remove_empty=False, logger=None):
+    """Run fn writing bedGraph profile(s) (kwargs['profile_paths']) to FIFOs converted to bigWig while written.
+
+    conversions: List of (path_bedgraph, path_genome, path_bigwig)."""
+    if logger is None:
+        import logging as logger
+    if len(conversions) == 0:
+        return fn(**kwargs)
+    kwargs = copy.copy(kwargs)
+    kwargs['profile_paths'] = list(kwargs['profile_paths'])
+    path_fifos = tempfile.mkdtemp(prefix='bigwig_', dir=os.path.dirname(os.path.abspath(conversions[0][2])))
+    threads = []
+    fifos = []
+    errors = []
+    try:
+        for i, (path_bedgraph, path_genome, path_bigwig) in enumerate(conversions):
+            path_fifo = os.path.join(path_fifos, f'{i}_' + os.path.basename(path_bedgraph))
+            os.mkfifo(path_fifo)
+            fifos.append(path_fifo)
+            kwargs['profile_paths'][kwargs['profile_paths'].index(path_bedgraph)] = path_fifo
+            logger.info(f'Converting {path_bedgraph} to {path_bigwig} while written')
+            t = threading.Thread(target=convert_stream, args=(path_fifo, path_bedgraph, path_genome, path_bigwig, keep_bedgraph, remove_empty, errors))
+            t.start()
+            threads.append(t)
+        result = fn(**kwargs)
+    finally:
+        # Unblock converters if FIFO wasn't opened by fn
+        for path_fifo, t in zip(fifos, threads):
+            while t.is_alive():
+                try:
+                    os.close(os.open(path_fifo, os.O_WRONLY | os.O_NONBLOCK))
+                except OSError as e:
+                    if e.errno != errno.ENXIO:
+                        raise
+                t.join(0.05)
+        shutil.rmtree(path_fifos, ignore_errors=True)
+    if len(errors) > 0:
+        raise errors[0]
+    return result
+
+def profile_to_bigwig(path_profile, path_features, path_bigwig, num_processor=1, num_decompress_processor=None):
+    """Convert a binary profile of chromosomes (features from tabulated path_features) to bigWig."""
+    chrom_sizes = read_genome(path_features)
+    with Writer(path_bigwig, chrom_sizes, num_processor=num_processor) as writer:
+        for chrom, values in read_profiles(path_profile, chrom_sizes, num_decompress_processor):
+            writer.add_profile(chrom, values)
+
+def get_writer(writer=None):
+    """Writer to use: 'native' or 'bg2bw' ('auto' or None uses bg2bw if available)."""
+    if writer is None or writer == 'auto':
+        if compression.which('bg2bw') is None:
+            return 'native'
+        else:
+            return 'bg2bw'
+    elif writer in ['native', 'bg2bw']:
+        return writer
+    else:
+        raise ValueError(f'Unknown bigWig writer {writer}')
+
+def convert_bedgraph(path_input, path_chrom_list, path_outfile, writer=None, num_processor=1, logger=None):
+    if logger is None:
+        import logging as logger
+    if get_writer(writer) == 'native':
+        logger.info(f'Converting {path_input} to {path_outfile}')
+        bedgraph_to_bigwig(path_input, path_chrom_list, path_outfile, num_processor)
+    else:
+        if_exe_bg2bw.bg2bw(path_input, path_outfile, path_chrom_list, logger=logger)
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Compression formats and the commands to (de)compress them."""
+
+import concurrent.futures
+import fnmatch
+import functools
+import os
+import shutil
+import stat
+import subprocess
+
+# Commands are listed by preference: the first available executable is used.
+# Thread option is formatted with the number of thread(s) when defined.
+codecs = {
+    'zstd': {
+        'magic': b'\x28\xb5\x2f\xfd',
+        'exts': ['.zst'],
+        'decompress': [(['zstd', '-dc'], ['-T{}']), (['zstdcat'], None)],
+        'compress': [(['zstd'], ['-T{}'])],
+        'level': '-{}',
+        'keep': ['--keep'],
+        'rm': ['--rm'],
+    },
+    'gzip': {
+        'magic': b'\x1f\x8b',
+        'exts': ['.gz'],
+        'decompress': [(['pigz', '-dc'], ['-p', '{}']), (['zcat'], None)],
+        'compress': [(['pigz'], ['-p', '{}']), (['gzip'], None)],
+        'level': '-{}',
+        'keep': ['-k'],
+        'rm': [],
+    },
+    'lz4': {
+        'magic': b'\x04\x22\x4d\x18',
+        'exts': ['.lz4'],
+        'decompress': [(['lz4', '-dc'], None), (['lz4cat'], None)],
+        'compress': [(['lz4'], None)],
+        'level': '-{}',
+        'keep': [],
+        'rm': ['--rm'],
+    },
+    'bzip2': {
+        'magic': b'BZh',
+        'exts': ['.bz2'],
+        'decompress': [(['pbzip2', '-dc'], ['-p{}']), (['bzcat'], None)],
+        'compress': [(['pbzip2'], ['-p{}']), (['bzip2'], None)],
+        'level': '-{}',
+        'keep': ['-k'],
+        'rm': [],
+    },
+    'xz': {
+        'magic': b'\xfd7zXZ\x00',
+        'exts': ['.xz'],
+        'decompress': [(['xz', '-dc'], ['-T{}']), (['xzcat'], None)],
+        'compress': [(['xz'], ['-T{}'])],
+        'level': '-{}',
+        'keep': ['-k'],
+        'rm': [],
+    },
+}
+
+# Compression policy: classes of output mapped to codec and level.
+# Intermediates are short-lived and favor (de)compression speed; archived outputs favor compression ratio.
+default_classes = {
+    'intermediate': {'codec': 'lz4', 'level': 1},
+    'archive': {'codec': 'zstd', 'level': 19},
+}
+
+# Commands compressing stdin (comma separated for ReadKnead fq_command_out) and their thread option
+pipe_commands = {'gzip': ['gzip', '-'], 'lz4': ['lz4', '-'], 'zstd': ['zstd', '-', '-o']}
+pipe_thread_opts = {'zstd': ['-T{}']}
+
+max_magic_length = max([len(c['magic']) for c in codecs.values()])
+
+@functools.lru_cache(maxsize=None)
+def which(exe):
+    return shutil.which(exe)
+
+def get_format_from_ext(path):
+    for fmt, codec in codecs.items():
+        if any([path.endswith(e) for e in codec['exts']]):
+            return fmt
+
+def get_format(path):
+    """Detect compression format using magic bytes. Suffix is used if path isn't a regular file (i.e. FIFO or not yet created)."""
+    try:
+        if stat.S_ISREG(os.stat(path).st_mode):
+            with open(path, 'rb') as f:
+                head = f.read(max_magic_length)
+            for fmt, codec in codecs.items():
+                if head.startswith(codec['magic']):
+                    return fmt
+            return None
+    except OSError:
+        pass
+    return get_format_from_ext(path)
+
+def get_ext(fmt):
+    return codecs[fmt]['exts'][0]
+
+def strip_ext(path):
+    fmt = get_format_from_ext(path)
+    if fmt is None:
+        return path
+    for e in codecs[fmt]['exts']:
+        if path.endswith(e):
+            return path[:-len(e)]
+
+def get_command(fmt, action, num_processor=None):
+    for exes, thread_opts in codecs[fmt][action]:
+        if which(exes[0]) is not None:
+            cmd = list(exes)
+            if num_processor is not None and thread_opts is not None:
+                cmd.extend([o.format(num_processor) for o in thread_opts])
+            return cmd
+    # Fallback to last command (error will be reported when executed)
+    return list(codecs[fmt][action][-1][0])
+
+def get_decompress_cmd(path, num_processor=None, fmt=None):
+    """Command writing decompressed content of path to stdout. Returns None if path isn't compressed."""
+    if fmt is None:
+        fmt = get_format(path)
+    if fmt is None:
+        return None
+    return get_command(fmt, 'decompress', num_processor)
+
+def get_compress_cmd(fmt, level=None, num_processor=None, keep=None):
+    """Command compressing file(s) given as argument(s). If keep is None, input is neither kept or removed explicitly (i.e. for use in pipe)."""
+    codec = codecs[fmt]
+    cmd = get_command(fmt, 'compress', num_processor)
+    if keep is True:
+        cmd.extend(codec['keep'])
+    elif keep is False:
+        cmd.extend(codec['rm'])
+    if level is not None:
+        cmd.append(codec['level'].format(level))
+    return cmd
+
+def find_path(path):
+    """Path to file, compressed with any codec or uncompressed, if path isn't found."""
+    if os.path.exists(path):
+        return path
+    path_base = strip_ext(path)
+    for p in [path_base] + [path_base + e for c in codecs.values() for e in c['exts']]:
+        if os.path.exists(p):
+            return p
+    return path
+
+def match_pattern(fname, pattern):
+    """Match uncompressed or compressed filename with pattern."""
+    return any([fnmatch.fnmatch(fname + e, pattern) for e in [''] + [e for c in codecs.values() for e in c['exts']]])
+
+def get_policy_class(config, step_name, fname):
+    """Class of output from compression policy: per step/pattern, or intermediate if removed by a cleaning step, or default."""
+    policy = config['compression']
+    for output in policy.get('outputs', []):
+        if output['step_name'] == step_name and match_pattern(fname, output.get('pattern', '*')):
+            return output['class']
+    if policy.get('auto_intermediate', True):
+        for op in config.get('analysis', []):
+            if op.get('step_function', op['step_name']) == 'cleaning':
+                for step in op['steps']:
+                    if step['step_name'] == step_name and 'pattern' in step and match_pattern(fname, step['pattern']):
+                        return 'intermediate'
+    return policy.get('default')
+
+def get_policy_codec(config, step_name, fname, default_class=None):
+    """Codec and level for output fname of step from compression policy. Returns None if no policy applies."""
+    if 'compression' in config:
+        cls = get_policy_class(config, step_name, fname)
+        classes = {**default_classes, **config['compression'].get('classes', {})}
+    else:
+        cls = None
+        classes = default_classes
+    if cls is None:
+        cls = default_class
+    if cls is None:
+        return None
+    if cls not in classes:
+        raise ValueError(f'Unknown compression class {cls}')
+    return classes[cls]
+
+def get_policy_compress_cmd(config, step_name, fname, num_processor=None, keep=None, default_class=None):
+    codec = get_policy_codec(config, step_name, fname, default_class)
+    if codec is None:
+        return None
+    return get_compress_cmd(codec['codec'], level=codec.get('level'), num_processor=num_processor, keep=keep)
+
+def get_pipe_compress_cmd(fmt, level=None, num_processor=None):
+    """Command compressing stdin as expected by ReadKnead fq_command_out. Returns None if fmt can't be piped."""
+    if fmt == 'zst':
+        fmt = 'zstd'
+    if fmt not in pipe_commands:
+        return None
+    cmd = pipe_commands[fmt].copy()
+    if num_processor is not None and fmt in pipe_thread_opts:
+        cmd[1:1] = [o.format(num_processor) for o in pipe_thread_opts[fmt]]
+    if level is not None:
+        cmd.insert(1, f'-{level}')
+    return ','.join(cmd)
+
+def run_compress_cmds(cmds, num_processor=1, logger=None):
+    """Run compression commands in parallel, at most num_processor at once."""
+    if logger is None:
+        import logging as logger
+    def run(cmd):
+        logger.info(cmd)
+        subprocess.run(cmd, check=True)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(num_processor, len(cmds)))) as executor:
+        for f in [executor.submit(run, cmd) for cmd in cmds]:
+            f.result()
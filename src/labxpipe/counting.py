@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Count reads per feature with NumPy (alternative to GeneAbacus for counting)."""
+
+import gzip
+import itertools
+import json
+import re
+import subprocess
+
+import numpy as np
+import zstandard as zstd
+
+from . import compression
+
+cigar_regex = re.compile(r'(\d+)([MIDNSHP=X])')
+
+# SAM flags: Unmapped, QC fail and supplementary alignments are skipped
+flag_skip = 0x4 | 0x200 | 0x800
+
+# Feature parameters only available in GeneAbacus
+geneabacus_only = ['profile_formats', 'profile_paths', 'profile_type', 'profile_multi', 'profile_no_coord_mapping', 'output_sam', 'options']
+
+def format_value(v):
+    if v == int(v):
+        return str(int(v))
+    else:
+        return repr(float(v))
+
+def is_supported(feature):
+    return not any([k in feature for k in geneabacus_only])
+
+def parse_strand(s):
+    if s in ['+', '1', 1]:
+        return 1
+    elif s in ['-', '-1', -1]:
+        return -1
+    else:
+        return 0
+
+class Features:
+    """Features (exons) per chromosome, sorted by start. Coordinates are 0-based, end excluded."""
+
+    def __init__(self, names, lengths, intervals):
+        self.names = names
+        self.lengths = np.array(lengths, dtype=np.int64)
+        self.chroms = {}
+        for chrom, ivs in intervals.items():
+            ivs = np.array(ivs, dtype=np.int64).reshape(-1, 4)
+            ivs = ivs[np.argsort(ivs[:, 0], kind='stable')]
+            self.chroms[chrom] = {'starts': ivs[:, 0].copy(),
+                                  'ends': ivs[:, 1].copy(),
+                                  'idx': ivs[:, 2].copy(),
+                                  'strands': ivs[:, 3].copy(),
+                                  'max_length': int((ivs[:, 1] - ivs[:, 0]).max()) if len(ivs) > 0 else 0}
+
+    def __len__(self):
+        return len(self.names)
+
+def open_text(path):
+    if path.endswith('.zst'):
+        return zstd.open(path, 'rt')
+    elif path.endswith('.gz'):
+        return gzip.open(path, 'rt')
+    else:
+        return open(path, 'rt')
+
+def load_features(path_features, format_features=None, fon_name=None, fon_chrom=None, fon_coords=None, fon_strand=None):
+    names = []
+    lengths = []
+    intervals = {}
+    if format_features == 'tab':
+        # Chromosome(s) as feature(s), on both strands
+        with open_text(path_features) as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) < 2 or line.startswith('#'):
+                    continue
+                intervals.setdefault(fields[0], []).append([0, int(fields[1]), len(names), 0])
+                names.append(fields[0])
+                lengths.append(int(fields[1]))
+    else:
+        # FON (Feature Object Notation)
+        if fon_name is None:
+            fon_name = 'name'
+        if fon_chrom is None:
+            fon_chrom = 'chrom'
+        if fon_coords is None:
+            fon_coords = 'coords'
+        if fon_strand is None:
+            fon_strand = 'strand'
+        with open_text(path_features) as f:
+            fon = json.load(f)
+        name_idx = {}
+        for feat in fon['features']:
+            name = feat[fon_name]
+            if name not in name_idx:
+                name_idx[name] = len(names)
+                names.append(name)
+                lengths.append(0)
+            idx = name_idx[name]
+            strand = parse_strand(feat.get(fon_strand))
+            coords = feat[fon_coords]
+            if len(coords) > 0 and not isinstance(coords[0], list):
+                coords = [coords[i:i+2] for i in range(0, len(coords), 2)]
+            for start, end in coords:
+                intervals.setdefault(feat[fon_chrom], []).append([start, end, idx, strand])
+                lengths[idx] += end - start
+    return Features(names, lengths, intervals)
+
+def open_alignments(path, input_type='sam', num_decompress_processor=None, samtools_exe=None):
+    """Stream of SAM alignment lines and process (None if file is read directly)."""
+    if input_type == 'bam' or path.endswith('.bam') or path.endswith('.cram'):
+        if samtools_exe is None:
+            samtools_exe = 'samtools'
+        cmd = [samtools_exe, 'view', path]
+    else:
+        cmd = compression.get_decompress_cmd(path, num_decompress_processor)
+        if cmd is not None:
+            cmd = cmd + [path]
+    if cmd is None:
+        return open(path, 'rt'), None
+    else:
+        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+        return p.stdout, p
+
+def parse_batch(lines, paired=False, ignore_nh_tag=False):
+    """Parse alignments: per alignment chromosome, strand (of first read in pair), NH and weight, and aligned blocks."""
+    chroms = []
+    strands = []
+    nhs = []
+    weights = []
+    block_aln = []
+    block_starts = []
+    block_ends = []
+    for line in lines:
+        if line[0] == '@':
+            continue
+        fields = line.split('\t', 11)
+        flag = int(fields[1])
+        if flag & flag_skip:
+            continue
+        # NH
+        nh = 1
+        if not ignore_nh_tag and len(fields) > 11:
+            i = fields[11].find('NH:i:')
+            if i != -1:
+                j = fields[11].find('\t', i)
+                nh = int(fields[11][i+5:j if j != -1 else None])
+        # Strand of fragment: second read in pair is reversed
+        strand = -1 if flag & 0x10 else 1
+        if flag & 0x80:
+            strand = -strand
+        # Blocks (split at N)
+        ialn = len(chroms)
+        pos = int(fields[3]) - 1
+        start = pos
+        for length, op in cigar_regex.findall(fields[5]):
+            if op in 'M=XD':
+                pos += int(length)
+            elif op == 'N':
+                if pos > start:
+                    block_aln.append(ialn)
+                    block_starts.append(start)
+                    block_ends.append(pos)
+                pos += int(length)
+                start = pos
+        if pos > start:
+            block_aln.append(ialn)
+            block_starts.append(start)
+            block_ends.append(pos)
+        chroms.append(fields[2])
+        strands.append(strand)
+        nhs.append(nh)
+        weights.append(0.5 if paired and flag & 0x1 else 1.)
+    return {'chroms': chroms,
+            'strands': np.array(strands, dtype=np.int8),
+            'nhs': np.array(nhs, dtype=np.int64),
+            'weights': np.array(weights, dtype=np.float64),
+            'block_aln': np.array(block_aln, dtype=np.int64),
+            'block_starts': np.array(block_starts, dtype=np.int64),
+            'block_ends': np.array(block_ends, dtype=np.int64)}
+
+def overlap_batch(features, aln, read_min_overlap=None):
+    """Pairs of alignment and feature indexes with overlap at least read_min_overlap."""
+    if read_min_overlap is None:
+        read_min_overlap = 1
+    if len(aln['block_aln']) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int8)
+    block_chroms = np.array(aln['chroms'], dtype=object)[aln['block_aln']]
+    all_aln = []
+    all_feat = []
+    all_ov = []
+    all_strand = []
+    for chrom in np.unique(block_chroms):
+        if chrom not in features.chroms:
+            continue
+        fc = features.chroms[chrom]
+        sel = block_chroms == chrom
+        bidx = aln['block_aln'][sel]
+        bs = aln['block_starts'][sel]
+        be = aln['block_ends'][sel]
+        # Candidate intervals: start < block end and start > block start - max interval length
+        hi = np.searchsorted(fc['starts'], be, 'left')
+        lo = np.searchsorted(fc['starts'], bs - fc['max_length'], 'right')
+        n = np.maximum(hi - lo, 0)
+        rep = np.repeat(np.arange(len(bs)), n)
+        cand = lo[rep] + (np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n))
+        ov = np.minimum(fc['ends'][cand], be[rep]) - np.maximum(fc['starts'][cand], bs[rep])
+        keep = ov > 0
+        all_aln.append(bidx[rep[keep]])
+        all_feat.append(fc['idx'][cand[keep]])
+        all_ov.append(ov[keep])
+        all_strand.append(fc['strands'][cand[keep]])
+    if len(all_aln) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int8)
+    ialn = np.concatenate(all_aln)
+    ifeat = np.concatenate(all_feat)
+    # Sum overlap of blocks per alignment and feature
+    keys, inverse = np.unique(ialn * len(features) + ifeat, return_inverse=True)
+    ov = np.bincount(inverse, weights=np.concatenate(all_ov))
+    fstrand = np.zeros(len(keys), dtype=np.int8)
+    fstrand[inverse] = np.concatenate(all_strand)
+    keep = ov >= read_min_overlap
+    return keys[keep] // len(features), keys[keep] % len(features), fstrand[keep]
+
+class Counter:
+    def __init__(self, features, count_multis, read_strand=None, read_min_overlap=None):
+        self.features = features
+        self.count_multis = [int(m) for m in count_multis]
+        self.read_strand = parse_strand(read_strand)
+        self.read_min_overlap = read_min_overlap
+        # Weights summed per NH (exact sums of 1 or 0.5), divided by NH when counts are computed
+        self.counts_nh = {}
+        self.num_input = 0
+        self.num_output = 0
+
+    @property
+    def counts(self):
+        return sum_nh(self.counts_nh, self.count_multis, len(self.features))
+
+    def add(self, aln):
+        ialn, ifeat, fstrand = overlap_batch(self.features, aln, self.read_min_overlap)
+        # Strand: features without strand match both strands
+        if self.read_strand != 0:
+            rstrand = aln['strands'][ialn] * self.read_strand
+            keep = (fstrand == 0) | (fstrand == rstrand)
+            ialn, ifeat = ialn[keep], ifeat[keep]
+        nhs = aln['nhs'][ialn]
+        w = aln['weights'][ialn]
+        for nh in np.unique(nhs):
+            sel = nhs == nh
+            counts = np.bincount(ifeat[sel], weights=w[sel], minlength=len(self.features))
+            if nh in self.counts_nh:
+                self.counts_nh[nh] += counts
+            else:
+                self.counts_nh[nh] = counts
+        self.num_input += len(aln['chroms'])
+        self.num_output += len(np.unique(ialn))
+
+    def write(self, path_count, path_report, totals, norm_totals=None):
+        if norm_totals is None:
+            norm_totals = totals
+        norm_totals = np.array(norm_totals, dtype=np.float64)
+        counts = self.counts
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rpkms = counts * 1e9 / self.features.lengths[:, None] / norm_totals[None, :]
+            total_rpkms = np.array(totals) * 1e9 / self.features.lengths.sum() / norm_totals
+        rpkms = np.nan_to_num(rpkms, nan=0., posinf=0.)
+        total_rpkms = np.nan_to_num(total_rpkms, nan=0., posinf=0.)
+        with open(path_count, 'wt') as f:
+            f.write(','.join(['name', 'length'] + [f'{c}_{m}' for m in self.count_multis for c in ['count', 'rpkm']]) + '\n')
+            f.write(','.join(['total', str(self.features.lengths.sum())] + [format_value(v) for t, r in zip(totals, total_rpkms) for v in [t, r]]) + '\n')
+            for i, name in enumerate(self.features.names):
+                f.write(','.join([name, str(self.features.lengths[i])] + [format_value(v) for c, r in zip(counts[i], rpkms[i]) for v in [c, r]]) + '\n')
+        json.dump({'input': self.num_input, 'output': self.num_output}, open(path_report, 'w'), sort_keys=True, indent=4, separators=(',', ': '))
+
+def sum_nh(values_nh, count_multis, size=None):
+    """Sum of values per NH divided by NH, for alignments with NH up to each multi."""
+    values = np.zeros((size, len(count_multis)) if size is not None else len(count_multis), dtype=np.float64)
+    for im, m in enumerate(count_multis):
+        for nh in sorted(values_nh):
+            if nh <= m:
+                values[..., im] += values_nh[nh] / nh
+    return values
+
+def read_totals(path_count, count_multis):
+    """Totals from second line of count file."""
+    with open(path_count, 'rt') as f:
+        f.readline()
+        tmp = f.readline().strip().split(',')
+    return [float(tmp[2 + (2 * icm)]) for icm in range(len(count_multis))]
+
+def count(path_input, input_type, counters, paired=False, ignore_nh_tag=False, batch_size=500000, num_decompress_processor=None, samtools_exe=None, logger=None):
+    """Count alignments of path_input in all counters in a single pass. Returns totals per multiplicity per counter."""
+    if logger is None:
+        import logging as logger
+    logger.info(f'Counting {path_input} for {len(counters)} feature(s)')
+    totals_nh = {}
+    f, p = open_alignments(path_input, input_type, num_decompress_processor, samtools_exe)
+    try:
+        while True:
+            lines = list(itertools.islice(f, batch_size))
+            if len(lines) == 0:
+                break
+            aln = parse_batch(lines, paired, ignore_nh_tag)
+            for nh in np.unique(aln['nhs']):
+                totals_nh[nh] = totals_nh.get(nh, 0.) + aln['weights'][aln['nhs'] == nh].sum()
+            for counter in counters:
+                counter.add(aln)
+    finally:
+        f.close()
+        if p is not None and p.wait() != 0:
+            raise subprocess.CalledProcessError(p.returncode, p.args)
+    return [sum_nh(totals_nh, c.count_multis) for c in counters]
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Read count tables (GeneAbacus CSV or Cufflinks fpkm_tracking) through a columnar cache, and store them per project."""
+
+import concurrent.futures
+import glob
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import urllib.parse
+
+import numpy as np
+import pandas as pd
+
+from . import utils
+
+def get_path_cached(path, path_cache):
+    st = os.stat(path)
+    key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+    return os.path.join(path_cache, 'counts', f'{key}_{st.st_size}_{st.st_mtime_ns}')
+
+def get_fname_column(column):
+    return urllib.parse.quote(column, safe='') + '.npy'
+
+def read_table(path, columns, fmt='csv', name_column='name'):
+    """Name and requested columns of count table as arrays (names as fixed-width strings)."""
+    usecols = [name_column] + [c for c in columns if c != name_column]
+    if fmt == 'csv':
+        m = pd.read_csv(path, usecols=usecols)
+    elif fmt == 'fpkm_tracking':
+        m = pd.read_table(path, usecols=usecols).sort_values(name_column, kind='stable')
+    else:
+        raise ValueError(f'Unknown count table format {fmt}')
+    table = {c: m[c].to_numpy() for c in usecols}
+    table[name_column] = table[name_column].astype(str)
+    return table
+
+def save_array(path, a):
+    fd, path_tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, a)
+        os.replace(path_tmp, path)
+    except:
+        os.remove(path_tmp)
+        raise
+
+def cache_table(path, columns, fmt='csv', name_column='name', path_cache=None):
+    """Add missing columns of count table to cache (previous versions of path are removed). Returns path to cached columns."""
+    if path_cache is None:
+        path_cache = utils.get_path_cache()
+    path_cached = get_path_cached(path, path_cache)
+    keys = [name_column] + [c for c in columns if c != name_column]
+    missing = [c for c in keys if not os.path.exists(os.path.join(path_cached, get_fname_column(c)))]
+    if len(missing) > 0:
+        table = read_table(path, missing, fmt, name_column)
+        os.makedirs(path_cached, exist_ok=True)
+        for c in missing:
+            save_array(os.path.join(path_cached, get_fname_column(c)), table[c])
+        prefix = os.path.basename(path_cached).split('_')[0]
+        for p in glob.glob(os.path.join(os.path.dirname(path_cached), prefix + '_*')):
+            if p != path_cached:
+                shutil.rmtree(p, ignore_errors=True)
+    return path_cached
+
+def cache_tables(paths, columns, fmt='csv', name_column='name', path_cache=None, num_processor=1):
+    """Cache count tables in parallel (tables are parsed in separate processes)."""
+    if num_processor > 1 and len(paths) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=num_processor) as executor:
+            for f in [executor.submit(cache_table, p, columns, fmt, name_column, path_cache) for p in paths]:
+                f.result()
+    else:
+        for p in paths:
+            cache_table(p, columns, fmt, name_column, path_cache)
+
+def read_counts(path, columns, fmt='csv', name_column='name', path_cache=None):
+    """Name and requested columns of count table, memory-mapped from cache."""
+    path_cached = cache_table(path, columns, fmt, name_column, path_cache)
+    keys = [name_column] + [c for c in columns if c != name_column]
+    return {c: np.load(os.path.join(path_cached, get_fname_column(c)), mmap_mode='r') for c in keys}
+
+def normalize(values, lengths, sel):
+    """Totals, RPKM, TPM and CPM of count matrix (features x samples). Totals are computed over features selected by sel."""
+    values = np.asarray(values)
+    lengths = np.asarray(lengths)
+    # Sum along contiguous rows (same summation as per sample)
+    totals = np.ascontiguousarray(values[sel].T).sum(axis=1)
+    # Empty selections give inf/nan (as in pandas)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = values / lengths[:, None]
+        return {'total': totals,
+                'rpkm': values * (1000. / lengths)[:, None] * (1000000. / totals)[None, :],
+                'tpm': rates * (1000000. / np.ascontiguousarray(rates[sel].T).sum(axis=1))[None, :],
+                'cpm': values * (1000000. / totals)[None, :]}
+
+def get_path_store(count_store, path_output, name):
+    """Path to project count store from the counting step option count_store (true or path, relative to path_output)."""
+    if count_store is True:
+        return os.path.join(path_output, name + '_counts.sqlite')
+    else:
+        return os.path.join(path_output, count_store)
+
+class CountStore:
+    """Project count vectors per feature, ref (run or replicate) and column, in SQLite (WAL, safe for concurrent runs).
+    Names and lengths of features are stored once per annotation."""
+
+    def __init__(self, path, timeout=600.):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=timeout)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS names (names_id TEXT PRIMARY KEY, names BLOB, lengths BLOB, dtype TEXT)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS counts (feature TEXT, ref TEXT, column TEXT, names_id TEXT, dtype TEXT, itemsize INTEGER, data BLOB, source_size INTEGER, source_mtime_ns INTEGER, PRIMARY KEY (feature, ref, column))')
+        self.names = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def get_names(self, names_id):
+        """Names (as array of strings) and lengths of features."""
+        if names_id not in self.names:
+            names, lengths, dtype = self.conn.execute('SELECT names, lengths, dtype FROM names WHERE names_id=?', (names_id,)).fetchone()
+            self.names[names_id] = (np.array(names.decode().split('\n')), np.frombuffer(lengths, dtype=dtype))
+        return self.names[names_id]
+
+    def add(self, feature, ref, table, columns, name_column='name', source=None):
+        """Add (or replace) columns of table (dict of arrays with name_column and length) of ref. source is the path to the count table."""
+        names = '\n'.join(np.asarray(table[name_column]).astype(str).tolist()).encode()
+        lengths = np.ascontiguousarray(table['length'], dtype=np.asarray(table['length']).dtype.newbyteorder('<'))
+        names_id = hashlib.sha1(names + lengths.tobytes()).hexdigest()
+        if source is None:
+            source_size, source_mtime_ns = None, None
+        else:
+            st = os.stat(source)
+            source_size, source_mtime_ns = st.st_size, st.st_mtime_ns
+        rows = []
+        for c in columns:
+            a = np.asarray(table[c])
+            a = np.ascontiguousarray(a, dtype=a.dtype.newbyteorder('<'))
+            rows.append((feature, ref, c, names_id, a.dtype.str, a.dtype.itemsize, a.tobytes(), source_size, source_mtime_ns))
+        with self.conn:
+            self.conn.execute('INSERT OR IGNORE INTO names VALUES (?, ?, ?, ?)', (names_id, names, lengths.tobytes(), lengths.dtype.str))
+            self.conn.executemany('INSERT OR REPLACE INTO counts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def add_table(self, feature, ref, path, columns=None, fmt='csv', name_column='name'):
+        """Add count table. Default columns are all count columns (count_*)."""
+        if columns is None:
+            if fmt == 'csv':
+                header = pd.read_csv(path, nrows=0)
+            else:
+                header = pd.read_table(path, nrows=0)
+            columns = [c for c in header.columns if c.startswith('count_')]
+        self.add(feature, ref, read_table(path, ['length'] + columns, fmt, name_column), columns, name_column, path)
+
+    def is_current(self, feature, ref, columns, path=None):
+        """Columns of ref are stored (and up-to-date with count table at path if it exists)."""
+        rows = self.conn.execute(f'SELECT source_size, source_mtime_ns FROM counts WHERE feature=? AND ref=? AND column IN ({",".join("?" * len(columns))})', [feature, ref] + list(columns)).fetchall()
+        if len(rows) < len(columns):
+            return False
+        if path is not None and os.path.exists(path):
+            st = os.stat(path)
+            return all([r == (st.st_size, st.st_mtime_ns) for r in rows])
+        return True
+
+    def get(self, feature, ref, columns, name_column='name'):
+        """Names, lengths and columns of ref (as read_counts). Returns None if any column is missing."""
+        table = {}
+        for c in columns:
+            if c == 'length':
+                continue
+            row = self.conn.execute('SELECT names_id, dtype, data FROM counts WHERE feature=? AND ref=? AND column=?', (feature, ref, c)).fetchone()
+            if row is None:
+                return None
+            table[name_column], table['length'] = self.get_names(row[0])
+            table[c] = np.frombuffer(row[2], dtype=row[1])
+        return table
+
+    def refs(self, feature, column=None):
+        """Refs stored for feature (with column)."""
+        if column is None:
+            return [r[0] for r in self.conn.execute('SELECT DISTINCT ref FROM counts WHERE feature=? ORDER BY ref', (feature,))]
+        else:
+            return [r[0] for r in self.conn.execute('SELECT ref FROM counts WHERE feature=? AND column=? ORDER BY ref', (feature, column))]
+
+    def query(self, feature, name, column):
+        """Value of feature name in column across all refs: Returns {ref: value}. Only the value is read from each vector."""
+        values = {}
+        for (names_id,) in self.conn.execute('SELECT DISTINCT names_id FROM counts WHERE feature=? AND column=?', (feature, column)).fetchall():
+            idx = np.flatnonzero(self.get_names(names_id)[0] == name)
+            if len(idx) == 0:
+                continue
+            for ref, dtype, value in self.conn.execute('SELECT ref, dtype, substr(data, 1 + ? * itemsize, itemsize) FROM counts WHERE feature=? AND column=? AND names_id=? ORDER BY ref', (int(idx[0]), feature, column, names_id)):
+                values[ref] = np.frombuffer(value, dtype=dtype)[0]
+        return dict(sorted(values.items()))
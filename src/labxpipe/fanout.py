@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Decompress (or decode BAM/CRAM) input once and tee it to concurrent consumers using FIFOs."""
+
+import contextlib
+import errno
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from . import compression
+
+# FIFO path to its tee
+active_tees = {}
+
+def is_bam(path):
+    return path.endswith('.bam') or path.endswith('.cram')
+
+def get_read_cmd(path, num_decompress_processor=None, samtools_exe=None):
+    """Command writing content of path to stdout: BAM/CRAM decoded to SAM (with header) or decompressed. Returns None if
+    path is read directly."""
+    if is_bam(path):
+        if samtools_exe is None:
+            samtools_exe = 'samtools'
+        cmd = [samtools_exe, 'view', '-h']
+        if num_decompress_processor is not None:
+            cmd.extend(['-@', str(num_decompress_processor)])
+        return cmd
+    return compression.get_decompress_cmd(path, num_decompress_processor)
+
+class Tee(threading.Thread):
+    """Write decompressed input to FIFOs.
+
+    Writing starts once all consumers opened their FIFO. Writes are blocking: the slowest consumer sets the pace (back-pressure).
+    Consumers closing their FIFO early or released (i.e. failing before opening their FIFO) are dropped."""
+
+    def __init__(self, path_input, paths_fifo, num_decompress_processor=None, chunk_size=4*1024*1024, logger=None):
+        super().__init__(daemon=True)
+        if logger is None:
+            import logging as logger
+        self.path_input = path_input
+        self.paths_fifo = paths_fifo
+        self.num_decompress_processor = num_decompress_processor
+        self.chunk_size = chunk_size
+        self.logger = logger
+        self.aborting = threading.Event()
+        self.dropped = set()
+        self.error = None
+
+    def abort(self):
+        self.aborting.set()
+
+    def drop(self, path_fifo):
+        self.dropped.add(path_fifo)
+
+    def unblock(self, paths_fifo):
+        """Readers blocked opening a FIFO get EOF."""
+        for p in paths_fifo:
+            try:
+                os.close(os.open(p, os.O_RDWR | os.O_NONBLOCK))
+            except OSError:
+                pass
+
+    def open_fifos(self):
+        fds = {}
+        while len(fds) + len(self.dropped) < len(self.paths_fifo):
+            if self.aborting.is_set():
+                for fd in fds.values():
+                    os.close(fd)
+                self.unblock([p for p in self.paths_fifo if p not in fds])
+                return {}
+            for p in self.paths_fifo:
+                if p not in fds and p not in self.dropped:
+                    try:
+                        fds[p] = os.open(p, os.O_WRONLY | os.O_NONBLOCK)
+                        os.set_blocking(fds[p], True)
+                    except OSError as e:
+                        # No reader yet
+                        if e.errno != errno.ENXIO:
+                            raise
+            if len(fds) + len(self.dropped) < len(self.paths_fifo):
+                time.sleep(0.05)
+        return fds
+
+    def run(self):
+        p = None
+        src = None
+        fds = {}
+        try:
+            fds = self.open_fifos()
+            cmd = get_read_cmd(self.path_input, self.num_decompress_processor)
+            if cmd is None:
+                src = open(self.path_input, 'rb')
+            else:
+                self.logger.info(f'Fan-out of {self.path_input} to {len(fds)} consumer(s) with {cmd}')
+                p = subprocess.Popen(cmd + [self.path_input], stdout=subprocess.PIPE)
+                src = p.stdout
+            while len(fds) > 0 and not self.aborting.is_set():
+                data = src.read(self.chunk_size)
+                if len(data) == 0:
+                    break
+                for path_fifo, fd in list(fds.items()):
+                    if path_fifo in self.dropped:
+                        os.close(fd)
+                        del fds[path_fifo]
+                        continue
+                    try:
+                        view = memoryview(data)
+                        while len(view) > 0:
+                            view = view[os.write(fd, view):]
+                    except BrokenPipeError:
+                        self.logger.warning(f'Consumer of {path_fifo} stopped reading')
+                        os.close(fd)
+                        del fds[path_fifo]
+        except Exception as e:
+            self.error = e
+        finally:
+            for fd in fds.values():
+                os.close(fd)
+            if src is not None:
+                src.close()
+            if p is not None:
+                if self.aborting.is_set() or len(fds) == 0:
+                    p.kill()
+                    p.wait()
+                elif p.wait() != 0 and self.error is None:
+                    self.error = subprocess.CalledProcessError(p.returncode, p.args)
+
+@contextlib.contextmanager
+def open_fanouts(readers, path_tmp, num_decompress_processor=None, logger=None):
+    """Start one tee per input path read by more than one reader.
+
+    readers maps input path to number of readers. Yields a dict mapping input path to list of FIFO paths (one per reader)."""
+    if logger is None:
+        import logging as logger
+    path_fifos = tempfile.mkdtemp(prefix='fanout_', dir=path_tmp)
+    tees = []
+    fifos = {}
+    try:
+        for i, (path_input, num_reader) in enumerate(readers.items()):
+            if num_reader < 2:
+                continue
+            # FIFO name keeps uncompressed extension for consumers detecting format by suffix (decoded BAM/CRAM is SAM)
+            fname = os.path.basename(compression.strip_ext(path_input))
+            if is_bam(fname):
+                fname = fname[:fname.rindex('.')] + '.sam'
+            fifos[path_input] = []
+            for j in range(num_reader):
+                p = os.path.join(path_fifos, f'{i}_{j}_{fname}')
+                os.mkfifo(p)
+                fifos[path_input].append(p)
+            tee = Tee(path_input, fifos[path_input], num_decompress_processor, logger=logger)
+            for p in fifos[path_input]:
+                active_tees[p] = tee
+            tee.start()
+            tees.append(tee)
+        yield fifos
+    except BaseException:
+        for tee in tees:
+            tee.abort()
+        raise
+    finally:
+        for tee in tees:
+            tee.join()
+            for p in tee.paths_fifo:
+                active_tees.pop(p, None)
+        shutil.rmtree(path_fifos, ignore_errors=True)
+    for tee in tees:
+        if tee.error is not None:
+            raise tee.error
+
+def count_readers(paths):
+    readers = {}
+    for p in paths:
+        readers[p] = readers.get(p, 0) + 1
+    return readers
+
+def take_path(params, path):
+    """FIFO to read instead of path if available (each FIFO is read once)."""
+    if 'fanout_paths' in params and len(params['fanout_paths'].get(path, [])) > 0:
+        return params['fanout_paths'][path].pop(0)
+    return path
+
+def has_path(params, path):
+    return 'fanout_paths' in params and len(params['fanout_paths'].get(path, [])) > 0
+
+def release(path_fifo):
+    """Drop consumer of path_fifo (no-op if path_fifo isn't a fan-out FIFO)."""
+    if path_fifo in active_tees:
+        active_tees[path_fifo].drop(path_fifo)
+
+def run_reader(fn, paths_fifo, *args, **kwargs):
+    """Run fn reading paths_fifo, releasing them if fn fails."""
+    try:
+        return fn(*args, **kwargs)
+    except BaseException:
+        if isinstance(paths_fifo, str):
+            paths_fifo = [paths_fifo]
+        for p in paths_fifo:
+            release(p)
+        raise
@@ -14,6 +14,8 @@ import os
 import re
 import subprocess
 
+from .. import compression
+
 bowtie2_quality_scores = {'Solexa':'--solexa-quals', 'Illumina 1.3':'--phred64', 'Illumina 1.5':'--phred64', 'Illumina 1.8':'--phred33'}
 
 def get_bowtie2_version(exe=None):
@@ -64,7 +66,7 @@ def bowtie2(fq_1, fq_2=None, outfile=None, quality_score=None, bwt_index=None, n
         cmd.extend(others)
     # Set default output compression
     if compress_sam and compress_sam_cmd is None:
-        compress_sam_cmd = ['zstd', '--rm', '-12', '-T'+num_processor]
+        compress_sam_cmd = compression.get_compress_cmd('zstd', level=12, num_processor=num_processor, keep=False)
     # ---------
     # Start Bowtie2
     logger.info('Starting Bowtie2 with ' + str(cmd))
@@ -13,6 +13,8 @@
 import os
 import subprocess
 
+from .. import compression
+
 def get_geneabacus_version(exe=None):
     # Defaults
     if exe is None:
@@ -21,7 +23,7 @@ def get_geneabacus_version(exe=None):
     p = subprocess.run([exe, '--version'], check=True, stdout=subprocess.PIPE, text=True)
     return p.stdout.strip()
 
-def geneabacus(path_bam=None, path_sam=None, sam_command_in=None, path_features=None, format_features=None, fon_name=None, fon_chrom=None, fon_coords=None, fon_strand=None, feature_strand=None, path_features_filter=None, include_missing_in_filter=None, path_mapping=None, path_report=None, read_strand=None, paired=None, ignore_nh_tag=None, read_min_overlap=None, read_min_mapping_quality=None, read_in_proper_pair=None, read_length=None, fragment_min_length=None, fragment_max_length=None, rand_proportion=None, count_path=None, count_multis=None, count_totals=None, count_total_real_read=None, count_in_profile=None, profile_paths=None, profile_type=None, profile_formats=None, profile_multi=None, profile_overhang=None, profile_untemplated=None, profile_no_untemplated=None, profile_extension_length=None, profile_position_fraction=None, profile_norm=None, profile_no_coord_mapping=None, path_sam_out=None, num_worker=None, verbose=None, verbose_level=None, others=None, exe=None, return_std=None, logger=None):
+def geneabacus(path_bam=None, path_sam=None, sam_command_in=None, num_decompress_processor=None, path_features=None, format_features=None, fon_name=None, fon_chrom=None, fon_coords=None, fon_strand=None, feature_strand=None, path_features_filter=None, include_missing_in_filter=None, path_mapping=None, path_report=None, read_strand=None, paired=None, ignore_nh_tag=None, read_min_overlap=None, read_min_mapping_quality=None, read_in_proper_pair=None, read_length=None, fragment_min_length=None, fragment_max_length=None, rand_proportion=None, count_path=None, count_multis=None, count_totals=None, count_total_real_read=None, count_in_profile=None, profile_paths=None, profile_type=None, profile_formats=None, profile_multi=None, profile_overhang=None, profile_untemplated=None, profile_no_untemplated=None, profile_extension_length=None, profile_position_fraction=None, profile_norm=None, profile_no_coord_mapping=None, path_sam_out=None, num_worker=None, verbose=None, verbose_level=None, others=None, exe=None, return_std=None, logger=None):
     # Defaults
     if exe is None:
         exe = 'geneabacus'
@@ -48,20 +50,15 @@ def geneabacus(path_bam=None, path_sam=None, sam_command_in=None, path_features=
             first_sam = path_sam.split(',')[0]
         # Input SAM command
         if sam_command_in is not None:
-            if isinstance(count_multis, list):
+            if isinstance(sam_command_in, list):
                 cmd.extend(['--sam_command_in', ','.join(map(str, sam_command_in))])
             else:
                 cmd.extend(['--sam_command_in', sam_command_in])
         else:
-            # Add zcat if necessary
-            if first_sam.endswith('.gz'):
-                cmd.extend(['--sam_command_in', 'zcat'])
-            # Add lz4 if necessary
-            elif first_sam.endswith('.lz4'):
-                cmd.extend(['--sam_command_in', 'lz4cat'])
-            # Add zstd if necessary
-            elif first_sam.endswith('.zst'):
-                cmd.extend(['--sam_command_in', 'zstdcat'])
+            # Add decompression command if necessary
+            decompress_cmd = compression.get_decompress_cmd(first_sam, num_decompress_processor)
+            if decompress_cmd is not None:
+                cmd.extend(['--sam_command_in', ','.join(decompress_cmd)])
     cmd.extend(['--path_features', path_features])
     if format_features is not None:
         cmd.extend(['--format_features', format_features])
@@ -16,6 +16,8 @@ import re
 import subprocess
 import threading
 
+from .. import compression
+
 
 def start_compress_thread(cmd, path_fifo):
     def fn_thread(cmd, path_fifo):
@@ -48,6 +50,7 @@ def minimap2(
     outfile=None,
     index=None,
     num_processor=None,
+    num_decompress_processor=None,
     compress_output=None,
     compress_output_cmd=None,
     others=None,
@@ -89,26 +92,15 @@ def minimap2(
         cmd.append(index)
     # Set default output compression
     if compress_output and compress_output_cmd is None:
-        compress_output_cmd = ['zstd', '--rm', '-12']
-        if num_processor is not None:
-            compress_output_cmd.append(f'-T{num_processor}')
+        compress_output_cmd = compression.get_compress_cmd('zstd', level=12, num_processor=num_processor, keep=False)
     # ---------
     # Start Minimap2
     fifos = []
     try:
         # Prepare input
         for i, path_input in enumerate(path_inputs):
-            # Add zcat if necessary
-            if path_input.endswith('.gz'):
-                compress_input_cmd = ['zcat']
-            # Add lz4 if necessary
-            elif path_input.endswith('.lz4'):
-                compress_input_cmd = ['lz4cat']
-            # Add zstd if necessary
-            elif path_input.endswith('.zst'):
-                compress_input_cmd = ['zstdcat']
-            else:
-                compress_input_cmd = None
+            # Add decompression command if necessary
+            compress_input_cmd = compression.get_decompress_cmd(path_input, num_decompress_processor)
             if compress_input_cmd:
                 # Open FIFO
                 path_fifo = os.path.join(path_output, f'input{i}')
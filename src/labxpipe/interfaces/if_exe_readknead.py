@@ -14,6 +14,8 @@ import json
 import os
 import subprocess
 
+from .. import compression
+
 readknead_quality_scores = {'Solexa':['--ascii_min', '59', '--max_quality', '46'], 'Illumina 1.3':['--ascii_min', '64'], 'Illumina 1.5':['--ascii_min', '64'], 'Illumina 1.8':['--ascii_min', '33']}
 
 def get_readknead_version(exe=None):
@@ -24,7 +26,7 @@ def get_readknead_version(exe=None):
     p = subprocess.run([exe, '--version'], check=True, stdout=subprocess.PIPE, text=True)
     return p.stdout.strip()
 
-def readknead(fq_1, fq_2=None, outpath=None, fq_fname_out_r1=None, fq_fname_out_r2=None, fq_command_in=None, fq_command_out=None, quality_score=None, ops_r1=None, ops_r2=None, report_path=None, label=None, num_worker=None, stats_in_path=None, stats_out_path=None, max_read_length=None, max_quality=None, ascii_min=None, verbose=None, verbose_level=None, others=None, exe=None, return_std=None, logger=None):
+def readknead(fq_1, fq_2=None, outpath=None, fq_fname_out_r1=None, fq_fname_out_r2=None, fq_command_in=None, fq_command_out=None, num_decompress_processor=None, quality_score=None, ops_r1=None, ops_r2=None, report_path=None, label=None, num_worker=None, stats_in_path=None, stats_out_path=None, max_read_length=None, max_quality=None, ascii_min=None, verbose=None, verbose_level=None, others=None, exe=None, return_std=None, path_log=None, logger=None):
     # Defaults
     if exe is None:
         exe = 'readknead'
@@ -51,15 +53,10 @@ def readknead(fq_1, fq_2=None, outpath=None, fq_fname_out_r1=None, fq_fname_out_
     if fq_command_in is not None:
         cmd.extend(['--fq_command_in', fq_command_in])
     else:
-        # Add zcat if necessary
-        if fq_1[0].endswith('.gz'):
-            cmd.extend(['--fq_command_in', 'zcat'])
-        # Add lz4 if necessary
-        elif fq_1[0].endswith('.lz4'):
-            cmd.extend(['--fq_command_in', 'lz4cat'])
-        # Add zstd if necessary
-        elif fq_1[0].endswith('.zst'):
-            cmd.extend(['--fq_command_in', 'zstdcat'])
+        # Add decompression command if necessary
+        decompress_cmd = compression.get_decompress_cmd(fq_1[0], num_decompress_processor)
+        if decompress_cmd is not None:
+            cmd.extend(['--fq_command_in', ','.join(decompress_cmd)])
     # Output FASTQ command
     if fq_command_out is not None:
         cmd.extend(['--fq_command_out', fq_command_out])
@@ -121,5 +118,8 @@ def readknead(fq_1, fq_2=None, outpath=None, fq_fname_out_r1=None, fq_fname_out_
         except Exception as e:
             logger.error('ReadKnead failed: ' + e.stderr)
             raise
+    elif path_log is not None:
+        with open(path_log, 'a') as f:
+            subprocess.run(cmd, check=True, stdout=f, stderr=subprocess.STDOUT)
     else:
         subprocess.run(cmd, check=True)
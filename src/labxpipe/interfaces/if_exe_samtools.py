@@ -13,6 +13,8 @@
 import os
 import subprocess
 
+from .. import compression
+
 def get_samtools_version(exe=None):
     # Defaults
     if exe is None:
@@ -59,7 +61,7 @@ def create_bam_index(bam_fname, exe=None, logger=None):
     # Run
     subprocess.run(cmd, check=True)
 
-def sam_stats(bam_fname, exe=None, logger=None):
+def sam_stats(bam_fname, num_decompress_processor=None, exe=None, logger=None):
     # Defaults
     if exe is None:
         exe = 'samtools'
@@ -67,9 +69,13 @@ def sam_stats(bam_fname, exe=None, logger=None):
         import logging as logger
     # Command
     cmd = [exe, 'stats']
-    # Input
-    if bam_fname.endswith('.zst'):
-        p_input = subprocess.Popen(['zstdcat', bam_fname], stdout=subprocess.PIPE)
+    # Input (BAM and CRAM are read natively)
+    if bam_fname.endswith('.bam') or bam_fname.endswith('.cram'):
+        decompress_cmd = None
+    else:
+        decompress_cmd = compression.get_decompress_cmd(bam_fname, num_decompress_processor)
+    if decompress_cmd is not None:
+        p_input = subprocess.Popen(decompress_cmd + [bam_fname], stdout=subprocess.PIPE)
         p_stdin = p_input.stdout
     else:
         cmd.append(bam_fname)
@@ -14,6 +14,8 @@ import os
 import re
 import subprocess
 
+from .. import compression
+
 star_quality_scores = {'Solexa':'-26', 'Illumina 1.3':'-31', 'Illumina 1.5':'-31', 'Illumina 1.8':None}
 
 def get_star_version(exe=None):
@@ -23,7 +25,7 @@ def get_star_version(exe=None):
     # Get version
     return subprocess.run([exe, '--version'], stdout=subprocess.PIPE, text=True).stdout.strip()
 
-def star(fq_1, fq_2=None, outpath=None, quality_score=None, reads_directional=False, star_index=None, num_processor=None, output_type=None, rename=None, compress_sam=None, compress_sam_cmd=None, compress_unmapped=None, compress_unmapped_cmd=None, others=None, exe=None, return_std=None, logger=None):
+def star(fq_1, fq_2=None, outpath=None, quality_score=None, reads_directional=False, star_index=None, num_processor=None, num_decompress_processor=None, output_type=None, rename=None, compress_sam=None, compress_sam_cmd=None, compress_unmapped=None, compress_unmapped_cmd=None, others=None, exe=None, return_std=None, logger=None):
     # Defaults
     if exe is None:
         exe = 'STAR'
@@ -71,23 +73,16 @@ def star(fq_1, fq_2=None, outpath=None, quality_score=None, reads_directional=Fa
     if fq_2 is not None:
         reads.append(','.join(fq_2))
     cmd.extend(reads)
-    # Add zcat if necessary
-    if fq_1[0].endswith('.gz'):
-        cmd.append('--readFilesCommand')
-        cmd.append('zcat')
-    # Add lz4 if necessary
-    if fq_1[0].endswith('.lz4'):
-        cmd.append('--readFilesCommand')
-        cmd.append('lz4cat')
-    # Add zstd if necessary
-    if fq_1[0].endswith('.zst'):
+    # Add decompression command if necessary
+    decompress_cmd = compression.get_decompress_cmd(fq_1[0], num_decompress_processor)
+    if decompress_cmd is not None:
         cmd.append('--readFilesCommand')
-        cmd.append('zstdcat')
+        cmd.extend(decompress_cmd)
     # Set default output compression
     if compress_sam and compress_sam_cmd is None:
-        compress_sam_cmd = ['zstd', '--rm', '-10', '-T'+num_processor]
+        compress_sam_cmd = compression.get_compress_cmd('zstd', level=10, num_processor=num_processor, keep=False)
     if compress_unmapped and compress_unmapped_cmd is None:
-        compress_unmapped_cmd = ['zstd', '--rm', '-10', '-T'+num_processor]
+        compress_unmapped_cmd = compression.get_compress_cmd('zstd', level=10, num_processor=num_processor, keep=False)
     # ---------
     # Start STAR
     logger.info('Starting STAR with ' + str(cmd))
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Cached manifests of directory content."""
+
+import json
+import os
+import threading
+import time
+
+# Directories modified less than this delay (in ns) before scanning aren't cached,
+# as later changes within the filesystem timestamp resolution would be missed.
+racy_delay = 2 * 10**9
+
+manifests = {}
+manifests_lock = threading.Lock()
+# Manifests used by this process (others are evicted from saved cache)
+used = set()
+
+def scan(path):
+    """Scan directory: files with size and mtime, and sub-directories. Symlinks are followed."""
+    files = {}
+    dirs = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_dir():
+                    dirs.append(entry.name)
+                elif entry.is_file():
+                    st = entry.stat()
+                    files[entry.name] = [st.st_size, st.st_mtime_ns]
+            except OSError:
+                # Broken symlink or entry deleted while scanning
+                pass
+    dirs.sort()
+    return {'files': files, 'dirs': dirs}
+
+def get_manifest(path):
+    """Manifest of directory. Returns None if path isn't a directory.
+
+    Cached manifests are invalidated when the directory mtime changes, i.e. when an entry is added, removed or renamed. File
+    sizes and mtimes are those at scan time (use get_size for current size)."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    mtime_ns = st.st_mtime_ns
+    key = os.path.abspath(path)
+    with manifests_lock:
+        used.add(key)
+        m = manifests.get(key)
+    if m is not None and m['mtime_ns'] == mtime_ns:
+        return m
+    try:
+        m = scan(path)
+    except (NotADirectoryError, FileNotFoundError):
+        return None
+    m['mtime_ns'] = mtime_ns
+    if time.time_ns() - mtime_ns > racy_delay:
+        with manifests_lock:
+            manifests[key] = m
+    return m
+
+def list_files(path):
+    m = get_manifest(path)
+    if m is None:
+        return []
+    return sorted(m['files'].keys())
+
+def list_dirs(path):
+    m = get_manifest(path)
+    if m is None:
+        return []
+    return m['dirs']
+
+def get_file(path):
+    """Size and mtime of file from manifest of its directory. Returns None if not found."""
+    m = get_manifest(os.path.dirname(path) or '.')
+    if m is None:
+        return None
+    return m['files'].get(os.path.basename(path))
+
+def exists(path):
+    return get_file(path) is not None
+
+def get_size(path):
+    """Size of file. File is stat'ed again, as files rewritten in place don't change the mtime of their directory."""
+    return os.stat(path).st_size
+
+def walk(path):
+    """Same as os.walk(path, followlinks=True), using manifests. Names are sorted."""
+    m = get_manifest(path)
+    if m is None:
+        return
+    yield path, m['dirs'], sorted(m['files'].keys())
+    for d in m['dirs']:
+        yield from walk(os.path.join(path, d))
+
+def load(path_cache):
+    """Load manifests saved by save(). Missing or corrupted cache is ignored."""
+    try:
+        with open(path_cache) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return
+    with manifests_lock:
+        for k, m in cache.items():
+            if k not in manifests:
+                manifests[k] = m
+
+def save(path_cache):
+    """Save manifests used by this process: others are evicted. Written into a temporary file first to avoid corrupting cache
+    shared by concurrent processes."""
+    os.makedirs(os.path.dirname(os.path.abspath(path_cache)), exist_ok=True)
+    path_tmp = f'{path_cache}.{os.getpid()}'
+    with manifests_lock:
+        with open(path_tmp, 'w') as f:
+            json.dump({k: m for k, m in manifests.items() if k in used}, f, separators=(',', ':'))
+    os.replace(path_tmp, path_cache)
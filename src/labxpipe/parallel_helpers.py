@@ -10,8 +10,11 @@
 
 """Helper functions for parallel processing of runs."""
 
+import concurrent.futures
 import os
 
+from . import manifest
+
 def format2ext(pff):
     pff_split = pff.split('+')
     if len(pff_split) == 1:
@@ -59,7 +62,7 @@ def get_count_jobs(merging_schema,
                         p = os.path.join(path_root_bam, ref+'.sam')
                     else:
                         p = os.path.join(path_root_bam, ref+'.bam')
-                if os.path.exists(p):
+                if manifest.exists(p):
                     job[key_input].append(p)
         if check:
             assert len(job[key_input]) > 0, f"No SAM/BAM found for {run['refs']}"
@@ -76,9 +79,91 @@ def get_count_jobs(merging_schema,
             job['profile_paths'] = [os.path.join(path_root_output, run['name'] + label_suffix + '_profiles' + format2ext(pff)) for pff in profile_formats]
 
         # Add job with BAM total file size
-        jobs.append([job, sum([os.path.getsize(f) for f in job[key_input]])])
+        jobs.append([job, sum([manifest.get_size(f) for f in job[key_input]])])
 
     # Sort job(s) by BAM size
     jobs.sort(key=lambda j: j[1], reverse=True)
 
     return [j[0] for j in jobs]
+
+def get_input_size(job):
+    """Total size of GeneAbacus job input(s)."""
+    paths = job.get('path_bam', job.get('path_sam'))
+    if paths is None:
+        return 0
+    if isinstance(paths, str):
+        paths = paths.split(',')
+    return sum([manifest.get_size(p) for p in paths])
+
+def get_num_thread(size, sizes_pending, size_running, num_free, num_processor, scaling):
+    """Number of thread(s) of job of size (largest of sizes_pending, which includes it)."""
+    total = sum(sizes_pending) + size_running
+    # Job shouldn't run longer than remaining work shared by all processors
+    n = 1
+    while n < len(scaling) and size / scaling[n - 1] > total / num_processor:
+        n += 1
+    # Last jobs share free processors proportionally to their size
+    if len(sizes_pending) <= num_free and sum(sizes_pending) > 0:
+        n = max(n, min(len(scaling), round(num_free * size / sum(sizes_pending))))
+    return max(1, min(n, num_free))
+
+def set_num_worker(job, num_thread):
+    return {**job, 'num_worker': str(num_thread)}
+
+def run_planned(fn, jobs, num_processor=1, sizes=None, scaling=None, num_thread=None, set_num_thread=None, reserved=None):
+    """Run jobs within num_processor, choosing the number of concurrent jobs and the number of thread(s) of each job.
+
+    Largest jobs start first. Thread(s) are set with set_num_thread(job, n) when a job starts: Processors freed by
+    finished jobs are given to next jobs. scaling is the measured speedup of a job with its number of threads (index 0
+    is 1 thread; jobs get at most as many threads as its length). Without scaling, each job gets num_thread thread(s)
+    (not set if None, using one processor). reserved is the number of processors used by each job in addition to its
+    threads (i.e. helper processes): A job starts once they are free (or if no other job is running).
+    Returns 0 or 130 if KeyboardInterrupt was captured (as pyfnutils.parallel.run)."""
+    if sizes is None:
+        sizes = [get_input_size(job) for job in jobs]
+    if set_num_thread is None:
+        set_num_thread = set_num_worker
+    if reserved is None:
+        reserved = [0] * len(jobs)
+    pending = sorted(zip(sizes, range(len(jobs))), key=lambda j: j[0], reverse=True)
+    running = {}
+    num_free = num_processor
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(num_processor, len(jobs)))) as executor:
+        try:
+            while len(pending) > 0 or len(running) > 0:
+                # Start jobs while processors are free
+                while len(pending) > 0 and num_free > 0:
+                    size, i = pending[0]
+                    if scaling is None:
+                        n = num_thread
+                        width = (1 if n is None else n) + reserved[i]
+                        if num_free < width and len(running) > 0:
+                            break
+                    else:
+                        if num_free - reserved[i] < 1 and len(running) > 0:
+                            break
+                        n = get_num_thread(size, [s for s, j in pending], sum([r[1] for r in running.values()]), max(1, num_free - reserved[i]), num_processor, scaling)
+                        width = n + reserved[i]
+                    pending.pop(0)
+                    if n is None:
+                        job = jobs[i]
+                    else:
+                        job = set_num_thread(jobs[i], n)
+                    if isinstance(job, list) or isinstance(job, tuple):
+                        f = executor.submit(fn, *job)
+                    elif isinstance(job, dict):
+                        f = executor.submit(fn, **job)
+                    else:
+                        f = executor.submit(fn, job)
+                    running[f] = (width, size)
+                    num_free -= width
+                # Wait for a job to finish
+                done, not_done = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for f in done:
+                    num_free += running.pop(f)[0]
+                    f.result()
+        except KeyboardInterrupt:
+            for f in running:
+                f.cancel()
+            return 130
+    return 0
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Pipeline step graph."""
+
+import os
+import stat
+
+def get_step_function(op):
+    return op.get('step_function', op['step_name'])
+
+def get_index(analysis, step_name):
+    for iop, op in enumerate(analysis):
+        if op['step_name'] == step_name:
+            return iop
+    return None
+
+def get_chained_input(analysis, iop):
+    """Step providing path_in to step iop ('input' for the pipeline input)."""
+    op = analysis[iop]
+    if 'step_input' in op:
+        return op['step_input']
+    elif iop == 0:
+        return 'input'
+    else:
+        return analysis[iop-1]['step_name']
+
+def get_chained_path_input(analysis, iop, path_analysis, path_input_first):
+    """Path given as path_in to step iop."""
+    step_name = get_chained_input(analysis, iop)
+    if step_name == 'input':
+        return path_input_first
+    else:
+        return os.path.join(path_analysis, step_name)
+
+def get_input_steps(analysis, iop):
+    """Steps read by step iop: steps referenced in inputs and, if used, the chained input."""
+    op = analysis[iop]
+    if 'inputs' in op:
+        steps = [ipt['step'] for ipt in op['inputs'] if 'step' in ipt]
+        if len(steps) < len(op['inputs']):
+            steps.append(get_chained_input(analysis, iop))
+    else:
+        steps = [get_chained_input(analysis, iop)]
+    return steps
+
+def get_last_consumers(analysis):
+    """Index of the last step reading the output of each step. Cleaning steps aren't consumers."""
+    last_consumers = {}
+    for iop, op in enumerate(analysis):
+        if get_step_function(op) == 'cleaning':
+            continue
+        for step_name in get_input_steps(analysis, iop):
+            last_consumers[step_name] = iop
+    return last_consumers
+
+def get_eager_cleanings(analysis):
+    """Patterns of eager cleaning step(s) removable before their cleaning step.
+
+    Returns a list of [index of step after which pattern can be removed, index of cleaning step, cleaning parameters]."""
+    last_consumers = get_last_consumers(analysis)
+    cleanings = []
+    for iop, op in enumerate(analysis):
+        if get_step_function(op) == 'cleaning' and op.get('eager', False):
+            for step in op['steps']:
+                iproducer = get_index(analysis, step['step_name'])
+                if iproducer is None:
+                    continue
+                iready = max(iproducer, last_consumers.get(step['step_name'], iproducer))
+                if iready < iop:
+                    cleanings.append([iready, iop, step])
+    return cleanings
+
+def get_fanout_group(analysis, iop, is_capable, is_pending):
+    """Consecutive steps starting at iop able to run concurrently reading shared input(s).
+
+    Steps must be able to read fan-out input(s) (is_capable), need to run (is_pending) and not read output of another step in the group."""
+    group = [iop]
+    for inext in range(iop + 1, len(analysis)):
+        if not is_capable(analysis[inext]) or not is_pending(inext):
+            break
+        names = [analysis[i]['step_name'] for i in group]
+        if any([s in names for s in get_input_steps(analysis, inext)]):
+            break
+        group.append(inext)
+    return group
+
+def get_disk_usage(path):
+    """Total size of files in path. Symlinks (i.e. input) aren't followed."""
+    usage = 0
+    for p, dirs, files in os.walk(path):
+        for fname in files:
+            try:
+                st = os.lstat(os.path.join(p, fname))
+            except OSError:
+                continue
+            if not stat.S_ISLNK(st.st_mode):
+                usage += st.st_size
+    return usage
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Read GeneAbacus binary profiles."""
+
+import functools
+import glob
+import hashlib
+import json
+import os
+import re
+import subprocess
+import tempfile
+
+import numpy as np
+
+from . import bigwig
+from . import compression
+from . import utils
+
+region_regex = re.compile(r'^([^:]+)(?::([\d,]+)-([\d,]+))?$')
+
+@functools.lru_cache(maxsize=None)
+def get_offsets(path_genome):
+    """Offset (in values) and size of chromosomes, and total size."""
+    offsets = {}
+    offset = 0
+    for chrom, size in bigwig.read_genome(path_genome):
+        offsets[chrom] = (offset, size)
+        offset += size
+    return offsets, offset
+
+def parse_region(region, path_genome=None):
+    """Region 'chrom:start-end' (1-based, inclusive as in genome browsers) to 0-based half-open coordinates.
+    Without start-end, the whole chromosome is used (path_genome required)."""
+    m = region_regex.match(region.strip())
+    if m is None:
+        raise ValueError(f'Invalid region {region}')
+    chrom = m.group(1)
+    if m.group(2) is None:
+        if path_genome is None:
+            raise ValueError(f'Chromosome size required for region {region}')
+        offsets = get_offsets(path_genome)[0]
+        if chrom not in offsets:
+            raise ValueError(f'Unknown chromosome {chrom}')
+        return chrom, 0, offsets[chrom][1]
+    start = int(m.group(2).replace(',', '')) - 1
+    end = int(m.group(3).replace(',', ''))
+    if start < 0 or end <= start:
+        raise ValueError(f'Invalid region {region}')
+    return chrom, start, end
+
+def get_path_cached(path, path_cache):
+    st = os.stat(path)
+    key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+    return os.path.join(path_cache, 'profiles', f'{key}_{st.st_size}_{st.st_mtime_ns}.bin')
+
+def decompress(path, path_cached, num_decompress_processor=None):
+    """Decompress path once into path_cached (previous versions of path are removed)."""
+    path_dir = os.path.dirname(path_cached)
+    os.makedirs(path_dir, exist_ok=True)
+    fd, path_tmp = tempfile.mkstemp(dir=path_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            subprocess.run(compression.get_decompress_cmd(path, num_decompress_processor, fmt=compression.get_format_from_ext(path)) + [path], stdout=f, check=True)
+        os.replace(path_tmp, path_cached)
+    except:
+        os.remove(path_tmp)
+        raise
+    prefix = os.path.basename(path_cached).split('_')[0]
+    for p in glob.glob(os.path.join(path_dir, prefix + '_*.bin')):
+        if p != path_cached:
+            os.remove(p)
+
+class Profile:
+    """Memory-mapped binary profile. Compressed profiles are decompressed once in cache."""
+
+    def __init__(self, path, path_genome, path_cache=None, num_decompress_processor=None):
+        self.path = path
+        self.offsets, length = get_offsets(path_genome)
+        if compression.get_format_from_ext(path) is None:
+            path_data = path
+        else:
+            if path_cache is None:
+                path_cache = utils.get_path_cache()
+            path_data = get_path_cached(path, path_cache)
+            if not os.path.exists(path_data):
+                decompress(path, path_data, num_decompress_processor)
+        self.values = np.memmap(path_data, dtype=bigwig.profile_dtype, mode='r')
+        if len(self.values) != length:
+            raise ValueError(f'{path} has {len(self.values)} values, {path_genome} has {length} positions')
+
+    def query(self, chrom, start, end):
+        if chrom not in self.offsets:
+            raise ValueError(f'Unknown chromosome {chrom}')
+        offset, size = self.offsets[chrom]
+        if start < 0 or end > size or start > end:
+            raise ValueError(f'Region {chrom}:{start}-{end} outside {chrom} (size {size})')
+        return np.asarray(self.values[offset + start:offset + end])
+
+@functools.lru_cache(maxsize=256)
+def open_profile(path, path_genome, path_cache=None, mtime_ns=None):
+    return Profile(path, path_genome, path_cache)
+
+def query(paths, path_genome, chrom, start, end, path_cache=None):
+    """Values of region in each profile."""
+    return [open_profile(p, path_genome, path_cache, os.stat(p).st_mtime_ns).query(chrom, start, end) for p in paths]
+
+def read_total(path_report):
+    """Number of reads in profile (output of GeneAbacus report)."""
+    return json.load(open(path_report))['output']
+
+def sum_profiles(paths, path_genome, scales=None, path_cache=None):
+    """Sum of profiles per chromosome, each profile optionally multiplied by its scale: Yields (chrom, values)."""
+    profiles = [open_profile(p, path_genome, path_cache, os.stat(p).st_mtime_ns) for p in paths]
+    if scales is None:
+        scales = [1.] * len(profiles)
+    for chrom, (offset, size) in get_offsets(path_genome)[0].items():
+        values = np.zeros(size, dtype=bigwig.profile_dtype)
+        for profile, scale in zip(profiles, scales):
+            if scale == 1.:
+                values += profile.values[offset:offset + size]
+            else:
+                values += scale * profile.values[offset:offset + size]
+        yield chrom, values
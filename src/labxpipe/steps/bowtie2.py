@@ -11,6 +11,7 @@
 import logging
 import os
 
+from .. import compression
 from ..interfaces import if_exe_bowtie2
 from ..interfaces import if_exe_samtools
 from ..utils import get_fastqs_per_end
@@ -31,10 +32,10 @@ def run(path_in, path_out, params):
     # Keep output SAM if BAM is requested by user
     compress_sam_cmd = params.get('compress_sam_cmd')
     if params.get('compress_sam', False) and compress_sam_cmd is None:
-        if params.get('create_bam', False) or params.get('index_bam', False):
-            compress_sam_cmd = ['zstd', '--keep', '-12']
-        else:
-            compress_sam_cmd = ['zstd', '--rm', '-12']
+        keep = params.get('create_bam', False) or params.get('index_bam', False)
+        compress_sam_cmd = compression.get_policy_compress_cmd(params, params['step_name'], params['output'], num_processor=params['num_processor'], keep=keep)
+        if compress_sam_cmd is None:
+            compress_sam_cmd = compression.get_compress_cmd('zstd', level=12, num_processor=params['num_processor'], keep=keep)
         logger.info(f'Output compression using {compress_sam_cmd}')
 
     # Input
@@ -12,6 +12,7 @@ import glob
 import logging
 import os
 
+from .. import compression
 from ..interfaces import if_exe_bwa_mem2
 from ..interfaces import if_exe_samtools
 from ..utils import get_fastqs_per_end
@@ -32,10 +33,10 @@ def run(path_in, path_out, params):
     # Keep output SAM if BAM is requested by user
     compress_output_cmd = params.get('compress_output_cmd')
     if params.get('compress_output', False) and compress_output_cmd is None:
-        if params.get('create_bam', False) or params.get('index_bam', False):
-            compress_output_cmd = ['zstd', '--keep', '-12', f"-T{params['num_processor']}"]
-        else:
-            compress_output_cmd = ['zstd', '--rm', '-12', f"-T{params['num_processor']}"]
+        keep = params.get('create_bam', False) or params.get('index_bam', False)
+        compress_output_cmd = compression.get_policy_compress_cmd(params, params['step_name'], params['output'], num_processor=params['num_processor'], keep=keep)
+        if compress_output_cmd is None:
+            compress_output_cmd = compression.get_compress_cmd('zstd', level=12, num_processor=params['num_processor'], keep=keep)
         logger.info(f'Output compression using {compress_output_cmd}')
 
     # Input
@@ -64,6 +65,7 @@ def run(path_in, path_out, params):
         outfile=os.path.join(path_out, params['output']),
         index=os.path.join(params['path_bwa-mem2_index'], params['index']),
         num_processor=str(params['num_processor']),
+        num_decompress_processor=params.get('num_decompress_processor'),
         compress_output=params.get('compress_output', False),
         compress_output_cmd=compress_output_cmd,
         others=others,
@@ -17,6 +17,24 @@ from ..utils import write_report
 functions = ['cleaning']
 
 
+def clean_pattern(path_root, step, logger):
+    # Cleaning parameters
+    pattern = step.get('pattern', '*')
+    max_size = step.get('max_size')
+    # If no cleaning parameters is defined, only clean based on size
+    if 'pattern' not in step and 'max_size' not in step:
+        max_size = 20 * 1024 * 1024
+
+    saved_space = 0
+    for f in glob.glob(os.path.join(path_root, step['step_name'], pattern)):
+        fsize = os.path.getsize(f)
+        if max_size is None or fsize > max_size:
+            logger.info(f'Removing {f}')
+            os.remove(f)
+            saved_space += fsize
+    return saved_space
+
+
 def run(path_in, path_out, params):
     # Parameters
     logger = logging.getLogger(params['logger_name'] + '.' + params['step_name'])
@@ -27,20 +45,15 @@ def run(path_in, path_out, params):
     # Clean
     saved_space = 0
     for step in params['steps']:
-        # Cleaning parameters
-        pattern = step.get('pattern', '*')
-        max_size = step.get('max_size')
-        # If no cleaning parameters is defined, only clean based on size
-        if 'pattern' not in step and 'max_size' not in step:
-            max_size = 20 * 1024 * 1024
-
-        for f in glob.glob(os.path.join(path_root, step['step_name'], pattern)):
-            fsize = os.path.getsize(f)
-            if max_size is None or os.path.getsize(fsize) > max_size:
-                logger.info(f'Removing {f}')
-                os.remove(f)
-                saved_space += fsize
+        saved_space += clean_pattern(path_root, step, logger)
 
     # Report
     logger.info('Report: Writing stats')
-    write_report(os.path.join(path_out, params['step_name'] + '_report'), {'saved_space': saved_space})
+    report = {'saved_space': saved_space}
+    # Eager cleaning and disk usage (measured by runner)
+    if 'disk_usage' in params:
+        eager_saved_space = params['disk_usage']['eager_saved_space'].get(params['step_name'], 0)
+        report['saved_space'] += eager_saved_space
+        report['eager_saved_space'] = eager_saved_space
+        report['peak_disk_usage'] = params['disk_usage']['peak']
+    write_report(os.path.join(path_out, params['step_name'] + '_report'), report)
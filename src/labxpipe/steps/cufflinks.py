@@ -11,6 +11,7 @@
 import logging
 import os
 
+from .. import compression
 from ..interfaces import if_exe_cufflinks
 
 functions = ['cufflinks']
@@ -28,7 +29,7 @@ def run(path_in, path_out, params):
                 path_input = os.path.join(params['path_analysis'], ipt['step'])
             else:
                 path_input = path_in
-            inputs.append((os.path.join(path_input, ipt['fname']), ipt.get('suffix', ''), ipt.get('type', 'bam')))
+            inputs.append((compression.find_path(os.path.join(path_input, ipt['fname'])), ipt.get('suffix', ''), ipt.get('type', 'bam')))
     else:
         inputs = [(os.path.join(path_in, 'accepted_hits.bam'), '', 'bam')]
 
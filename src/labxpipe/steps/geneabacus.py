@@ -8,29 +8,122 @@
 # file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
 #
 
+import concurrent.futures
 import logging
 import os
 
 import pyfnutils as pfu
 import pyfnutils.parallel
 
+from .. import compression
+from .. import fanout
 from ..interfaces import if_exe_geneabacus
-from ..interfaces import if_exe_bg2bw
 from .. import parallel_helpers
 
 functions = ['counting', 'geneabacus']
 
 
-def run(path_in, path_out, params):
-    # Parameters
-    logger = logging.getLogger(params['logger_name'] + '.' + params['step_name'])
+def get_path_features(feature, params):
+    if 'path_json' in feature:
+        if not os.path.exists(feature['path_json']):
+            return os.path.join(params['path_annots'], feature['path_json']), None
+        else:
+            return feature['path_json'], None
+    elif 'path_tab' in feature:
+        if not os.path.exists(feature['path_tab']):
+            return os.path.join(params['path_annots'], feature['path_tab']), 'tab'
+        else:
+            return feature['path_tab'], 'tab'
+    else:
+        raise ValueError('Missing path_json or path_tab')
+
+
+def count_native(inputs, features, path_out, params, logger):
+    from .. import counting
+
+    # Features
+    all_features = []
+    for feature in features:
+        path_features, format_features = get_path_features(feature, params)
+        logger.info(f'Loading {path_features}')
+        all_features.append(
+            counting.load_features(
+                path_features,
+                format_features,
+                fon_name=feature.get('fon_name'),
+                fon_chrom=feature.get('fon_chrom'),
+                fon_coords=feature.get('fon_coords'),
+                fon_strand=feature.get('fon_strand'),
+            )
+        )
+
+    # Executable
+    if 'path_samtools' in params:
+        samtools_exe = os.path.join(params['path_samtools'], 'samtools')
+    else:
+        samtools_exe = None
+
+    for path_input, output_suffix, input_type in inputs:
+        # Count all features in one pass
+        counters = [
+            counting.Counter(fs, f.get('count_multis', [1, 2, 900]), params.get('r1_strand'), f.get('read_min_overlap'))
+            for f, fs in zip(features, all_features)
+        ]
+        totals = counting.count(
+            path_input,
+            input_type,
+            counters,
+            paired=params.get('paired'),
+            ignore_nh_tag=params.get('ignore_nh_tag'),
+            num_decompress_processor=params.get('num_decompress_processor'),
+            samtools_exe=samtools_exe,
+            logger=logger,
+        )
+        # Write (reference features are last)
+        for feature, counter, total in zip(features, counters, totals):
+            if 'count_reference' in feature:
+                norm_totals = counting.read_totals(os.path.join(path_out, feature['count_reference'] + '.csv'), counter.count_multis)
+            else:
+                norm_totals = None
+            counter.write(
+                os.path.join(path_out, feature['name'] + output_suffix + '.csv'),
+                os.path.join(path_out, feature['name'] + output_suffix + '_report.json'),
+                total,
+                norm_totals,
+            )
+
+
+def add_to_store(inputs, features, path_out, params, logger):
+    """Add count tables of run to project count store."""
+    from .. import counts
 
+    path_store = counts.get_path_store(params['count_store'], params['path_output'], params['name'])
+    logger.info(f'Adding counts to {path_store}')
+    with counts.CountStore(path_store) as store:
+        for path_input, output_suffix, input_type in inputs:
+            for feature in features:
+                path_counts = os.path.join(path_out, feature['name'] + output_suffix + '.csv')
+                store.add_table(feature['name'] + output_suffix, params['seq_ref'], path_counts, params.get('count_store_columns'))
+
+
+def convert_profile(path_input, path_chrom_list, path_outfile, writer=None, input_format='bedgraph', logger=None):
+    from .. import bigwig
+
+    if input_format == 'binary':
+        logger.info(f'Converting {path_input} to {path_outfile}')
+        bigwig.profile_to_bigwig(path_input, path_chrom_list, path_outfile)
+    else:
+        bigwig.convert_bedgraph(path_input, path_chrom_list, path_outfile, writer=writer, logger=logger)
+
+
+def get_features(params):
     # Reference features first
-    features = [f for f in params['features'] if 'count_reference' not in f] + [
+    return [f for f in params['features'] if 'count_reference' not in f] + [
         f for f in params['features'] if 'count_reference' in f
     ]
 
-    # Input
+
+def get_inputs(path_in, params):
     if 'inputs' in params:
         inputs = []
         for ipt in params['inputs']:
@@ -38,9 +131,76 @@ def run(path_in, path_out, params):
                 path_input = os.path.join(params['path_analysis'], ipt['step'])
             else:
                 path_input = path_in
-            inputs.append((os.path.join(path_input, ipt['fname']), ipt.get('suffix', ''), ipt.get('type', 'bam')))
+            inputs.append((compression.find_path(os.path.join(path_input, ipt['fname'])), ipt.get('suffix', ''), ipt.get('type', 'bam')))
     else:
         inputs = [(os.path.join(path_in, 'accepted_hits.bam'), '', 'bam')]
+    return inputs
+
+
+def split_features(features, params):
+    """Features counted natively and with GeneAbacus. Features normalized with a count_reference counted by GeneAbacus are
+    also counted by GeneAbacus (native counting runs first)."""
+    if params.get('backend') == 'numpy' and len(params.get('options', [])) == 0:
+        from .. import counting
+
+        native_features = [f for f in features if counting.is_supported(f)]
+        native_names = [f['name'] for f in native_features]
+        native_features = [f for f in native_features if 'count_reference' not in f or f['count_reference'] in native_names]
+        return native_features, [f for f in features if f not in native_features]
+    else:
+        return [], features
+
+
+def is_native_reference(native_features, features):
+    """GeneAbacus features normalized with a count_reference counted natively: Native counting then runs first, reading its
+    input(s) directly instead of from a fan-out."""
+    native_names = [f['name'] for f in native_features]
+    return any([f.get('count_reference') in native_names for f in features])
+
+
+def set_num_worker_streamed(job, num_thread):
+    return {**job, 'kwargs': parallel_helpers.set_num_worker(job['kwargs'], num_thread)}
+
+
+def fanout_inputs(path_in, params):
+    """SAM input(s) read by this step: once by native counting (unless it runs first) and once per GeneAbacus feature (except
+    count_reference ones)."""
+    native_features, features = split_features(get_features(params), params)
+    paths = []
+    for path_input, output_suffix, input_type in get_inputs(path_in, params):
+        if input_type == 'sam':
+            if len(native_features) > 0 and not is_native_reference(native_features, features):
+                paths.append(path_input)
+            paths.extend([path_input for f in features if 'count_reference' not in f])
+    return paths
+
+
+def run(path_in, path_out, params):
+    # Parameters
+    logger = logging.getLogger(params['logger_name'] + '.' + params['step_name'])
+
+    features = get_features(params)
+
+    # Input
+    inputs = get_inputs(path_in, params)
+
+    # Fan-out: Each reader gets its own FIFO and all readers must run concurrently
+    is_fanout = any([fanout.has_path(params, path_input) for path_input, output_suffix, input_type in inputs])
+
+    # Native counting (features requiring GeneAbacus, i.e. profiles, are counted with GeneAbacus)
+    native_features, features = split_features(features, params)
+    native_first = is_native_reference(native_features, features)
+    native_inputs = []
+    for path_input, output_suffix, input_type in inputs:
+        if input_type == 'sam' and len(native_features) > 0 and not native_first:
+            path_input = fanout.take_path(params, path_input)
+        native_inputs.append((path_input, output_suffix, input_type))
+    if len(native_features) > 0 and (not is_fanout or len(features) == 0 or native_first):
+        count_native(native_inputs, native_features, path_out, params, logger)
+    if len(features) == 0:
+        if params.get('count_store'):
+            add_to_store(inputs, native_features, path_out, params, logger)
+        return
 
     # Executable
     if 'path_geneabacus' in params:
@@ -52,24 +212,12 @@ def run(path_in, path_out, params):
     logger.info(f'Using GeneAbacus {if_exe_geneabacus.get_geneabacus_version(geneabacus_exe)}')
 
     jobs = []
+    jobs_conversions = []
     convert_jobs = []
     for path_input, output_suffix, input_type in inputs:
         for feature in features:
             # Features
-            format_features = None
-            if 'path_json' in feature:
-                if not os.path.exists(feature['path_json']):
-                    path_features = os.path.join(params['path_annots'], feature['path_json'])
-                else:
-                    path_features = feature['path_json']
-            elif 'path_tab' in feature:
-                if not os.path.exists(feature['path_tab']):
-                    path_features = os.path.join(params['path_annots'], feature['path_tab'])
-                else:
-                    path_features = feature['path_tab']
-                format_features = 'tab'
-            else:
-                raise ValueError('Missing path_json or path_tab')
+            path_features, format_features = get_path_features(feature, params)
 
             # Count multis
             if 'count_multis' in feature:
@@ -128,6 +276,7 @@ def run(path_in, path_out, params):
                 'profile_no_coord_mapping': feature.get('profile_no_coord_mapping'),
                 'path_sam_out': path_sam_out,
                 'num_worker': str(min(params['num_processor'], 3)),
+                'num_decompress_processor': params.get('num_decompress_processor'),
                 'others': params.get('options', []) + feature.get('options', []),
                 'exe': geneabacus_exe,
                 'logger': logger,
@@ -135,8 +284,12 @@ def run(path_in, path_out, params):
             if input_type == 'bam':
                 job['path_bam'] = path_input
             elif input_type == 'sam':
-                job['path_sam'] = path_input
+                if 'count_reference' in feature:
+                    job['path_sam'] = path_input
+                else:
+                    job['path_sam'] = fanout.take_path(params, path_input)
             jobs.append(job)
+            jobs_conversions.append([])
 
             # Convert job
             if feature.get('create_bigwig', False):
@@ -144,21 +297,74 @@ def run(path_in, path_out, params):
                     path_genome = os.path.join(params['path_annots'], feature['path_genome'])
                 else:
                     path_genome = feature['path_genome']
+                from .. import bigwig
+
+                writer = params.get('bigwig_writer', feature.get('bigwig_writer'))
+                has_bedgraph = any([pp.endswith('.bedgraph') for pp in profile_paths])
                 for pp in profile_paths:
-                    if pp.endswith('.bedgraph'):
+                    if pp.endswith('.bedgraph') and bigwig.get_writer(writer) == 'native':
+                        # Converted while written by GeneAbacus
+                        jobs_conversions[-1].append((pp, path_genome, pp[: -1 * len('bedgraph')] + 'bw'))
+                    elif pp.endswith('.bedgraph'):
                         job = {
                             'path_input': pp,
                             'path_chrom_list': path_genome,
                             'path_outfile': pp[: -1 * len('bedgraph')] + 'bw',
+                            'writer': writer,
+                            'logger': logger,
+                        }
+                        convert_jobs.append(job)
+                    elif pp.find('.bin') != -1 and not has_bedgraph and format_features == 'tab':
+                        # Binary profile of chromosomes (native writer only)
+                        job = {
+                            'path_input': pp,
+                            'path_chrom_list': path_features,
+                            'path_outfile': pp[: pp.rindex('.bin')] + '.bw',
+                            'writer': 'native',
+                            'input_format': 'binary',
                             'logger': logger,
                         }
                         convert_jobs.append(job)
 
+    # Streamed bigWig conversion
+    paths_sam = [job.get('path_sam') for job in jobs]
+    if any([len(c) > 0 for c in jobs_conversions]):
+        from .. import bigwig
+
+        fn_job = bigwig.run_streamed
+        jobs = [{'fn': if_exe_geneabacus.geneabacus, 'kwargs': job, 'conversions': c, 'logger': logger} for job, c in zip(jobs, jobs_conversions)]
+    else:
+        fn_job = if_exe_geneabacus.geneabacus
+
     # Run job(s)
-    r = pfu.parallel.run(if_exe_geneabacus.geneabacus, jobs, num_processor=max(1, params['num_processor'] // 3))
-    if r == 130:
-        raise KeyboardInterrupt
+    if is_fanout:
+        # All readers run concurrently: A failing reader releases its FIFO(s) to not block the other readers
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(jobs) + 1) as executor:
+            fs = [executor.submit(fanout.run_reader, fn_job, path_sam, **job) for job, path_sam in zip(jobs, paths_sam)]
+            if len(native_features) > 0 and not native_first:
+                fs.append(
+                    executor.submit(
+                        fanout.run_reader, count_native, [n[0] for n in native_inputs], native_inputs, native_features, path_out, params, logger
+                    )
+                )
+            for f in fs:
+                f.result()
+    else:
+        # Concurrent jobs and their number of worker(s) planned from input sizes
+        if fn_job is if_exe_geneabacus.geneabacus:
+            sizes = [parallel_helpers.get_input_size(job) for job in jobs]
+            set_num_thread = parallel_helpers.set_num_worker
+        else:
+            sizes = [parallel_helpers.get_input_size(job['kwargs']) for job in jobs]
+            set_num_thread = set_num_worker_streamed
+        r = parallel_helpers.run_planned(fn_job, jobs, num_processor=params['num_processor'], sizes=sizes, scaling=params.get('geneabacus_scaling'), num_thread=min(params['num_processor'], 3), set_num_thread=set_num_thread)
+        if r == 130:
+            raise KeyboardInterrupt
     if len(convert_jobs) > 0:
-        r = pfu.parallel.run(if_exe_bg2bw.bg2bw, convert_jobs, num_processor=params['num_processor'])
+        r = pfu.parallel.run(convert_profile, convert_jobs, num_processor=params['num_processor'])
         if r == 130:
             raise KeyboardInterrupt
+
+    # Project count store
+    if params.get('count_store'):
+        add_to_store(inputs, native_features + features, path_out, params, logger)
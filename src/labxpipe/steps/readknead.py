@@ -11,6 +11,7 @@
 import logging
 import os
 
+from .. import compression
 from ..interfaces import if_exe_readknead
 from ..utils import get_fastqs_per_end
 
@@ -74,44 +75,34 @@ def run(path_in, path_out, params):
         fq_fname_out_r2 = None
 
     # Parameters: command input and output path(s)
-    if fq_fname_out_r1.endswith('.gz'):
-        fq_command_in = 'zcat'
-        fq_fname_out_r1 = fq_fname_out_r1[:-3]
-        if fq_fname_out_r2 is not None:
-            fq_fname_out_r2 = fq_fname_out_r2[:-3]
-    elif fq_fname_out_r1.endswith('.lz4'):
-        fq_command_in = 'lz4cat'
-        fq_fname_out_r1 = fq_fname_out_r1[:-4]
-        if fq_fname_out_r2 is not None:
-            fq_fname_out_r2 = fq_fname_out_r2[:-4]
-    elif fq_fname_out_r1.endswith('.zst'):
-        fq_command_in = 'zstdcat'
-        fq_fname_out_r1 = fq_fname_out_r1[:-4]
-        if fq_fname_out_r2 is not None:
-            fq_fname_out_r2 = fq_fname_out_r2[:-4]
-    else:
-        fq_command_in = None
+    fq_command_in = compression.get_decompress_cmd(fq_files[0][0], params.get('num_decompress_processor'))
+    if fq_command_in is not None:
+        fq_command_in = ','.join(fq_command_in)
+    fq_fname_out_r1 = compression.strip_ext(fq_fname_out_r1)
+    if fq_fname_out_r2 is not None:
+        fq_fname_out_r2 = compression.strip_ext(fq_fname_out_r2)
 
     # Parameters: command output and output path(s)
     fq_command_out = None
     if params.get('fastq_out', True):
         fq_path_out = path_out
-        if 'zip_fastq_out' in params and params['zip_fastq_out'] is not None:
-            if params['zip_fastq_out'] == 'gzip':
-                fq_command_out = 'gzip,-'
-                fq_fname_out_r1 += '.gz'
-                if fq_fname_out_r2 is not None:
-                    fq_fname_out_r2 += '.gz'
-            elif params['zip_fastq_out'] == 'lz4':
-                fq_command_out = 'lz4,-'
-                fq_fname_out_r1 += '.lz4'
-                if fq_fname_out_r2 is not None:
-                    fq_fname_out_r2 += '.lz4'
-            elif params['zip_fastq_out'] == 'zst':
-                fq_command_out = 'zstd,-,-o'
-                fq_fname_out_r1 += '.zst'
-                if fq_fname_out_r2 is not None:
-                    fq_fname_out_r2 += '.zst'
+        # Codec from parameter or compression policy
+        zip_fastq_out = params.get('zip_fastq_out')
+        zip_level = None
+        if zip_fastq_out is None:
+            codec = compression.get_policy_codec(params, params['step_name'], fq_fname_out_r1)
+            if codec is not None:
+                zip_fastq_out = codec['codec']
+                zip_level = codec.get('level')
+        if zip_fastq_out == 'zst':
+            zip_fastq_out = 'zstd'
+        if zip_fastq_out is not None:
+            fq_command_out = compression.get_pipe_compress_cmd(zip_fastq_out, zip_level)
+            if fq_command_out is None:
+                raise ValueError(f'Unsupported FASTQ output compression {zip_fastq_out}')
+            fq_fname_out_r1 += compression.get_ext(zip_fastq_out)
+            if fq_fname_out_r2 is not None:
+                fq_fname_out_r2 += compression.get_ext(zip_fastq_out)
     else:
         fq_path_out = None
         fq_fname_out_r1 = None
@@ -12,12 +12,30 @@ import logging
 import os
 import subprocess
 
+from .. import compression
+from .. import fanout
 from ..interfaces import if_exe_samtools
 from ..utils import write_report
 
 functions = ['samtools_sort']
 
 
+def get_input(path_in, params):
+    if 'input' in params:
+        return compression.find_path(os.path.join(path_in, params['input']))
+    else:
+        return os.path.join(path_in, 'accepted_hits.bam')
+
+
+def fanout_inputs(path_in, params):
+    """SAM input read once by samtools sort."""
+    path_input_sam = get_input(path_in, params)
+    if path_input_sam.endswith('.bam') or path_input_sam.endswith('.cram'):
+        return []
+    else:
+        return [path_input_sam]
+
+
 def run(path_in, path_out, params):
     # Parameters
     logger = logging.getLogger(params['logger_name'] + '.' + params['step_name'])
@@ -28,10 +46,7 @@ def run(path_in, path_out, params):
         others.extend(params['options'])
 
     # Input path
-    if 'input' in params:
-        path_input_sam = os.path.join(path_in, params['input'])
-    else:
-        path_input_sam = os.path.join(path_in, 'accepted_hits.bam')
+    path_input_sam = get_input(path_in, params)
     # Check input exists
     if not os.path.exists(path_input_sam):
         raise FileNotFoundError(f'{path_input_sam} not found')
@@ -50,13 +65,20 @@ def run(path_in, path_out, params):
     # Version
     logger.info(f'Using samtools {if_exe_samtools.get_samtools_version(samtools_exe)}')
 
+    # Fan-out: samtools reads the shared decompressed stream (read once, input isn't available for report)
+    is_fanout = fanout.has_path(params, path_input_sam)
+    if is_fanout:
+        path_input_sam = fanout.take_path(params, path_input_sam)
     # Decompress SAM if necessary
-    if path_input_sam.endswith('.zst'):
-        cmd = ['zstd', '--decompress', '--keep', path_input_sam, '--output-dir-flat', path_out]
-        logger.info('Starting zstd with ' + str(cmd))
-        subprocess.run(cmd, check=True)
-        # Update input path
-        path_input_sam = os.path.join(path_out, os.path.basename(path_input_sam[:-4]))
+    elif not path_input_sam.endswith('.bam') and not path_input_sam.endswith('.cram'):
+        cmd = compression.get_decompress_cmd(path_input_sam, params.get('num_decompress_processor', params['num_processor']))
+        if cmd is not None:
+            cmd.append(path_input_sam)
+            # Update input path
+            path_input_sam = os.path.join(path_out, os.path.basename(compression.strip_ext(path_input_sam)))
+            logger.info('Starting decompression with ' + str(cmd))
+            with open(path_input_sam, 'wb') as f:
+                subprocess.run(cmd, stdout=f, check=True)
 
     # Prepare samtools command
     cmd = [samtools_exe, 'sort', '--threads', str(params['num_processor']), '-o', path_output_sam]
@@ -81,16 +103,17 @@ def run(path_in, path_out, params):
 
     # Run
     logger.info('Starting samtools with ' + str(cmd))
-    subprocess.run(cmd, check=True)
+    fanout.run_reader(subprocess.run, path_input_sam, cmd, check=True)
 
     # Compute report
     logger.info('Report')
     report = {}
-    # Input
-    raw_report = if_exe_samtools.sam_stats(path_input_sam, exe=samtools_exe, logger=logger)
-    report['input'] = raw_report['reads mapped']
     # Output
     raw_report = if_exe_samtools.sam_stats(path_output_sam, exe=samtools_exe, logger=logger)
     report['output'] = raw_report['reads mapped']
+    # Input (not available if read from shared stream)
+    if not is_fanout:
+        raw_report = if_exe_samtools.sam_stats(path_input_sam, exe=samtools_exe, logger=logger)
+        report['input'] = raw_report['reads mapped']
     # Report
     write_report(os.path.join(path_out, params['step_name'] + '_report'), report)
@@ -11,6 +11,7 @@
 import logging
 import os
 
+from .. import compression
 from ..interfaces import if_exe_samtools
 from ..interfaces import if_exe_star
 from ..utils import get_fastqs_per_end
@@ -40,6 +41,14 @@ def run(path_in, path_out, params):
     # Version
     logger.info(f'Using STAR {if_exe_star.get_star_version(star_exe)}')
 
+    # Output compression from compression policy
+    compress_sam_cmd = params.get('compress_sam_cmd')
+    if compress_sam_cmd is None:
+        compress_sam_cmd = compression.get_policy_compress_cmd(params, params['step_name'], 'accepted_hits.sam', num_processor=params['num_processor'], keep=False)
+    compress_unmapped_cmd = params.get('compress_unmapped_cmd')
+    if compress_unmapped_cmd is None:
+        compress_unmapped_cmd = compression.get_policy_compress_cmd(params, params['step_name'], 'unmapped_R1.fastq', num_processor=params['num_processor'], keep=False)
+
     # Input
     fq_files = get_fastqs_per_end(path_in, params.get('paired'), params.get('fastq_exts'), params.get('read_regexs_in'))
     # Is run really paired?
@@ -61,12 +70,13 @@ def run(path_in, path_out, params):
         reads_directional=params['directional'],
         star_index=os.path.join(params['path_star_index'], params['index']),
         num_processor=str(params['num_processor']),
+        num_decompress_processor=params.get('num_decompress_processor'),
         output_type=params.get('output_type'),
         rename=params.get('rename', True),
         compress_sam=params.get('compress_sam', False),
         compress_unmapped=params.get('compress_unmapped', True),
-        compress_sam_cmd=params.get('compress_sam_cmd'),
-        compress_unmapped_cmd=params.get('compress_unmapped_cmd'),
+        compress_sam_cmd=compress_sam_cmd,
+        compress_unmapped_cmd=compress_unmapped_cmd,
         others=others,
         exe=star_exe,
         return_std=True,
@@ -12,6 +12,16 @@
 
 import os
 
+def write_if_changed(path, content):
+    """Write content to path only if different, leaving files served by the hub untouched."""
+    if os.path.exists(path):
+        with open(path, 'rt') as f:
+            if f.read() == content:
+                return False
+    with open(path, 'wt') as f:
+        f.write(content)
+    return True
+
 class Node(object):
     fields = []
 
@@ -38,12 +48,9 @@ class Hub(Node):
 
     def write(self, make_species_folder=True):
         # Hub
-        with open('hub.txt', 'wt') as f:
-            f.write(self.render() + '\n')
+        write_if_changed('hub.txt', self.render() + '\n')
         # Genome
-        with open('genomes.txt', 'wt') as f:
-            for g in self.genomes:
-                f.write(g.render() + '\n')
+        write_if_changed('genomes.txt', ''.join([g.render() + '\n' for g in self.genomes]))
         # Track
         for g, tracks in self.tracks.items():
             fpath = 'trackDb.txt'
@@ -53,9 +60,7 @@ class Hub(Node):
                     os.mkdir(species_folder)
             else:
                 species_folder = '.'
-            with open(os.path.join(species_folder, fpath), 'wt') as f:
-                for t in tracks:
-                    f.write(t.render() + '\n\n')
+            write_if_changed(os.path.join(species_folder, fpath), ''.join([t.render() + '\n\n' for t in tracks]))
 
 class Genome(Node):
     fields = ['genome',
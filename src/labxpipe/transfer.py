@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Move, link or copy files and directories: Rename, reflink or hardlink when possible, else parallel copy."""
+
+import concurrent.futures
+import errno
+import fcntl
+import hashlib
+import os
+import shutil
+
+# ioctl(2) of Linux cloning file (reflink) on Btrfs, XFS, etc.
+FICLONE = 0x40049409
+
+buffer_size = 8 * 1024 * 1024
+min_chunk_size = 256 * 1024 * 1024
+
+class Error(Exception):
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+def reflink(path_src, path_dst):
+    """Clone file (sharing data blocks). Raises OSError if not supported."""
+    with open(path_src, 'rb') as fsrc:
+        with open(path_dst, 'wb') as fdst:
+            try:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            except OSError:
+                fdst.close()
+                os.remove(path_dst)
+                raise
+
+def copy_chunk(path_src, path_dst, offset, length):
+    """Copy length bytes at offset (copy_file_range, or read/write if unsupported)."""
+    fsrc = os.open(path_src, os.O_RDONLY)
+    try:
+        fdst = os.open(path_dst, os.O_WRONLY)
+        try:
+            end = offset + length
+            if hasattr(os, 'copy_file_range'):
+                try:
+                    while offset < end:
+                        n = os.copy_file_range(fsrc, fdst, min(end - offset, 1024 * 1024 * 1024), offset, offset)
+                        if n == 0:
+                            break
+                        offset += n
+                except OSError as e:
+                    # Unsupported between these filesystems: copy remaining bytes with read/write
+                    if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL):
+                        raise
+            while offset < end:
+                buf = os.pread(fsrc, min(end - offset, buffer_size), offset)
+                if len(buf) == 0:
+                    break
+                offset += os.pwrite(fdst, buf, offset)
+        finally:
+            os.close(fdst)
+    finally:
+        os.close(fsrc)
+
+def copy_file(path_src, path_dst, num_processor=1):
+    """Copy file content in chunks copied in parallel, and metadata."""
+    size = os.path.getsize(path_src)
+    with open(path_dst, 'wb') as f:
+        f.truncate(size)
+    chunk_size = max(min_chunk_size, -(-size // max(num_processor, 1)))
+    chunks = [(offset, min(chunk_size, size - offset)) for offset in range(0, size, chunk_size)]
+    if num_processor > 1 and len(chunks) > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_processor) as executor:
+            for f in [executor.submit(copy_chunk, path_src, path_dst, offset, length) for offset, length in chunks]:
+                f.result()
+    else:
+        for offset, length in chunks:
+            copy_chunk(path_src, path_dst, offset, length)
+    shutil.copystat(path_src, path_dst)
+
+def checksum(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            buf = f.read(buffer_size)
+            if len(buf) == 0:
+                break
+            h.update(buf)
+    return h.hexdigest()
+
+def verify(path_src, path_dst):
+    """Compare checksums of both files (computed in parallel)."""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        src, dst = executor.map(checksum, [path_src, path_dst])
+    if src != dst:
+        raise Error(f'Checksum of {path_dst} differs from {path_src}')
+
+def transfer_file(path_src, path_dst, mode='move', check=False, num_processor=1):
+    """Move, copy or link a file with the first working method:
+    move: rename, reflink, hardlink then copy (source is removed).
+    copy: reflink then copy.
+    link: hardlink then symlink (source is kept).
+    With check, copied files are verified with checksums. Returns the method used."""
+    if mode not in ('move', 'copy', 'link'):
+        raise ValueError(f'Unknown transfer mode {mode}')
+    if mode == 'link':
+        try:
+            os.link(path_src, path_dst)
+            return 'hardlink'
+        except OSError:
+            os.symlink(os.path.abspath(path_src), path_dst)
+            return 'symlink'
+    if mode == 'move':
+        try:
+            os.rename(path_src, path_dst)
+            return 'rename'
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+    try:
+        reflink(path_src, path_dst)
+        method = 'reflink'
+    except OSError:
+        method = None
+    if method is None and mode == 'move':
+        try:
+            os.link(path_src, path_dst)
+            method = 'hardlink'
+        except OSError:
+            pass
+    if method is None:
+        copy_file(path_src, path_dst, num_processor)
+        method = 'copy'
+        if check:
+            verify(path_src, path_dst)
+    elif method == 'reflink':
+        shutil.copystat(path_src, path_dst)
+    if mode == 'move':
+        os.remove(path_src)
+    return method
+
+def transfer_files(pairs, mode='move', check=False, num_processor=1, logger=None):
+    """Transfer (path_src, path_dst) pairs in parallel: Processors are shared between files (largest first) and chunks of copied files."""
+    if logger is None:
+        import logging as logger
+    if len(pairs) == 0:
+        return []
+    num_file_processor = max(1, num_processor // len(pairs))
+    if num_processor > 1 and len(pairs) > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_processor) as executor:
+            fs = {}
+            for path_src, path_dst in sorted(pairs, key=lambda p: os.path.getsize(p[0]), reverse=True):
+                fs[(path_src, path_dst)] = executor.submit(transfer_file, path_src, path_dst, mode, check, num_file_processor)
+            methods = [fs[p].result() for p in pairs]
+    else:
+        methods = [transfer_file(path_src, path_dst, mode, check, num_processor) for path_src, path_dst in pairs]
+    for (path_src, path_dst), method in zip(pairs, methods):
+        logger.info(f'{path_src} -> {path_dst} ({method})')
+    return methods
+
+def transfer(path_src, path_dst, mode='move', check=False, num_processor=1, logger=None):
+    """Transfer file or directory to path_dst. Directories are renamed if possible, else their files are transferred in parallel."""
+    if logger is None:
+        import logging as logger
+    if not os.path.isdir(path_src):
+        return transfer_files([(path_src, path_dst)], mode, check, num_processor, logger)
+    if mode == 'move':
+        try:
+            os.rename(path_src, path_dst)
+            logger.info(f'{path_src} -> {path_dst} (rename)')
+            return ['rename']
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+    # Directories then files
+    pairs = []
+    for root, dirs, files in os.walk(path_src):
+        root_dst = os.path.normpath(os.path.join(path_dst, os.path.relpath(root, path_src)))
+        os.makedirs(root_dst, exist_ok=True)
+        for f in files:
+            pairs.append((os.path.join(root, f), os.path.join(root_dst, f)))
+    methods = transfer_files(pairs, mode, check, num_processor, logger)
+    for root, dirs, files in os.walk(path_src):
+        shutil.copystat(root, os.path.join(path_dst, os.path.relpath(root, path_src)))
+    if mode == 'move':
+        shutil.rmtree(path_src)
+    return methods
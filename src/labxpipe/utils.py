@@ -8,14 +8,22 @@
 # file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
 #
 
+import functools
+import hashlib
 import json
 import os
 import re
 
+from . import manifest
+
 all_exts = ['.bam', '.bedgraph', '.bin', '.bw', '.csv', '.fastq', '.json', '.log', '.pdf', '.sam', '.tab', '.txt']
 
+@functools.lru_cache(maxsize=None)
+def compile_regex(regex):
+    return re.compile(regex)
+
 def parse_fastq_filename(fname, regex=r'.+_([R,I][1,2,3])\.f'):
-    m = re.match(regex, fname)
+    m = compile_regex(regex).match(fname)
     if m:
         return m.group(1)
     else:
@@ -30,7 +38,7 @@ def get_fastqs_per_end(path_seq, paired=False, fastq_exts=None, read_regexs=None
         else:
             read_regexs = [r'.+_(R1)(\.f|_)']
     fastqs = [[] for i in range(len(read_regexs))]
-    for path, dirs, files in os.walk(path_seq, followlinks=True):
+    for path, dirs, files in manifest.walk(path_seq):
         for fname in files:
             if any([fname.endswith(e) for e in fastq_exts]):
                 for i, read_regex in enumerate(read_regexs):
@@ -39,6 +47,22 @@ def get_fastqs_per_end(path_seq, paired=False, fastq_exts=None, read_regexs=None
                         fastqs[i].append(os.path.join(path, fname))
     return fastqs
 
+def get_path_cache(config=None):
+    if config is not None and 'path_cache' in config:
+        return config['path_cache']
+    elif 'XDG_CACHE_HOME' in os.environ:
+        return os.path.join(os.environ['XDG_CACHE_HOME'], 'labxpipe')
+    else:
+        return os.path.join(os.path.expanduser('~'), '.cache', 'labxpipe')
+
+def get_fingerprint(paths=[], options=None):
+    """Fingerprint of files (path, size and mtime) and options (JSON serializable)."""
+    files = []
+    for path in paths:
+        st = os.stat(path)
+        files.append([path, st.st_size, st.st_mtime_ns])
+    return hashlib.sha1(json.dumps({'files': files, 'options': options}, sort_keys=True, default=str).encode()).hexdigest()
+
 def write_report(fname, report):
     json.dump(report, open(fname+'.json', 'w'), sort_keys=True, indent=4, separators=(',', ': '))
 
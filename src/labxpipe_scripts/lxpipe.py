@@ -12,11 +12,13 @@
 import argparse
 import sys
 
+import labxpipe_scripts.lxpipe_bench
 import labxpipe_scripts.lxpipe_demultiplex
 import labxpipe_scripts.lxpipe_extract
 import labxpipe_scripts.lxpipe_generate
 import labxpipe_scripts.lxpipe_merge_count
 import labxpipe_scripts.lxpipe_profile
+import labxpipe_scripts.lxpipe_query
 import labxpipe_scripts.lxpipe_run
 import labxpipe_scripts.lxpipe_report
 import labxpipe_scripts.lxpipe_trackhub
@@ -29,7 +31,9 @@ subcommands = {
     'generate': labxpipe_scripts.lxpipe_generate,
     'profile': labxpipe_scripts.lxpipe_profile,
     'trackhub': labxpipe_scripts.lxpipe_trackhub,
-    'demultiplex': labxpipe_scripts.lxpipe_demultiplex
+    'demultiplex': labxpipe_scripts.lxpipe_demultiplex,
+    'bench': labxpipe_scripts.lxpipe_bench,
+    'query': labxpipe_scripts.lxpipe_query
 }
 
 def generate_help(subcommands):
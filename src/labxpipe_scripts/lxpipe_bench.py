@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Benchmark compression codecs"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from labxpipe import compression
+
+default_codecs = 'lz4:1,lz4:9,zstd:1,zstd:3,zstd:10,zstd:19,gzip:1,gzip:6'
+
+def parse_size(s):
+    units = {'K': 1024, 'M': 1024**2, 'G': 1024**3}
+    if s[-1].upper() in units:
+        return int(float(s[:-1]) * units[s[-1].upper()])
+    else:
+        return int(s)
+
+def make_sample(path_input, path_sample, sample_size, num_processor=None):
+    """Write first sample_size bytes of decompressed input."""
+    decompress_cmd = compression.get_decompress_cmd(path_input, num_processor)
+    with open(path_sample, 'wb') as fout:
+        if decompress_cmd is None:
+            with open(path_input, 'rb') as fin:
+                fout.write(fin.read(sample_size))
+        else:
+            p = subprocess.Popen(decompress_cmd + [path_input], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            fout.write(p.stdout.read(sample_size))
+            p.stdout.close()
+            p.wait()
+    return os.path.getsize(path_sample)
+
+def run_timed(cmd, path_in, path_out):
+    with open(path_in, 'rb') as fin, open(path_out, 'wb') as fout:
+        start = time.perf_counter()
+        subprocess.run(cmd, stdin=fin, stdout=fout, check=True)
+        return time.perf_counter() - start
+
+def bench_codec(path_sample, path_tmp, fmt, level, num_processor=None, repeat=1):
+    compress_cmd = compression.get_compress_cmd(fmt, level=level, num_processor=num_processor) + ['-c']
+    decompress_cmd = compression.get_decompress_cmd(None, num_processor, fmt=fmt)
+    path_compressed = os.path.join(path_tmp, 'sample' + compression.get_ext(fmt))
+    path_decompressed = os.path.join(path_tmp, 'sample.out')
+    # Best time of repeat(s)
+    compress_time = min([run_timed(compress_cmd, path_sample, path_compressed) for i in range(repeat)])
+    decompress_time = min([run_timed(decompress_cmd, path_compressed, path_decompressed) for i in range(repeat)])
+    size = os.path.getsize(path_sample)
+    compressed_size = os.path.getsize(path_compressed)
+    os.remove(path_compressed)
+    os.remove(path_decompressed)
+    return {'codec': fmt,
+            'level': level,
+            'compress_cmd': compress_cmd,
+            'decompress_cmd': decompress_cmd,
+            'size': size,
+            'compressed_size': compressed_size,
+            'ratio': size / compressed_size,
+            'compress_speed': size / compress_time / 1024**2,
+            'decompress_speed': size / decompress_time / 1024**2}
+
+def bench_codecs(path_inputs, codecs, sample_size, num_processor=None, repeat=1, path_tmp=None, logger=None):
+    if logger is None:
+        import logging as logger
+    results = []
+    with tempfile.TemporaryDirectory(dir=path_tmp) as tmpdir:
+        for path_input in path_inputs:
+            path_sample = os.path.join(tmpdir, 'sample')
+            size = make_sample(path_input, path_sample, sample_size, num_processor)
+            logger.info(f'Sampled {size} bytes from {path_input}')
+            for fmt, level in codecs:
+                if shutil.which(compression.get_command(fmt, 'compress')[0]) is None:
+                    logger.warning(f'Skipping {fmt}: not installed')
+                    continue
+                r = bench_codec(path_sample, tmpdir, fmt, level, num_processor, repeat)
+                r['input'] = path_input
+                results.append(r)
+            os.remove(path_sample)
+    return results
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    # Started from wrapper?
+    prog = os.path.basename(argv[0])
+    if len(argv) > 1 and argv[1] == 'bench':
+        job_cmd = argv[:2]
+        argv_parser = argv[2:]
+        prog += ' bench'
+    else:
+        job_cmd = argv[:1]
+        argv_parser = argv[1:]
+    # Parse arguments
+    parser = argparse.ArgumentParser(prog=prog, description='Benchmark compression codecs.')
+    parser.add_argument('target', action='store', choices=['codecs'], help='Benchmark target')
+    parser.add_argument('-i', '--inputs', dest='inputs', action='store', required=True, help='Input FASTQ/SAM file(s), compressed or not (comma separated)')
+    parser.add_argument('-c', '--codecs', dest='codecs', action='store', default=default_codecs, help='Codec and level to test (comma separated codec:level)')
+    parser.add_argument('-s', '--sample_size', dest='sample_size', action='store', default='256M', help='Size of uncompressed sample per input')
+    parser.add_argument('-n', '--repeat', dest='repeat', action='store', type=int, default=1, help='Number of repeat(s), best time is reported')
+    parser.add_argument('-t', '--path_tmp', dest='path_tmp', action='store', help='Path to temporary directory (on the same filesystem as pipeline outputs)')
+    parser.add_argument('-o', '--output', dest='output', action='store', help='Path to JSON output')
+    parser.add_argument('-p', '--processor', dest='num_processor', action='store', type=int, help='Number of processor (default set by tool)')
+    args = parser.parse_args(argv_parser)
+
+    codecs = []
+    for c in args.codecs.split(','):
+        fmt, level = c.strip().split(':')
+        if fmt not in compression.codecs:
+            print(f'ERROR: Unknown codec {fmt}')
+            return 1
+        codecs.append((fmt, int(level)))
+
+    results = bench_codecs([p.strip() for p in args.inputs.split(',')], codecs, parse_size(args.sample_size), args.num_processor, args.repeat, args.path_tmp)
+
+    # Output
+    print(f"{'input':<30} {'codec':<6} {'level':>5} {'ratio':>7} {'compress MB/s':>14} {'decompress MB/s':>16}")
+    for r in results:
+        print(f"{os.path.basename(r['input']):<30} {r['codec']:<6} {r['level']:>5} {r['ratio']:>7.2f} {r['compress_speed']:>14.1f} {r['decompress_speed']:>16.1f}")
+    if args.output is not None:
+        json.dump(results, open(args.output, 'w'), sort_keys=True, indent=4, separators=(',', ': '))
+
+if __name__ == '__main__':
+    sys.exit(main())
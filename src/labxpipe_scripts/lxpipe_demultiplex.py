@@ -17,7 +17,6 @@ import json
 import logging
 import os
 import shutil
-import subprocess
 import sys
 
 import labxdb
@@ -26,13 +25,76 @@ import labxdb.fastq
 import pyfnutils as pfu
 import pyfnutils.log
 
+import labxpipe.compression
 import labxpipe.interfaces.if_exe_readknead
+import labxpipe.parallel_helpers
+import labxpipe.transfer
 import labxpipe.utils
 
 class Error(Exception):
     def __init__(self, message):
         self.message = message
 
+def set_num_processor(job, num_thread):
+    return {**job, 'num_processor': num_thread}
+
+def demultiplex_tube(name, input_r1_paths, input_r2_paths, output_tpl, fq_codec, num_compressor, zip_fnames, quality_scores, max_read_length, dmx_op, path_bulk_output, demux_verbose_level=2, separate_log=False, dry_run=False, config=None, num_processor=1, logger=None):
+    """Demultiplex runs of tube name with ReadKnead. With separate_log, log and ReadKnead output are written to demultiplex_{name}.log.
+    Outputs are compressed while written with fq_codec (if not None), each compressor using num_processor thread(s) if supported (zstd)."""
+    # Parameters
+    if not isinstance(logger, logging.Logger):
+        logger = logging.getLogger()
+    logger = logger.getChild(name)
+    path_log = None
+    if separate_log and not dry_run:
+        path_log = os.path.join(path_bulk_output, f'demultiplex_{name}.log')
+        handler = logging.FileHandler(path_log)
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        logger.addHandler(handler)
+    if fq_codec is None:
+        fq_command_out = None
+    else:
+        fq_command_out = labxpipe.compression.get_pipe_compress_cmd(fq_codec['codec'], fq_codec.get('level'), num_processor)
+    if num_compressor > 0:
+        logger.info(f'Demultiplexing {name} with {num_processor} thread(s) and {num_compressor} compressor process(es) ({fq_command_out.replace(",", " ")})')
+    else:
+        logger.info(f'Demultiplexing {name} with {num_processor} thread(s)')
+
+    try:
+        # Start ReadKnead
+        if dry_run:
+            logger.info(f"DRY RUN: ReadKnead({input_r1_paths}, {input_r2_paths}, {path_bulk_output}, {output_tpl}, {fq_command_out}, {quality_scores}, {dmx_op}, {os.path.join(path_bulk_output, f'preparing_report_{name}.json')}, {max_read_length})")
+            if len(zip_fnames) > 0:
+                logger.info(f'DRY RUN: Compress {len(zip_fnames)} FASTQ')
+        else:
+            labxpipe.interfaces.if_exe_readknead.readknead(input_r1_paths,
+                                                           input_r2_paths,
+                                                           outpath              = path_bulk_output,
+                                                           fq_fname_out_r1      = output_tpl[0],
+                                                           fq_fname_out_r2      = output_tpl[1],
+                                                           fq_command_out       = fq_command_out,
+                                                           quality_score        = quality_scores,
+                                                           ops_r1               = dmx_op['R1'],
+                                                           ops_r2               = dmx_op['R2'],
+                                                           report_path          = os.path.join(path_bulk_output, f'preparing_report_{name}.json'),
+                                                           stats_out_path       = os.path.join(path_bulk_output, f'stats_out_{name}'),
+                                                           max_read_length      = max_read_length,
+                                                           num_worker           = num_processor,
+                                                           verbose              = True,
+                                                           verbose_level        = demux_verbose_level,
+                                                           return_std           = False,
+                                                           path_log             = path_log,
+                                                           logger               = logger)
+            # Zip FASTQ (not compressed by ReadKnead) in parallel
+            if len(zip_fnames) > 0:
+                num_file_processor = max(1, num_processor // len(zip_fnames))
+                cmds = [labxpipe.compression.get_policy_compress_cmd(config, 'demultiplex', f, num_processor=num_file_processor, keep=False, default_class='archive') + [os.path.join(path_bulk_output, f)] for f in zip_fnames]
+                labxpipe.compression.run_compress_cmds(cmds, num_processor, logger)
+    finally:
+        if path_log is not None:
+            logger.removeHandler(handler)
+            handler.close()
+
 def demultiplex(bulk, path_demux_ops, path_seq_tmp, path_seq_raw, path_seq_prepared, input_run_refs=[], exclude_run_refs=[], demux_nozip=False, demux_verbose_level=2, fastq_exts=['.fastq'], no_readonly=False, dry_run=False, dbl=None, config=None, num_processor=1, logger=None):
     # Parameters
     if logger is None:
@@ -64,7 +126,8 @@ def demultiplex(bulk, path_demux_ops, path_seq_tmp, path_seq_raw, path_seq_prepa
         else:
             os.mkdir(path_bulk_output)
 
-    # Demultiplex
+    # Resolve runs of all tubes before starting
+    jobs = []
     for name, path_list in fastqs.items():
         # Get run info
         if dbl:
@@ -128,6 +191,20 @@ def demultiplex(bulk, path_demux_ops, path_seq_tmp, path_seq_raw, path_seq_prepa
             else:
                 ot = None
             output_tpl.append(ot)
+        # Output compression: Streamed by ReadKnead if all outputs share a codec it can pipe to, else compressed after demultiplexing
+        fq_codec = None
+        zip_fnames = []
+        num_compressor = 0
+        if demux_nozip is False:
+            zip_fnames = [p.replace('[DPX]', b) for p in output_tpl if p is not None for b in second_barcodes + ['undetermined']]
+            zip_codecs = [labxpipe.compression.get_policy_codec(config, 'demultiplex', f, default_class='archive') for f in zip_fnames]
+            if len(zip_codecs) > 0 and all([c == zip_codecs[0] for c in zip_codecs]) and labxpipe.compression.get_pipe_compress_cmd(zip_codecs[0]['codec']) is not None:
+                fq_codec = zip_codecs[0]
+                ext = labxpipe.compression.get_ext(fq_codec['codec'])
+                output_tpl = [p + ext if p is not None else None for p in output_tpl]
+                # ReadKnead starts one compressor per output file
+                num_compressor = len(zip_fnames)
+                zip_fnames = []
         # Prepare parameters
         if adapter_3p in dmx_ops:
             dmx_op = copy.deepcopy(dmx_ops[adapter_3p])
@@ -141,41 +218,34 @@ def demultiplex(bulk, path_demux_ops, path_seq_tmp, path_seq_raw, path_seq_prepa
         else:
             raise Error(f'"{adapter_3p}" not found in demultiplex operations')
 
-        # Start ReadKnead
-        if dry_run:
-            logger.info(f"DRY RUN: ReadKnead({input_r1_paths}, {input_r2_paths}, {path_bulk_output}, {quality_scores}, {dmx_op}, {os.path.join(path_bulk_output, f'preparing_report_{name}.json')}, {max_read_length})")
-        else:
-            labxpipe.interfaces.if_exe_readknead.readknead(input_r1_paths,
-                                                           input_r2_paths,
-                                                           outpath              = path_bulk_output,
-                                                           fq_fname_out_r1      = output_tpl[0],
-                                                           fq_fname_out_r2      = output_tpl[1],
-                                                           quality_score        = quality_scores,
-                                                           ops_r1               = dmx_op['R1'],
-                                                           ops_r2               = dmx_op['R2'],
-                                                           report_path          = os.path.join(path_bulk_output, f'preparing_report_{name}.json'),
-                                                           stats_out_path       = os.path.join(path_bulk_output, f'stats_out_{name}'),
-                                                           max_read_length      = max_read_length,
-                                                           num_worker           = num_processor,
-                                                           verbose              = True,
-                                                           verbose_level        = demux_verbose_level,
-                                                           return_std           = False,
-                                                           logger               = logger)
-            # Zip FASTQ
-            if demux_nozip is False:
-                for p in output_tpl:
-                    if p is not None:
-                        for b in second_barcodes + ['undetermined']:
-                            cmd = ['zstd', '--rm', '-T'+str(num_processor), '-19', os.path.join(path_bulk_output, p.replace('[DPX]', b))]
-                            logger.info(cmd)
-                            subprocess.run(cmd, check=True)
+        # Job
+        jobs.append({'name': name,
+                     'input_r1_paths': input_r1_paths,
+                     'input_r2_paths': input_r2_paths,
+                     'output_tpl': output_tpl,
+                     'fq_codec': fq_codec,
+                     'num_compressor': num_compressor,
+                     'zip_fnames': zip_fnames,
+                     'quality_scores': quality_scores,
+                     'max_read_length': max_read_length,
+                     'dmx_op': dmx_op})
+
+    # Demultiplex tubes, largest first: One at a time with all processors, or concurrently sharing processors according to
+    # the measured speedup of ReadKnead (demux_scaling). Streamed compressors count as a processor each, up to half of the processors
+    sizes = [sum([os.path.getsize(p) for p in (job['input_r1_paths'] or []) + (job['input_r2_paths'] or [])]) for job in jobs]
+    for job in jobs:
+        job.update({'path_bulk_output': path_bulk_output, 'demux_verbose_level': demux_verbose_level, 'separate_log': len(jobs) > 1, 'dry_run': dry_run, 'config': config, 'logger': logger})
+    reserved = [min(job['num_compressor'], num_processor // 2) for job in jobs]
+    r = labxpipe.parallel_helpers.run_planned(demultiplex_tube, jobs, num_processor=num_processor, sizes=sizes, scaling=config.get('demux_scaling'), num_thread=num_processor, set_num_thread=set_num_processor, reserved=reserved)
+    if r == 130:
+        raise KeyboardInterrupt
 
     if path_seq_tmp is not None:
         if dry_run:
             logger.info(f'DRY RUN: Move {path_bulk_output} to {path_seq_prepared}')
         else:
             logger.info(f'Move {path_bulk_output} to {path_seq_prepared}')
-            shutil.move(path_bulk_output, path_seq_prepared)
+            labxpipe.transfer.transfer(path_bulk_output, os.path.join(path_seq_prepared, bulk), check=True, num_processor=num_processor, logger=logger)
             # Update output path after moving
             path_bulk_output = os.path.join(path_seq_prepared, bulk)
     if not dry_run and no_readonly is False:
@@ -277,7 +347,7 @@ def main(argv=None):
     # Check software
     check_exe(['readknead'])
     if config['demux_nozip'] is False:
-        check_exe(['zstd'])
+        check_exe([labxpipe.compression.get_policy_compress_cmd(config, 'demultiplex', '', default_class='archive')[0]])
 
     # Init. demultiplex
     if not config['dry_run']:
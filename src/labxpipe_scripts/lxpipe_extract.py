@@ -14,10 +14,10 @@
 import argparse
 import json
 import os
-import shutil
 import sys
 
 import labxdb
+import labxpipe.transfer
 import labxpipe.utils
 
 def main(argv=None):
@@ -42,6 +42,9 @@ def main(argv=None):
     parser.add_argument('-w', '--lowercase', dest='lowercase', action='store_true', help='Lowercase filename')
     parser.add_argument('-x', '--suffix', dest='suffix', action='store_true', help='Suffix input filename to output filename')
     parser.add_argument('-e', '--extensions', dest='search_extensions', action='store', help='File extensions to search (comma separated)')
+    parser.add_argument('-k', '--link', dest='link', action='store_true', help='Link files instead of moving them (hardlink, or symlink across filesystems)')
+    parser.add_argument('-v', '--verify', dest='verify', action='store_true', help='Verify checksums of copied files (moved across filesystems)')
+    parser.add_argument('-p', '--processor', dest='num_processor', action='store', type=int, default=1, help='Number of processor')
     parser.add_argument('-d', '--dry_run', dest='dry_run', action='store_true', help='Dry run')
     parser.add_argument('--path_config', dest='path_config', action='store', help='Path to config')
     parser.add_argument('--http_url', '--labxdb_http_url', dest='labxdb_http_url', action='store', help='Database HTTP URL')
@@ -164,12 +167,16 @@ def main(argv=None):
         else:
             tmp.add(path_out)
 
-    # Move
-    for path_in, path_out in moves:
-        if config['dry_run']:
-            print(f'Move {path_in} -> {path_out}')
-        else:
-            shutil.move(path_in, path_out)
+    # Move or link
+    if config['link']:
+        mode = 'link'
+    else:
+        mode = 'move'
+    if config['dry_run']:
+        for path_in, path_out in moves:
+            print(f'{mode.capitalize()} {path_in} -> {path_out}')
+    else:
+        labxpipe.transfer.transfer_files(moves, mode, config['verify'], config['num_processor'])
 
 
 if __name__ == '__main__':
@@ -12,30 +12,101 @@
 """Merge & normalize count"""
 
 import argparse
-import collections
+import concurrent.futures
 import json
 import os
 import sys
+import tempfile
+import zipfile
 
 import numpy as np
 import pandas as pd
-import zstandard as zstd
 
 import labxdb
 
 import pyfnutils as pfu
 import pyfnutils.log
 
+from labxpipe import annots
+from labxpipe import counts
 from labxpipe import utils
 
-def read_data(path_data, step_name, name_column):
-    if step_name == 'counting':
-        m = pd.read_csv(path_data+'.csv')
-    elif step_name == 'counting_cufflinks':
-        m = pd.read_table(path_data+'.fpkm_tracking')
-        m.sort([name_column], inplace=True)
-        m.index = range(len(m))
-    return m
+def get_table_format(step_name):
+    """Format and extension of count tables."""
+    if step_name == 'counting_cufflinks':
+        return 'fpkm_tracking', '.fpkm_tracking'
+    else:
+        return 'csv', '.csv'
+
+def merge_counts(merges, read, columns, name_column='name', logger=None):
+    """Sum counts of refs of each merge. Tables are read one at a time with read(ref) (memory-mapped from cache or from
+    count store) and added to preallocated matrices. Returns names and lengths (from first table) and per column the matrix
+    of sums (features x merges)."""
+    if logger is None:
+        import logging as logger
+    ref_merges = {}
+    for imerge, merge in enumerate(merges):
+        for ref in merge['refs']:
+            ref_merges.setdefault(ref, []).append(imerge)
+    names, lengths, sums = None, None, None
+    for ref, imerges in ref_merges.items():
+        table = read(ref)
+        if names is None:
+            names = np.array(table[name_column])
+            lengths = np.array(table['length'])
+            sums = {c: np.zeros((len(names), len(merges)), dtype=table[c].dtype) for c in columns}
+        elif not np.array_equal(names, table[name_column]):
+            logger.warning(f'Format of {ref} incorrect')
+            continue
+        for c in columns:
+            values = table[c]
+            dtype = np.result_type(sums[c].dtype, values.dtype)
+            if sums[c].dtype != dtype:
+                sums[c] = sums[c].astype(dtype)
+            for imerge in imerges:
+                sums[c][:, imerge] += values
+    return names, lengths, sums
+
+def load_matrix(values):
+    """Matrix or memory-mapped matrix from path."""
+    if isinstance(values, str):
+        return np.load(values, mmap_mode='r')
+    else:
+        return values
+
+def write_column(head, values, lengths, labels, sels, main_column, run_name, feature_name, suffix=''):
+    """Write merged counts of main_column, its RPKM per selection and totals. values is the matrix of counts (or path to it)."""
+    values = load_matrix(values)
+    main = pd.concat([head, pd.DataFrame(values, columns=labels)], axis=1)
+    main.to_csv(f'{run_name}_{main_column}_{feature_name}{suffix}.csv', index=False)
+    if len(sels) > 0:
+        multi = main_column[main_column.find('_')+1:]
+        totals_data = []
+        for sel_name, sel_suffix, sel in sels:
+            norms = counts.normalize(values, lengths, sel)
+            totals_data += [[label, sel_name, total] for label, total in zip(labels, norms['total'])]
+            rpkm = pd.concat([head, pd.DataFrame(norms['rpkm'], columns=labels)], axis=1)
+            rpkm.to_csv(f'{run_name}_rpkm_{multi}_{feature_name}{sel_suffix}{suffix}.csv', index=False)
+        pd.DataFrame(totals_data, columns=['sample', 'name', 'total']).to_csv(f'{run_name}_total_{main_column}_{feature_name}{suffix}.csv', index=False)
+
+def write_bundle(path, head, values, lengths, labels, sels):
+    """Write features, samples, annotations, counts per column (values) and their normalizations as npz. Arrays are written one at a time."""
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        def add(key, a):
+            with zf.open(key + '.npy', 'w', force_zip64=True) as f:
+                np.lib.format.write_array(f, np.asanyarray(a), allow_pickle=False)
+        add('features', head.iloc[:, 0].to_numpy(dtype=str))
+        add('lengths', lengths)
+        add('samples', np.array(labels, dtype=str))
+        for col in head.columns[2:]:
+            add(col, head[col].fillna('').to_numpy(dtype=str))
+        for main_column, v in values.items():
+            v = load_matrix(v)
+            add(main_column, v)
+            for sel_name, sel_suffix, sel in sels:
+                norms = counts.normalize(v, lengths, sel)
+                for norm in ['rpkm', 'tpm', 'cpm', 'total']:
+                    add(f'{norm}_{main_column}{sel_suffix}', norms[norm])
 
 def is_spike_in(prefix, name):
     if name.find(prefix) == -1:
@@ -67,6 +138,10 @@ def main(argv=None):
     parser.add_argument('-t', '--strict_column_names', dest='strict_column_names', action='store_true', default=False, help='Use strict column labels (only alphabetic letters, numbers and _)')
     parser.add_argument('-k', '--spike_in_main_prefix', dest='spike_in_main_prefix', action='store', default='', help='Prefix of main gene (other genes are spike-in), i.e. ENSDAR')
     parser.add_argument('-p', '--spike_in_names', dest='spike_in_names', action='store', default='yst,zbf', help='Spike-in and non spike-in normalization filenames, i.e. yst,zbf (comma separated)')
+    parser.add_argument('--no_bundle', dest='no_bundle', action='store_true', help='Do not write counts and normalized matrices as NumPy bundle')
+    parser.add_argument('--processor', dest='num_processor', action='store', type=int, default=1, help='Number of processor')
+    parser.add_argument('--count_store', dest='count_store', action='store', help='Path to project count store (default: from counting step count_store option)')
+    parser.add_argument('--path_cache', dest='path_cache', action='store', help='Path to cache directory for count tables (default: $XDG_CACHE_HOME/labxpipe)')
     parser.add_argument('--log', dest='path_log', action='store', help='Path to log')
     parser.add_argument('--path_config', dest='path_config', action='store', help='Path to config')
     parser.add_argument('--http_url', '--labxdb_http_url', dest='labxdb_http_url', action='store', help='Database HTTP URL')
@@ -142,6 +217,20 @@ def main(argv=None):
         if len(refs) > 0:
             result += [(level, r) for r in dbl.post('tree', {'search_criterion':[search+' EQUAL '+r for r in refs], 'search_gate':'OR', 'sort_criterion':['1 track_priority ASC', '2 replicate_order ASC', '3 run_order ASC'], 'limit':'ALL'})]
 
+    # Features are merged one at a time. With more than one processor, merged counts are saved
+    # (shared read-only with workers) and outputs are written in parallel once all features are merged.
+    units = []
+    path_cache = utils.get_path_cache(config)
+    if 'count_store' in config:
+        store = counts.CountStore(config['count_store'])
+    elif step_config.get('count_store'):
+        store = counts.CountStore(counts.get_path_store(step_config['count_store'], run_path, run_name))
+    else:
+        store = None
+    if config['num_processor'] > 1:
+        os.makedirs(path_cache, exist_ok=True)
+        tmp_dir = tempfile.TemporaryDirectory(prefix='merge_count_', dir=path_cache)
+
     for feature_name in feature_names:
         # Determine feature_name type based on feature name
         if feature_name.find('gene') != -1:
@@ -153,8 +242,9 @@ def main(argv=None):
             return 1
         logger.info(f'Detected feature: {feature_name_type}')
 
-        # Data
-        data = {}
+        # Count tables
+        fmt, ext = get_table_format(config['step_name'])
+        paths_data = {}
 
         # Get how to merge data
         merges = []
@@ -167,19 +257,13 @@ def main(argv=None):
                     # Open replicate data files
                     if level == 'replicate' and replicate['replicate_ref'] in pipe_config_replicate_refs:
                         merge_replicate_refs.append(replicate['replicate_ref'])
-                        if replicate['replicate_ref'] not in data:
-                            logger.info(f"Opening {replicate['replicate_ref']} {feature_name}")
-                            path_data = os.path.join(run_path, replicate['replicate_ref'], config['step_name'], feature_name)
-                            data[replicate['replicate_ref']] = read_data(path_data, config['step_name'], config['name_column'])
+                        paths_data[replicate['replicate_ref']] = os.path.join(run_path, replicate['replicate_ref'], config['step_name'], feature_name + ext)
                     # Open run data files
                     elif level == 'run':
                         for run in replicate['children']:
                             if run['run_ref'] in pipe_config_run_refs:
                                 merge_replicate_refs.append(run['run_ref'])
-                                if run['run_ref'] not in data:
-                                    logger.info(f"Opening {run['run_ref']} {feature_name}")
-                                    path_data = os.path.join(run_path, run['run_ref'], config['step_name'], feature_name)
-                                    data[run['run_ref']] = read_data(path_data, config['step_name'], config['name_column'])
+                                paths_data[run['run_ref']] = os.path.join(run_path, run['run_ref'], config['step_name'], feature_name + ext)
                     # Add to merges
                     if 'replicate' in config['levels']:
                         label_short = replicate['label_short']
@@ -212,138 +296,114 @@ def main(argv=None):
                 annot_fon = f['path_json']
                 break
 
-        # Open annotation file
+        # Open annotation table
         path_annot = os.path.join(config['fontools_path_main'], 'annots', annot_fon)
         path_annot_fon2 = os.path.join(config['fontools_path_main'], 'annots', annot_fon.replace('fon1', 'fon2'))
         if os.path.exists(path_annot_fon2):
-            legacy_fon2 = True
-            logger.info(f'Opening {path_annot_fon2}')
-            annots = json.load(open(path_annot_fon2))
-            Annot = collections.namedtuple('Annot', annots['columns'])
-        elif os.path.exists(path_annot):
-            legacy_fon2 = False
+            path_annot = path_annot_fon2
+        if os.path.exists(path_annot):
             logger.info(f'Opening {path_annot}')
-            if path_annot.endswith('.zst'):
-                annots = json.load(zstd.open(path_annot, 'rt'))
-            else:
-                annots = json.load(open(path_annot, 'rt'))
+            if feature_name_type == 'gene':
+                dgn = pd.DataFrame(annots.load_table(path_annot, ['gene_stable_id', 'gene_name'], path_cache))
+                dgn.columns = ['gene', 'gene_name']
+            elif feature_name_type == 'transcript':
+                dgn = pd.DataFrame(annots.load_table(path_annot, ['transcript_stable_id', 'gene_stable_id', 'gene_name'], path_cache))
+                dgn.columns = ['transcript', 'gene', 'gene_name']
         else:
             logger.info(f'{path_annot} not found')
-            annots = None
+            dgn = None
 
+        # Load count tables (only required columns, in parallel) and merge. Tables in count store are not read again.
+        columns = ['length'] + config['columns']
+        if store is None:
+            paths_load = paths_data
+        else:
+            paths_load = {ref: path for ref, path in paths_data.items() if not store.is_current(feature_name, ref, config['columns'], path)}
+        logger.info(f'Loading {len(paths_load)} count tables of {feature_name}')
+        counts.cache_tables(list(paths_load.values()), columns, fmt, config['name_column'], path_cache, config['num_processor'])
+        if store is None:
+            def read(ref):
+                return counts.read_counts(paths_data[ref], columns, fmt, config['name_column'], path_cache)
+        else:
+            for ref, path in paths_load.items():
+                store.add(feature_name, ref, counts.read_counts(path, columns, fmt, config['name_column'], path_cache), config['columns'], config['name_column'], path)
+            def read(ref):
+                return store.get(feature_name, ref, columns, config['name_column'])
+        names, lengths, count_sums = merge_counts(merges, read, config['columns'], config['name_column'], logger)
+
+        # Init output dataframe
+        head = pd.DataFrame({feature_name_type: names, feature_name_type + '_length': lengths})
+
+        # Add annotations: gene name (and gene ID for transcripts)
+        if dgn is not None:
+            head = pd.merge(head, dgn, on=feature_name_type, how='left')
+
+        # Uniquify labels
+        count_uniq_labels = []
+        label_counter = {}
+        for cl in [merge['label_short'] for merge in merges]:
+            if cl in label_counter:
+                label_counter[cl] += 1
+                new_label = f'{cl}_{label_counter[cl]}'
+                logger.warning(f'Column {cl} not unique: renaming to {new_label}')
+                count_uniq_labels.append(new_label)
+            else:
+                count_uniq_labels.append(cl)
+                label_counter[cl] = 1
+
+        # Normalization selections
+        if config['step_name'] == 'counting':
+            if config['spike_in_main_prefix'] != '':
+                spike_in_names = config['spike_in_names']
+                # Normalize by *Spike-in Total*
+                sel_spike = np.array([is_spike_in(config['spike_in_main_prefix'], x) for x in names])
+                sel_spike[0] = False # Remove total
+                if sel_spike.sum() == 0:
+                    logger.error('No spike-in feature found')
+                    return 1
+                # Normalize by *Main Total* (Regular RPKM)
+                sel_main = np.invert(sel_spike)
+                sel_main[0] = False # Remove total
+                # Normalize by *(Main + Spike-in) Total*
+                sel_all = np.ones(len(names), 'bool')
+                sel_all[0] = False # Remove total
+                sels = [(spike_in_names[0], '_'+spike_in_names[0], sel_spike), (spike_in_names[1], '_'+spike_in_names[1], sel_main), ('all', '_all', sel_all)]
+            else:
+                # Normalize by *Total* (Regular RPKM)
+                sel_all = np.ones(len(names), 'bool')
+                sel_all[0] = False # Remove total
+                sels = [('all', '', sel_all)]
+        else:
+            sels = []
+
+        # Export units
+        if config['num_processor'] > 1:
+            for main_column in config['columns']:
+                path_values = os.path.join(tmp_dir.name, f'{feature_name}_{main_column}.npy')
+                np.save(path_values, count_sums[main_column])
+                count_sums[main_column] = path_values
+        feature_units = []
         for main_column in config['columns']:
-            logger.info(f'Step {feature_name} {main_column}')
-            first_sample = True
-
-            # Init output dataframe
-            if first_sample:
-                # Get two columns from first run
-                main = data[merges[0]['refs'][0]].loc[:,[config['name_column'], 'length']]
-
-                # Renaming main feature to its name
-                if feature_name_type == 'gene':
-                    main.columns = ['gene', 'gene_length']
-                    first_datacol_idx = 2
-                elif feature_name_type == 'transcript':
-                    main.columns = ['transcript', 'transcript_length']
-                    first_datacol_idx = 2
-
-                # Add annotations
-                if annots is not None:
-                    if feature_name_type == 'gene':
-                        # Add gene name
-                        if legacy_fon2:
-                            dgn = pd.DataFrame([(a.gene_stable_id, a.gene_name) for a in map(Annot._make, annots['annotations'])], columns=['gene', 'gene_name']).drop_duplicates()
-                        else:
-                            dgn = pd.DataFrame([(a['gene_stable_id'], a['gene_name']) for a in annots['features']], columns=['gene', 'gene_name']).drop_duplicates()
-                        main = pd.merge(main, dgn, on='gene', how='left')
-                        first_datacol_idx = 3
-                    elif feature_name_type == 'transcript':
-                        # Add gene ID and name
-                        if legacy_fon2:
-                            dgn = pd.DataFrame([(a.transcript_stable_id, a.gene_stable_id, a.gene_name) for a in map(Annot._make, annots['annotations'])], columns=['transcript', 'gene', 'gene_name']).drop_duplicates()
-                        else:
-                            dgn = pd.DataFrame([(a['transcript_stable_id'], a['gene_stable_id'], a['gene_name']) for a in annots['features']], columns=['transcript', 'gene', 'gene_name']).drop_duplicates()
-                        main = pd.merge(main, dgn, on='transcript', how='left')
-                        first_datacol_idx = 4
-
-                first_sample = False
-
-            # Merge count
-            count_labels = []
-            count_sums = []
-            for merge in merges:
-                series = []
-                for ref in merge['refs']:
-                    m = data[ref]
-                    # Check format of series is compatible
-                    if np.all(main.loc[:,feature_name_type] == m.loc[:,config['name_column']]):
-                        series.append(m.loc[:,main_column])
-                    else:
-                        logger.warning(f'Format of {sample_ref} incorrect')
-                        continue
-                count_labels.append(merge['label_short'])
-                count_sums.append(np.sum(series, axis=0))
-
-            # Uniquify labels
-            count_uniq_labels = []
-            label_counter = {}
-            for cl in count_labels:
-                if cl in label_counter:
-                    label_counter[cl] += 1
-                    new_label = f'{cl}_{label_counter[cl]}'
-                    logger.warning(f'Column {cl} not unique: renaming to {new_label}')
-                    count_uniq_labels.append(new_label)
-                else:
-                    count_uniq_labels.append(cl)
-                    label_counter[cl] = 1
-
-            # Export
-            main = pd.concat([main, pd.DataFrame(np.vstack(count_sums).T, columns=count_uniq_labels)], axis=1)
-            main.to_csv(f"{run_name}_{main_column}_{feature_name}{config['suffix']}.csv", index=False)
-
-            # Normalization
-            if config['step_name'] == 'counting':
-                if config['spike_in_main_prefix'] != '':
-                    spike_in_names = config['spike_in_names']
-                    # Normalize by *Spike-in Total*
-                    sel_spike = main[feature_name_type].map(lambda x: is_spike_in(config['spike_in_main_prefix'], x))
-                    sel_spike[0] = False # Remove total
-                    if sel_spike.sum() == 0:
-                        logger.error('No spike-in feature found')
-                        return 1
-                    # Normalize by *Main Total* (Regular RPKM)
-                    sel_main = np.invert(sel_spike)
-                    sel_main[0] = False # Remove total
-                    # Normalize by *(Main + Spike-in) Total*
-                    sel_all = sel_main.copy()
-                    sel_all.loc[:] = True
-                    sel_all[0] = False # Remove total
-                    sels = [(spike_in_names[0], '_'+spike_in_names[0], sel_spike), (spike_in_names[1], '_'+spike_in_names[1], sel_main), ('all', '_all', sel_all)]
-                else:
-                    # Normalize by *Total* (Regular RPKM)
-                    sel_all = np.ones(len(main[feature_name_type]), 'bool')
-                    sel_all[0] = False # Remove total
-                    sels = [('all', '', sel_all)]
-
-                totals_data = []
-                for sel_name, sel_suffix, sel in sels:
-                    rpkm_labels = []
-                    rpkms = []
-                    for col in main.columns[first_datacol_idx:]:
-                        total = main.loc[sel, col].sum()
-                        rpkm = (main.loc[:, col]) * (1000./main.loc[:, feature_name_type+'_length']) * (1000000./total)
-                        rpkms.append(rpkm)
-                        rpkm_labels.append(col)
-                        totals_data.append([col, sel_name, total])
-
-                    # Save dataframe
-                    head = main.iloc[:, :first_datacol_idx].copy()
-                    rpkm = pd.concat([head, pd.DataFrame(np.vstack(rpkms).T, columns=rpkm_labels)], axis=1)
-                    rpkm.to_csv(f"{run_name}_rpkm_{main_column[main_column.find('_')+1:]}_{feature_name}{sel_suffix}{config['suffix']}.csv", index=False)
-
-                # Save totals
-                pd.DataFrame(totals_data, columns=['sample', 'name', 'total']).to_csv(f"{run_name}_total_{main_column}_{feature_name}{config['suffix']}.csv", index=False)
+            feature_units.append([write_column, head, count_sums[main_column], lengths, count_uniq_labels, sels, main_column, run_name, feature_name, config['suffix']])
+        if not config['no_bundle']:
+            feature_units.append([write_bundle, f"{run_name}_{feature_name}{config['suffix']}.npz", head, count_sums, lengths, count_uniq_labels, sels])
+        if config['num_processor'] > 1:
+            units.extend(feature_units)
+        else:
+            logger.info(f'Writing {feature_name}')
+            for unit in feature_units:
+                unit[0](*unit[1:])
+
+    # Parallel export
+    if len(units) > 0:
+        logger.info(f'Writing {len(units)} outputs with {config["num_processor"]} processors')
+        with concurrent.futures.ProcessPoolExecutor(max_workers=config['num_processor']) as executor:
+            for f in [executor.submit(*unit) for unit in units]:
+                f.result()
+    if config['num_processor'] > 1:
+        tmp_dir.cleanup()
+    if store is not None:
+        store.close()
 
 if __name__ == '__main__':
     sys.exit(main())
@@ -18,9 +18,6 @@ import re
 import subprocess
 import sys
 
-import pyfnutils as pfu
-import pyfnutils.parallel
-
 from labxpipe.interfaces import if_exe_geneabacus
 from labxpipe import parallel_helpers
 
@@ -87,8 +84,8 @@ def main(argv=None):
                                            count_options    = count_options,
                                            check            = True)
 
-    # Run job(s)
-    r = pfu.parallel.run(if_exe_geneabacus.geneabacus, jobs, num_processor=args.num_processor)
+    # Run job(s): Concurrent jobs and their number of worker(s) planned from input sizes
+    r = parallel_helpers.run_planned(if_exe_geneabacus.geneabacus, jobs, num_processor=args.num_processor)
 
 if __name__ == '__main__':
     sys.exit(main())
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Query profiles"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+import pyfnutils as pfu
+import pyfnutils.log
+
+from labxpipe import parallel_helpers
+from labxpipe import profiles
+
+def get_path_genome(feature, config):
+    if 'path_genome' in config:
+        path_genome = config['path_genome']
+    elif 'path_genome' in feature:
+        path_genome = feature['path_genome']
+    elif 'path_tab' in feature:
+        path_genome = feature['path_tab']
+    else:
+        return None
+    if not os.path.exists(path_genome) and 'path_annots' in config:
+        path_genome = os.path.join(config['path_annots'], path_genome)
+    return path_genome
+
+def get_tracks(config, refs, step_names, feature_names=None):
+    """Binary profile(s) of steps: List of (label, path to profile, path to genome)."""
+    tracks = []
+    for step_name in step_names:
+        step_config = None
+        for s in config['analysis']:
+            if s['step_name'] == step_name:
+                step_config = s
+        if step_config is None:
+            raise ValueError(f'Could not find «{step_name}» step in pipeline.')
+        step_config = {**config, **step_config}
+        suffixes = [ipt.get('suffix', '') for ipt in step_config.get('inputs', [{}])]
+        for feature in step_config.get('features', []):
+            if feature_names is not None and feature['name'] not in feature_names:
+                continue
+            binary_formats = [pf for pf in feature.get('profile_formats', []) if pf.startswith('binary')]
+            if len(binary_formats) == 0:
+                continue
+            path_genome = get_path_genome(feature, step_config)
+            if path_genome is None:
+                raise ValueError(f"No genome for {feature['name']}")
+            for ref in refs:
+                for suffix in suffixes:
+                    path_profile = os.path.join(config['path_output'], ref, step_name, feature['name'] + suffix + parallel_helpers.format2ext(binary_formats[0]))
+                    tracks.append((f"{ref}:{step_name}:{feature['name']}{suffix}", path_profile, path_genome))
+    return tracks
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    # Started from wrapper?
+    prog = os.path.basename(argv[0])
+    if len(argv) > 1 and argv[1] == 'query':
+        job_cmd = argv[:2]
+        argv_parser = argv[2:]
+        prog += ' query'
+    else:
+        job_cmd = argv[:1]
+        argv_parser = argv[1:]
+    # Parse arguments
+    parser = argparse.ArgumentParser(prog=prog, description='Query binary profiles of a region.')
+    parser.add_argument('-c', '--pipeline', dest='path_pipeline', action='store', required=True, help='Path to pipeline')
+    parser.add_argument('-g', '--region', dest='region', action='store', required=True, help='Region chrom:start-end (1-based, inclusive) or chrom')
+    parser.add_argument('-s', '--steps', dest='steps', action='store', default='profiling', help='Step name(s) (comma separated)')
+    parser.add_argument('-f', '--features', dest='features', action='store', help='Feature name(s) (comma separated, default: all with binary profile)')
+    parser.add_argument('-r', '--refs', dest='refs', action='store', help='Run/replicate ref(s) (comma separated, default: all in pipeline)')
+    parser.add_argument('--path_genome', dest='path_genome', action='store', help='Path to tabulated genome file (default: path_genome or path_tab of feature)')
+    parser.add_argument('--path_cache', dest='path_cache', action='store', help='Path to cache directory for decompressed profiles (default: $XDG_CACHE_HOME/labxpipe)')
+    parser.add_argument('-t', '--format', dest='output_format', action='store', choices=['tsv', 'json'], default='tsv', help='Output format')
+    parser.add_argument('-o', '--output', dest='path_output_query', action='store', help='Path to output (default: stdout)')
+    parser.add_argument('--path_config', dest='path_config', action='store', help='Path to config')
+    args = parser.parse_args(argv_parser)
+
+    # Get config (JSON single file or all files in path_config)
+    config = {}
+    paths = []
+    if args.path_config is None:
+        if 'HTS_CONFIG_PATH' in os.environ:
+            paths.append(os.environ['HTS_CONFIG_PATH'])
+        elif 'XDG_CONFIG_HOME' in os.environ:
+            paths.append(os.path.join(os.environ['XDG_CONFIG_HOME'], 'hts'))
+    else:
+        paths.append(args.path_config)
+    for path in paths:
+        if os.path.isdir(path):
+            for f in sorted(os.listdir(path)):
+                if f.endswith('.json'):
+                    config = {**config, **json.load(open(os.path.join(path, f)))}
+        elif os.path.isfile(path):
+            config = {**config, **json.load(open(path))}
+
+    # Input local config from args
+    vargs = vars(args)
+    for a, v in vargs.items():
+        if v is not None and (a not in config or v != parser.get_default(a)):
+            config[a] = v
+        if a in ['steps', 'features', 'refs']:
+            if v is None:
+                config[a] = None
+            else:
+                config[a] = [r.strip() for r in v.split(',')]
+
+    # Logging
+    logger = pfu.log.define_root_logger('query', level='warning')
+
+    # Load pipeline
+    config = {**config, **json.load(open(config['path_pipeline']))}
+    if config['refs'] is None:
+        refs = config.get('run_refs', []) + config.get('replicate_refs', [])
+    else:
+        refs = config['refs']
+
+    # Query
+    try:
+        tracks = get_tracks(config, refs, config['steps'], config['features'])
+    except ValueError as e:
+        logger.error(str(e))
+        return 1
+    if len(tracks) == 0:
+        logger.error('No binary profile found in pipeline')
+        return 1
+    labels = []
+    values = []
+    chrom, start, end = None, None, None
+    for label, path_profile, path_genome in tracks:
+        if not os.path.exists(path_profile):
+            logger.warning(f'{path_profile} not found')
+            continue
+        try:
+            # Region checked against genome of each track
+            region = profiles.parse_region(config['region'], path_genome)
+            if chrom is None:
+                chrom, start, end = region
+            elif region != (chrom, start, end):
+                raise ValueError(f"Region {config['region']} differs in {path_genome}")
+            values.extend(profiles.query([path_profile], path_genome, chrom, start, end, config.get('path_cache')))
+        except ValueError as e:
+            logger.error(str(e))
+            return 1
+        labels.append(label)
+    if len(labels) == 0:
+        logger.error('No profile found')
+        return 1
+
+    # Output
+    if config.get('path_output_query') is None:
+        fout = sys.stdout
+    else:
+        fout = open(config['path_output_query'], 'wt')
+    if config['output_format'] == 'json':
+        json.dump({'chrom': chrom, 'start': start, 'end': end, 'tracks': {l: v.tolist() for l, v in zip(labels, values)}}, fout)
+        fout.write('\n')
+    else:
+        fout.write('\t'.join(['chrom', 'position'] + labels) + '\n')
+        m = np.column_stack(values)
+        for i in range(end - start):
+            fout.write(chrom + '\t' + str(start + i + 1) + '\t' + '\t'.join([f'{v:g}' for v in m[i].tolist()]) + '\n')
+    if fout is not sys.stdout:
+        fout.close()
+
+if __name__ == '__main__':
+    sys.exit(main())
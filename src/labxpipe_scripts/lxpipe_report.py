@@ -13,16 +13,21 @@
 
 import argparse
 import collections
+import concurrent.futures
 import datetime
+import hashlib
 import json
 import operator
 import os
 import sys
+import threading
 
 import xlsxwriter
 
 import labxdb
 
+from labxpipe import utils
+
 def parse_step_level(level, names, report):
     for k, v in level.items():
         if isinstance(v, dict):
@@ -42,95 +47,186 @@ def parse_step(report, step_name, all_report):
     for k, v in step_parsed.items():
         all_report[step_name + (k, )] = v
 
-def parsing_reports(config, time_fmt='delta', spreadsheet=True, completion_time_format='%Y-%m-%d %H:%M:%S', http_url=None, http_login=None, http_password=None, http_path=None, http_db=None):
+def get_report_paths(path_root, config):
+    """Existing step reports of run, as (key, path), and completion path."""
+    paths = []
+    for step in config['analysis']:
+        path_report = os.path.join(path_root, step['step_name'], step['step_name']+'_report.json')
+        if os.path.exists(path_report):
+            paths.append(((step['step_name'], ), path_report))
+        elif 'features' in step:
+            for feat in step['features']:
+                if 'name' in feat:
+                    path_report = os.path.join(path_root, step['step_name'], feat['name']+'_report.json')
+                    if os.path.exists(path_report):
+                        paths.append(((step['step_name'], feat['name']), path_report))
+    path_compl = os.path.join(path_root, 'log', config['name']+'_compl.json')
+    if os.path.exists(path_compl):
+        return paths, path_compl
+    else:
+        return paths, None
+
+def parse_run_reports(report_paths, path_compl, spreadsheet=True, completion_time_format='%Y-%m-%d %H:%M:%S'):
+    """Step reports and computing times (in seconds) of run: Returns two lists of (key, value)."""
+    steps_report = {}
+    for key, path_report in report_paths:
+        parse_step(json.load(open(path_report)), key, steps_report)
+        # Percent for spreadsheet
+        if spreadsheet:
+            steps_report[key + ('%', )] = None
+    times = []
+    if path_compl is not None:
+        total_time = datetime.timedelta(0)
+        for step in json.load(open(path_compl)):
+            if step['start'] and step['end']:
+                delta = datetime.datetime.strptime(step['end'], completion_time_format) - datetime.datetime.strptime(step['start'], completion_time_format)
+                total_time += delta
+                times.append(((step['step_name'], 'time'), delta.total_seconds()))
+        times.append((('total', 'time'), total_time.total_seconds()))
+    return list(steps_report.items()), times
+
+def format_time(seconds, time_fmt='delta'):
+    if time_fmt == 'delta':
+        return datetime.timedelta(seconds=seconds)
+    elif time_fmt == 'days':
+        return seconds /60./60./24.
+    else:
+        return str(datetime.timedelta(seconds=seconds))
+
+def get_tree_infos(dbl, seqs):
+    """Replicate and run (first run for replicates) records of runs and replicates, with one tree query per level."""
+    infos = {}
+    for level, search in [('run', '3 run_ref'), ('replicate', '2 replicate_ref')]:
+        refs = set([r for l, r in seqs if l == level])
+        if len(refs) == 0:
+            continue
+        for project in dbl.post('tree', {'search_criterion':[search+' EQUAL '+r for r in sorted(refs)], 'search_gate':'OR', 'sort_criterion':['1 track_priority ASC', '2 replicate_order ASC', '3 run_order ASC'], 'limit':'ALL'}):
+            for sample in project.get('children', []):
+                for replicate in sample.get('children', []):
+                    # Records missing fields are queried by ref
+                    if not all([k in replicate for k in ['replicate_ref', 'sample_ref', 'label_short']]):
+                        continue
+                    runs = [r for r in replicate.get('children', []) if 'failed' in r]
+                    if level == 'replicate' and replicate['replicate_ref'] in refs and len(runs) > 0:
+                        infos[replicate['replicate_ref']] = (replicate, runs[0])
+                    elif level == 'run':
+                        for run in runs:
+                            if run['run_ref'] in refs:
+                                infos[run['run_ref']] = (replicate, run)
+    return infos
+
+def get_ref_infos(config, seq_level, seq_ref, dbl=None, infos={}):
+    """Replicate, sample, label and failed status of run or replicate (from DB and/or JSON). Records found in infos aren't queried."""
+    all_report = {}
+    if seq_level == 'run':
+        all_report[('run', '')] = seq_ref
+    elif seq_level == 'replicate':
+        all_report[('replicate', '')] = seq_ref
+    if 'db' in config['ref_info_source'] and seq_ref in infos:
+        replicate, run = infos[seq_ref]
+        all_report[('replicate', '')] = replicate['replicate_ref']
+        all_report[('sample', '')] = replicate['sample_ref']
+        all_report[('label_short', '')] = replicate['label_short']
+        all_report[('failed', '')] = run['failed']
+    elif 'db' in config['ref_info_source']:
+        if seq_level == 'run':
+            # Query: Run
+            run = dbl.get('run/get-ref/'+seq_ref)[0][0]
+            # Get replicate ref.
+            replicate_ref = run['replicate_ref']
+        elif seq_level == 'replicate':
+            replicate_ref = seq_ref
+            # Query: All run(s)
+            runs = dbl.post('run', {'search_criterion':['3 replicate_ref EQUAL '+replicate_ref], 'sort_criterion':['3 run_order ASC'], 'limit':'ALL'})
+            # Get first run
+            run = runs[0]
+        # Query: Replicate
+        replicate = dbl.get('replicate/get-ref/'+replicate_ref)[0][0]
+        # Copy-paste info to config
+        all_report[('replicate', '')] = replicate['replicate_ref']
+        all_report[('sample', '')] = replicate['sample_ref']
+        all_report[('label_short', '')] = replicate['label_short']
+        all_report[('failed', '')] = run['failed']
+    if 'json' in config['ref_info_source']:
+        all_report[('replicate', '')] = None
+        all_report[('sample', '')] = None
+        all_report[('label_short', '')] = None
+        all_report[('failed', '')] = None
+        if seq_ref in config['ref_infos']:
+            if 'replicate' in config['ref_infos'][seq_ref]:
+                all_report[('replicate', '')] = config['ref_infos'][seq_ref]['replicate_ref']
+            if 'sample' in config['ref_infos'][seq_ref]:
+                all_report[('sample', '')] = config['ref_infos'][seq_ref]['sample_ref']
+            if 'label_short' in config['ref_infos'][seq_ref]:
+                all_report[('label_short', '')] = config['ref_infos'][seq_ref]['label_short']
+            if 'failed' in config['ref_infos'][seq_ref]:
+                all_report[('failed', '')] = config['ref_infos'][seq_ref]['failed']
+    return all_report
+
+def parse_seq(config, seq_level, seq_ref, dbls, dbl_args, infos={}, cached=None, time_fmt='delta', spreadsheet=True, completion_time_format='%Y-%m-%d %H:%M:%S'):
+    """Report of run or replicate. Reports are parsed again only if cached summary is missing or outdated (fingerprint of report files).
+    Returns the report and its summary to cache."""
+    # One DBLink per thread
+    dbl = None
+    if 'db' in config['ref_info_source']:
+        if not hasattr(dbls, 'dbl'):
+            dbls.dbl = labxdb.DBLink(*dbl_args)
+        dbl = dbls.dbl
+    all_report = get_ref_infos(config, seq_level, seq_ref, dbl, infos)
+    # Step reports and computing times
+    report_paths, path_compl = get_report_paths(os.path.join(config['path_output'], seq_ref), config)
+    paths = [p for k, p in report_paths]
+    if path_compl is not None:
+        paths.append(path_compl)
+    fingerprint = utils.get_fingerprint(paths, {'spreadsheet': spreadsheet, 'completion_time_format': completion_time_format})
+    if cached is not None and cached['fingerprint'] == fingerprint:
+        steps_report = [(tuple(k), v) for k, v in cached['steps']]
+        times = [(tuple(k), v) for k, v in cached['times']]
+    else:
+        steps_report, times = parse_run_reports(report_paths, path_compl, spreadsheet, completion_time_format)
+    for k, v in steps_report:
+        all_report[k] = v
+    for k, v in times:
+        all_report[k] = format_time(v, time_fmt)
+    return all_report, {'fingerprint': fingerprint, 'steps': steps_report, 'times': times}
+
+def get_path_summaries(path_pipeline, path_cache):
+    key = hashlib.sha1(os.path.abspath(path_pipeline).encode()).hexdigest()
+    return os.path.join(path_cache, 'reports', key + '.json')
+
+def parsing_reports(config, time_fmt='delta', spreadsheet=True, completion_time_format='%Y-%m-%d %H:%M:%S', http_url=None, http_login=None, http_password=None, http_path=None, http_db=None, num_processor=1, path_summaries=None):
+    """Reports of runs and replicates, parsed in parallel threads. With path_summaries, summaries of reports are cached."""
     # LabxDB parameters
     if http_path is None and http_db is None:
         http_db = 'seq'
-    #  Init. DBLink
-    dbl = labxdb.DBLink(http_url, http_login, http_password, http_path, http_db)
+    dbl_args = (http_url, http_login, http_password, http_path, http_db)
+    dbls = threading.local()
 
-    reports = []
-    for seq_level, seq_ref in [('run', r) for r in sorted(config.get('run_refs', []))] + [('replicate', r) for r in sorted(config.get('replicate_refs', []))]:
-        path_root = os.path.join(config['path_output'], seq_ref)
-        all_report = {}
-        if seq_level == 'run':
-            all_report[('run', '')] = seq_ref
-        elif seq_level == 'replicate':
-            all_report[('replicate', '')] = seq_ref
-        # Get annots for run
-        if 'db' in config['ref_info_source']:
-            if seq_level == 'run':
-                # Query: Run
-                run = dbl.get('run/get-ref/'+seq_ref)[0][0]
-                # Get replicate ref.
-                replicate_ref = run['replicate_ref']
-            elif seq_level == 'replicate':
-                replicate_ref = seq_ref
-                # Query: All run(s)
-                runs = dbl.post('run', {'search_criterion':['3 replicate_ref EQUAL '+replicate_ref], 'sort_criterion':['3 run_order ASC'], 'limit':'ALL'})
-                # Get first run
-                run = runs[0]
-            # Query: Replicate
-            replicate = dbl.get('replicate/get-ref/'+replicate_ref)[0][0]
-            # Copy-paste info to config
-            all_report[('replicate', '')] = replicate['replicate_ref']
-            all_report[('sample', '')] = replicate['sample_ref']
-            all_report[('label_short', '')] = replicate['label_short']
-            all_report[('failed', '')] = run['failed']
-        if 'json' in config['ref_info_source']:
-            all_report[('replicate', '')] = None
-            all_report[('sample', '')] = None
-            all_report[('label_short', '')] = None
-            all_report[('failed', '')] = None
-            if seq_ref in config['ref_infos']:
-                if 'replicate' in config['ref_infos'][seq_ref]:
-                    all_report[('replicate', '')] = config['ref_infos'][seq_ref]['replicate_ref']
-                if 'sample' in config['ref_infos'][seq_ref]:
-                    all_report[('sample', '')] = config['ref_infos'][seq_ref]['sample_ref']
-                if 'label_short' in config['ref_infos'][seq_ref]:
-                    all_report[('label_short', '')] = config['ref_infos'][seq_ref]['label_short']
-                if 'failed' in config['ref_infos'][seq_ref]:
-                    all_report[('failed', '')] = config['ref_infos'][seq_ref]['failed']
-        # Get counts
-        for step in config['analysis']:
-            # Report
-            path_report = os.path.join(path_root, step['step_name'], step['step_name']+'_report.json')
-            # Parse report
-            if os.path.exists(path_report):
-                parse_step(json.load(open(path_report)), (step['step_name'], ), all_report)
-                # Percent for spreadsheet
-                if spreadsheet:
-                    all_report[(step['step_name'], '%')] = None
-            elif 'features' in step:
-                for feat in step['features']:
-                    if 'name' in feat:
-                        path_report = os.path.join(path_root, step['step_name'], feat['name']+'_report.json')
-                        if os.path.exists(path_report):
-                            parse_step(json.load(open(path_report)), (step['step_name'], feat['name']), all_report)
-                            if spreadsheet:
-                                all_report[(step['step_name'], feat['name'], '%')] = None
-        # Get computing time
-        path_compl = os.path.join(path_root, 'log', config['name']+'_compl.json')
-        if os.path.exists(path_compl):
-            compl_steps = json.load(open(path_compl))
-            total_time = datetime.timedelta(0)
-            for step in compl_steps:
-                if step['start'] and step['end']:
-                    delta = datetime.datetime.strptime(step['end'], completion_time_format) - datetime.datetime.strptime(step['start'], completion_time_format)
-                    total_time += delta
-                    if time_fmt == 'delta':
-                        all_report[(step['step_name'], 'time')] = delta
-                    elif time_fmt == 'days':
-                        all_report[(step['step_name'], 'time')] = delta.total_seconds() /60./60./24.
-                    else:
-                        all_report[(step['step_name'], 'time')] = str(delta)
-            if time_fmt == 'delta':
-                all_report[('total', 'time')] = total_time
-            elif time_fmt == 'days':
-                all_report[('total', 'time')] = total_time.total_seconds() /60./60./24.
-            else:
-                all_report[('total', 'time')] = str(total_time)
-        reports.append(all_report)
+    # Cached summaries
+    summaries = {}
+    if path_summaries is not None and os.path.exists(path_summaries):
+        try:
+            summaries = json.load(open(path_summaries))
+        except ValueError:
+            summaries = {}
+
+    seqs = [('run', r) for r in sorted(config.get('run_refs', []))] + [('replicate', r) for r in sorted(config.get('replicate_refs', []))]
+    if 'db' in config['ref_info_source']:
+        infos = get_tree_infos(labxdb.DBLink(*dbl_args), seqs)
+    else:
+        infos = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_processor) as executor:
+        fs = [executor.submit(parse_seq, config, seq_level, seq_ref, dbls, dbl_args, infos, summaries.get(seq_ref), time_fmt, spreadsheet, completion_time_format) for seq_level, seq_ref in seqs]
+        results = [f.result() for f in fs]
+    reports = [r for r, summary in results]
+
+    # Save summaries
+    if path_summaries is not None:
+        os.makedirs(os.path.dirname(path_summaries), exist_ok=True)
+        path_tmp = path_summaries + f'.{os.getpid()}.tmp'
+        with open(path_tmp, 'wt') as f:
+            f.write(json.dumps({seq_ref: summary for (seq_level, seq_ref), (r, summary) in zip(seqs, results)}))
+        os.replace(path_tmp, path_summaries)
 
     return reports
 
@@ -144,8 +240,12 @@ def export_csv(reports, path_output='report'):
         for report in reports:
             fout.write(','.join([str(report.get(col)) for col in headers]) + '\n')
 
+def is_number(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
 def export_xls(reports, path_output='report'):
-    workbook = xlsxwriter.Workbook(path_output+'.xlsx')
+    # Rows are streamed to file (written in order)
+    workbook = xlsxwriter.Workbook(path_output+'.xlsx', {'constant_memory': True})
     worksheet = workbook.add_worksheet()
 
     # Formats
@@ -211,9 +311,11 @@ def export_xls(reports, path_output='report'):
         for icol in range(len(headers)):
             step = headers[icol][0]
             if '%' in headers[icol]:
-                r1 = xlsxwriter.utility.xl_rowcol_to_cell(global_row, icol-1)
-                r2 = xlsxwriter.utility.xl_rowcol_to_cell(global_row, icol-2)
-                worksheet.write_formula(global_row, icol, f'={r1}/{r2}*100', value='')
+                # Output over input
+                v1 = report.get(headers[icol-1])
+                v2 = report.get(headers[icol-2])
+                if is_number(v1) and is_number(v2) and v2 != 0:
+                    worksheet.write_number(global_row, icol, v1 / v2 * 100)
             else:
                 if headers[icol] in report:
                     worksheet.write(global_row, icol, report[headers[icol]])
@@ -251,6 +353,9 @@ def main(argv=None):
     parser = argparse.ArgumentParser(prog=prog, description='Generate pipeline report.')
     parser.add_argument('-c', '--pipeline', dest='path_pipeline', action='store', required=True, help='Path to pipeline')
     parser.add_argument('-f', '--report_format', dest='report_format', action='store', default='xls', help='Report format: xls or csv')
+    parser.add_argument('-p', '--processor', dest='num_processor', action='store', type=int, default=8, help='Number of processor (threads parsing reports)')
+    parser.add_argument('--path_cache', dest='path_cache', action='store', help='Path to cache directory for report summaries (default: $XDG_CACHE_HOME/labxpipe)')
+    parser.add_argument('--no_cache', dest='no_cache', action='store_true', help='Don\'t use cached report summaries')
     parser.add_argument('--path_config', dest='path_config', action='store', help='Path to config')
     parser.add_argument('--http_url', '--labxdb_http_url', dest='labxdb_http_url', action='store', help='Database HTTP URL')
     parser.add_argument('--http_login', '--labxdb_http_login', dest='labxdb_http_login', action='store', help='Database HTTP login')
@@ -302,7 +407,11 @@ def main(argv=None):
         spreadsheet = False
     else:
         spreadsheet = True
-    reports = parsing_reports(config, 'days', spreadsheet, http_url=config.get('labxdb_http_url'), http_login=config.get('labxdb_http_login'), http_password=config.get('labxdb_http_password'), http_path=config.get('labxdb_http_path'), http_db=config.get('labxdb_http_db'))
+    if config['no_cache']:
+        path_summaries = None
+    else:
+        path_summaries = get_path_summaries(config['path_pipeline'], utils.get_path_cache(config))
+    reports = parsing_reports(config, 'days', spreadsheet, http_url=config.get('labxdb_http_url'), http_login=config.get('labxdb_http_login'), http_password=config.get('labxdb_http_password'), http_path=config.get('labxdb_http_path'), http_db=config.get('labxdb_http_db'), num_processor=config['num_processor'], path_summaries=path_summaries)
 
     # Output reports
     if config['report_format'] == 'csv':
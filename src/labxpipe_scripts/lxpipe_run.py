@@ -18,6 +18,7 @@ import importlib.util
 import json
 import logging
 import os
+import queue
 import shutil
 import subprocess
 import sys
@@ -28,12 +29,20 @@ import labxdb
 import pyfnutils as pfu
 import pyfnutils.log
 
+from labxpipe import pipeline
+import labxpipe.affinity
+import labxpipe.fanout
 import labxpipe.steps
 
-def start_pipeline(run_cmd, path_pipeline, num_processor, run_ref, replicate_ref, keep_failed_runs, http_url, http_login, http_password, http_path, http_db, failing):
+def start_pipeline(run_cmd, path_pipeline, num_processor, run_ref, replicate_ref, keep_failed_runs, http_url, http_login, http_password, http_path, http_db, failing, cpu_sets=None):
     if failing.is_set() == False:
+        # CPU set (free while run is running)
+        if cpu_sets is not None:
+            cpus = cpu_sets.get()
         try:
             cmd = run_cmd + ['--pipeline', path_pipeline, '--processor', str(num_processor)]
+            if cpu_sets is not None:
+                cmd.extend(['--cpus', labxpipe.affinity.format_cpulist(cpus)])
             if run_ref is not None:
                 cmd.extend(['--run', run_ref])
             if replicate_ref is not None:
@@ -54,6 +63,76 @@ def start_pipeline(run_cmd, path_pipeline, num_processor, run_ref, replicate_ref
         except:
             failing.set()
             raise
+        finally:
+            if cpu_sets is not None:
+                cpu_sets.put(cpus)
+
+def run_step(fn_step, path_input, path_output, config_op, completion, iop, name_input, logger):
+    logger.info(f"Start {config_op['step_name']} - Input step {name_input}")
+    completion[iop]['end'] = None
+    completion[iop]['status'] = None
+    # Output dir.
+    if os.path.exists(path_output):
+        shutil.rmtree(path_output)
+    os.mkdir(path_output)
+    # Log start time
+    completion[iop]['start'] = now()
+
+    # Do the job
+    fn_step(path_input, path_output, config_op)
+
+    # Log end time
+    completion[iop]['end'] = now()
+    completion[iop]['status'] = 'done'
+    logger.info(f"End {config_op['step_name']}")
+
+def run_fanout_group(group, config, completion, run_functions, fanout_functions, path_input_first, logger):
+    """Run steps concurrently: Input(s) read by several steps or jobs are decompressed once."""
+    path_analysis = config['path_analysis']
+    steps = []
+    readers = {}
+    for iop in group:
+        op = config['analysis'][iop]
+        config_op = {**config, **op}
+        path_input = pipeline.get_chained_path_input(config['analysis'], iop, path_analysis, path_input_first)
+        if 'subpath_input' in config_op:
+            path_input = os.path.join(path_input, config_op['subpath_input'])
+        paths = fanout_functions[pipeline.get_step_function(op)](path_input, config_op)
+        for p in paths:
+            readers[p] = readers.get(p, 0) + 1
+        steps.append([iop, config_op, path_input, paths])
+    logger.info(f"Fan-out of steps {[config['analysis'][i]['step_name'] for i in group]} reading {readers}")
+    try:
+        run_fanout_steps(steps, readers, config, completion, run_functions, logger)
+    except:
+        # Steps reading an aborted fan-out got truncated input
+        for iop in group:
+            completion[iop]['end'] = None
+            completion[iop]['status'] = None
+        raise
+
+def run_fanout_steps(steps, readers, config, completion, run_functions, logger):
+    path_analysis = config['path_analysis']
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(steps)) as executor:
+        with labxpipe.fanout.open_fanouts(readers, path_analysis, config.get('num_decompress_processor'), logger) as fifos:
+            # Distribute FIFOs to steps
+            fs = []
+            for iop, config_op, path_input, paths in steps:
+                config_op['fanout_paths'] = {}
+                for p in set(paths):
+                    if p in fifos:
+                        config_op['fanout_paths'][p] = fifos[p][:paths.count(p)]
+                        fifos[p] = fifos[p][paths.count(p):]
+                name_input = pipeline.get_chained_input(config['analysis'], iop)
+                if name_input == 'input':
+                    name_input = 'Input:' + config['seq_ref']
+                fs.append(executor.submit(run_step, run_functions[pipeline.get_step_function(config_op)], path_input, os.path.join(path_analysis, config_op['step_name']), config_op, completion, iop, name_input, logger))
+            # First failure aborts fan-out(s): Remaining steps get EOF
+            rfs = concurrent.futures.wait(fs, return_when=concurrent.futures.FIRST_EXCEPTION)
+            for f in rfs.done:
+                f.result()
+        for f in fs:
+            f.result()
 
 def clean_stop(completion, completion_fname, logger):
     logger.info('Saving completion state')
@@ -81,6 +160,8 @@ def main(argv=None):
     parser.add_argument('-n', '--replicate', dest='replicate_ref', action='store', help='Replicate')
     parser.add_argument('-w', '--worker', dest='num_worker', action='store', type=int, default=1, help='Number of run in parallel')
     parser.add_argument('-p', '--processor', dest='num_processor', action='store', type=int, default=2, help='Number of processor per run')
+    parser.add_argument('--affinity', dest='affinity', action='store_true', help='Run on disjoint CPU sets (within NUMA node if possible)')
+    parser.add_argument('--cpus', dest='cpus', action='store', help='CPUs of run (cpulist, i.e. 0-7,16)')
     parser.add_argument('--keep_failed_runs', dest='keep_failed_runs', action='store_true', help='Don\'t skip the failed run(s)')
     parser.add_argument('--path_config', dest='path_config', action='store', help='Path to config')
     parser.add_argument('--http_url', '--labxdb_http_url', dest='labxdb_http_url', action='store', help='Database HTTP URL')
@@ -148,6 +229,17 @@ def main(argv=None):
             with concurrent.futures.ThreadPoolExecutor(max_workers=config['num_worker']) as executor:
                 # Failing event (with FIRST_EXCEPTION, the next job starts before remaining jobs get cancelled)
                 failing = threading.Event()
+                # CPU sets
+                cpu_sets = None
+                if config.get('affinity'):
+                    sets = labxpipe.affinity.get_cpu_sets(config['num_worker'], config['num_processor'])
+                    if sets is None:
+                        logger.warning(f"Not enough CPUs for {config['num_worker']} worker(s) with {config['num_processor']} processor(s): Affinity disabled")
+                    else:
+                        cpu_sets = queue.Queue()
+                        for cpus in sets:
+                            logger.info(f'CPU set {labxpipe.affinity.format_cpulist(cpus)}')
+                            cpu_sets.put(cpus)
                 # Prepare jobs
                 jobs = []
                 is_force = any([s['force'] for s in config['analysis']])
@@ -159,11 +251,11 @@ def main(argv=None):
                 for run_ref, replicate_ref, seq_ref in refs:
                     path_json_compl = os.path.join(config['path_output'], seq_ref, 'log', config['name']+'_compl.json')
                     if is_force or not os.path.exists(path_json_compl):
-                        jobs.append([job_cmd, config['path_pipeline'], config['num_processor'], run_ref, replicate_ref, config.get('keep_failed_runs'), config.get('labxdb_http_url'), config.get('labxdb_http_login'), config.get('labxdb_http_password'), config.get('labxdb_http_path'), config.get('labxdb_http_db'), failing])
+                        jobs.append([job_cmd, config['path_pipeline'], config['num_processor'], run_ref, replicate_ref, config.get('keep_failed_runs'), config.get('labxdb_http_url'), config.get('labxdb_http_login'), config.get('labxdb_http_password'), config.get('labxdb_http_path'), config.get('labxdb_http_db'), failing, cpu_sets])
                     elif os.path.exists(path_json_compl):
                         ncompl = len([s for s in json.load(open(path_json_compl)) if s['status'] == 'done'])
                         if len(config['analysis']) > ncompl:
-                            jobs.append([job_cmd, config['path_pipeline'], config['num_processor'], run_ref, replicate_ref, config.get('keep_failed_runs'), config.get('labxdb_http_url'), config.get('labxdb_http_login'), config.get('labxdb_http_password'), config.get('labxdb_http_path'), config.get('labxdb_http_db'), failing])
+                            jobs.append([job_cmd, config['path_pipeline'], config['num_processor'], run_ref, replicate_ref, config.get('keep_failed_runs'), config.get('labxdb_http_url'), config.get('labxdb_http_login'), config.get('labxdb_http_password'), config.get('labxdb_http_path'), config.get('labxdb_http_db'), failing, cpu_sets])
                 # Add jobs to queue
                 fs = []
                 if len(jobs) == 0:
@@ -217,13 +309,21 @@ def main(argv=None):
             logger.info(line)
         logger.handlers[0].setLevel(user_level)
 
+        # CPU affinity (inherited by tools)
+        if 'cpus' in config:
+            labxpipe.affinity.set_affinity(labxpipe.affinity.parse_cpulist(config['cpus']))
+            logger.info(f"Running on CPU(s) {config['cpus']}")
+
         # Load available run functions
         logger.info('Starting')
         run_functions = {}
+        fanout_functions = {}
         for name in labxpipe.steps.__all__:
             step_mod = getattr(labxpipe.steps, name)
             for n in getattr(step_mod, 'functions'):
                 run_functions[n] = step_mod.run
+                if hasattr(step_mod, 'fanout_inputs'):
+                    fanout_functions[n] = step_mod.fanout_inputs
 
         # Load user run functions
         if 'path_local_steps' in config:
@@ -235,6 +335,8 @@ def main(argv=None):
                     spec.loader.exec_module(step_mod)
                     for n in getattr(step_mod, 'functions'):
                         run_functions[n] = step_mod.run
+                        if hasattr(step_mod, 'fanout_inputs'):
+                            fanout_functions[n] = step_mod.fanout_inputs
 
         # Completion object
         completion_fname = os.path.join(path_log, config['name']+'_compl.json')
@@ -305,34 +407,47 @@ def main(argv=None):
             path_input_first = path_input
             name_input_first = name_input
             nstep = len(config['analysis'])
+            # Eager cleaning: Patterns removed once their last consumer is done (only if cleaning step will run)
+            eager_cleanings = [c for c in pipeline.get_eager_cleanings(config['analysis']) if completion[c[1]]['end'] is None or config['analysis'][c[1]]['force']]
+            disk_usage = {'peak': 0, 'eager_saved_space': {}}
+            config['disk_usage'] = disk_usage
+            # Fan-out: Steps sharing input(s) run concurrently
+            is_pending = lambda i: completion[i]['end'] is None or config['analysis'][i]['force']
+            is_capable = lambda o: pipeline.get_step_function(o) in fanout_functions
+            ran_in_group = set()
             for iop, op in enumerate(config['analysis']):
                 # Output dir.
                 path_output = os.path.join(path_analysis, op['step_name'])
-                if completion[iop]['end'] is None or op['force']:
-                    logger.info(f"Start {op['step_name']} - Input step {name_input}")
-                    completion[iop]['end'] = None
-                    completion[iop]['status'] = None
-                    # Output dir.
-                    if os.path.exists(path_output):
-                        shutil.rmtree(path_output)
-                    os.mkdir(path_output)
-                    # Log start time
-                    completion[iop]['start'] = now()
-
-                    # Do the job
+                if iop in ran_in_group:
+                    # Already run in a fan-out group
+                    pass
+                elif config.get('fanout', False) and is_capable(op) and is_pending(iop):
+                    group = pipeline.get_fanout_group(config['analysis'], iop, is_capable, is_pending)
+                    run_fanout_group(group, config, completion, run_functions, fanout_functions, path_input_first, logger)
+                    ran_in_group.update(group)
+
+                    # Disk usage
+                    usage = pipeline.get_disk_usage(path_analysis)
+                    disk_usage['peak'] = max(disk_usage['peak'], usage)
+                    logger.info(f'Disk usage {usage} bytes')
+                elif is_pending(iop):
                     config_op = {**config, **op}
                     if 'subpath_input' in config_op:
                         path_input = os.path.join(path_input, config_op['subpath_input'])
-                    if 'step_function' in op:
-                        fn_step = run_functions[op['step_function']]
-                    else:
-                        fn_step = run_functions[op['step_name']]
-                    fn_step(path_input, path_output, config_op)
+                    run_step(run_functions[pipeline.get_step_function(op)], path_input, path_output, config_op, completion, iop, name_input, logger)
+
+                    # Disk usage (intermediates are at their peak before cleaning)
+                    usage = pipeline.get_disk_usage(path_analysis)
+                    disk_usage['peak'] = max(disk_usage['peak'], usage)
+                    logger.info(f'Disk usage {usage} bytes')
 
-                    # Log end time
-                    completion[iop]['end'] = now()
-                    completion[iop]['status'] = 'done'
-                    logger.info(f"End {op['step_name']}")
+                # Eager cleaning
+                for iready, icleaning, step in eager_cleanings:
+                    if iready == iop:
+                        cleaning_name = config['analysis'][icleaning]['step_name']
+                        logger.info(f"Eager cleaning of {step['step_name']} ({cleaning_name})")
+                        saved_space = labxpipe.steps.cleaning.clean_pattern(path_analysis, step, logger)
+                        disk_usage['eager_saved_space'][cleaning_name] = disk_usage['eager_saved_space'].get(cleaning_name, 0) + saved_space
 
                 # Determine path_input for next step
                 if iop < nstep - 1:
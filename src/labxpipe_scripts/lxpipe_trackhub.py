@@ -12,6 +12,7 @@
 """Create trackhub"""
 
 import argparse
+import concurrent.futures
 import copy
 import json
 import logging
@@ -26,16 +27,25 @@ import pyfnutils as pfu
 import pyfnutils.parallel
 
 from labxpipe.interfaces import if_exe_geneabacus
+from labxpipe import bigwig
+from labxpipe import compression
+from labxpipe import fanout
+from labxpipe import manifest
 from labxpipe import parallel_helpers
+from labxpipe import profiles
 from labxpipe import trackhub
+from labxpipe import utils
+
+# Options not changing outputs, excluded from fingerprints
+fingerprint_ignored = ['verbose', 'verbose_level', 'num_worker', 'num_decompress_processor', 'exe', 'return_std', 'logger']
 
 def get_available_refs(path_root_bams, bam_folder, bam_names):
     refs = []
     for path_root_bam in path_root_bams:
-        for d in os.listdir(path_root_bam):
+        for d in manifest.list_dirs(path_root_bam):
+            files = set(manifest.list_files(os.path.join(path_root_bam, d, *bam_folder)))
             for bn in bam_names:
-                p = os.path.join(path_root_bam, d, *bam_folder, bn)
-                if os.path.exists(p):
+                if bn in files:
                     refs.append(d)
     return refs
 
@@ -138,50 +148,328 @@ def make_config(projects=[], samples=[], replicates=[], runs=[], levels=['sample
 
     return config, path_trackhub_config
 
-def convert_bedgraph(path_bedgraph, path_genome, path_bigwig):
-    subprocess.run(['bg2bw', '--input', path_bedgraph, '--chromList', path_genome, '--outfile', path_bigwig], check=True)
+def read_mapping(path_mapping):
+    """Feature name mapping (tabulated: name and mapped name)."""
+    mapping = {}
+    with open(path_mapping, 'rt') as f:
+        for line in f:
+            if line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) >= 2 and fields[1] != '':
+                mapping[fields[0]] = fields[1]
+    return mapping
+
+def get_profile_name(profile_name, strand):
+    """Per-run profile filename of strand ('{strand}' in name is replaced; without it, profile is combined)."""
+    if '{strand}' in profile_name:
+        return profile_name.format(strand=strand)
+    elif strand == 'combined':
+        return profile_name
+
+def find_profile(path_root_bams, ref, profile_folder, profile_name):
+    for path_root_bam in path_root_bams:
+        p = os.path.join(path_root_bam, ref, profile_folder, profile_name)
+        if manifest.exists(p):
+            return p
+
+def get_path_report(path_profile):
+    """GeneAbacus report of profile <name>[_profiles].bin[.lz4]."""
+    path = compression.strip_ext(path_profile)
+    path = path[:-len('.bin')] if path.endswith('.bin') else path
+    path = path[:-len('_profiles')] if path.endswith('_profiles') else path
+    return path + '_report.json'
+
+def write_summed_profiles(path_profiles, path_features, path_bigwig, path_binary=None, norm=False, mapping=None, path_genome=None, writer=None, path_cache=None, logger=None):
+    """Write sum of binary profiles (in path_features order) to bigWig, and binary if path_binary. Normalized per million reads if norm.
+    With bg2bw writer, sum is written to a temporary bedGraph converted using path_genome."""
+    if logger is None:
+        import logging as logger
+    native = bigwig.get_writer(writer) == 'native'
+    logger.info(f'Summing {len(path_profiles)} profile(s) to {path_bigwig}')
+    scales = None
+    if norm:
+        total = sum([profiles.read_total(get_path_report(p)) for p in path_profiles])
+        scales = [1e6 / total if total > 0 else 0.] * len(path_profiles)
+    # Chromosomes
+    names = {}
+    chrom_sizes = []
+    for chrom, size in bigwig.read_genome(path_features):
+        if mapping is None:
+            names[chrom] = chrom
+        elif chrom in mapping:
+            names[chrom] = mapping[chrom]
+        else:
+            continue
+        chrom_sizes.append((names[chrom], size))
+    # Binary output
+    if path_binary is None:
+        p, fbin = None, None
+    else:
+        fmt = compression.get_format_from_ext(path_binary)
+        if fmt is None:
+            p, fbin = None, open(path_binary, 'wb')
+        else:
+            p = subprocess.Popen(compression.get_compress_cmd(fmt) + ['-c'], stdin=subprocess.PIPE, stdout=open(path_binary, 'wb'))
+            fbin = p.stdin
+    # BigWig output
+    num_interval = 0
+    if native:
+        fout = bigwig.Writer(path_bigwig, chrom_sizes)
+    else:
+        path_bedgraph = path_bigwig[:-len('.bw')] + '_sum.bedgraph'
+        fout = open(path_bedgraph, 'wt')
+    try:
+        with fout:
+            for chrom, values in profiles.sum_profiles(path_profiles, path_features, scales, path_cache):
+                if chrom in names:
+                    if native:
+                        fout.add_profile(names[chrom], values)
+                    else:
+                        num_interval += bigwig.write_bedgraph(fout, names[chrom], values)
+                if fbin is not None:
+                    fbin.write(memoryview(values.view('u1')))
+    finally:
+        if fbin is not None:
+            fbin.close()
+        if p is not None:
+            p.wait()
+    if p is not None and p.returncode != 0:
+        raise subprocess.CalledProcessError(p.returncode, p.args)
+    if native:
+        # Remove empty bigWig (as bedGraph without data isn't converted)
+        if fout.total['valid_count'] == 0:
+            os.remove(path_bigwig)
+    else:
+        try:
+            if num_interval > 0:
+                bigwig.convert_bedgraph(path_bedgraph, path_genome, path_bigwig, writer, logger=logger)
+        finally:
+            os.remove(path_bedgraph)
+
+def get_run_job(ref, strand, options, strand_options, run_jobs, path_root_bams, bam_folder, bam_fname, input_sam, path_run_output):
+    """GeneAbacus job computing binary profile of a run (once per run and strand). Returns None without input."""
+    if (ref, strand) not in run_jobs:
+        count_options, merging_schema, label_suffix = strand_options[strand]
+        run_options = {**count_options, 'profile_formats': ['binary'], 'profile_norm': False, 'count_path': ''}
+        if strand == 'combined':
+            options = {**options, 'read_strand': 'u'}
+        job = parallel_helpers.get_count_jobs(merging_schema   = [{'name': ref, 'refs': [ref], 'options': options}],
+                                              path_root_bams   = path_root_bams,
+                                              path_root_output = path_run_output,
+                                              bam_folder       = bam_folder,
+                                              bam_fname        = bam_fname,
+                                              label_suffix     = label_suffix,
+                                              input_sam        = input_sam,
+                                              count_options    = run_options)[0]
+        if len(job.get('path_sam', job.get('path_bam'))) == 0:
+            return None
+        job['path_report'] = get_path_report(job['profile_paths'][0])
+        run_jobs[(ref, strand)] = job
+    return run_jobs[(ref, strand)]
+
+def group_jobs(jobs):
+    """Group jobs reading the same SAM/BAM input(s)."""
+    groups = {}
+    for job in jobs:
+        groups.setdefault(tuple(job.get('path_sam', job.get('path_bam'))), []).append(job)
+    return list(groups.values())
+
+def set_num_worker_group(group, num_thread):
+    """Worker(s) shared by jobs of group."""
+    return {**group, 'jobs': [parallel_helpers.set_num_worker(job, max(1, num_thread // len(group['jobs']))) for job in group['jobs']]}
+
+def run_geneabacus(jobs, path_genome=None, streamed=False, keep_bedgraph=True, path_tmp='.', logger=None):
+    """Run GeneAbacus jobs. Jobs reading the same SAM/BAM input(s) run concurrently from a single decompression (BAM
+    is decoded to SAM by samtools). If streamed, bedGraphs are converted to bigWig while written."""
+    if logger is None:
+        import logging as logger
+    conversions = []
+    for job in jobs:
+        if streamed:
+            path_bedgraph = [p for p in job['profile_paths'] if p.endswith('.bedgraph')][0]
+            conversions.append([(path_bedgraph, path_genome, path_bedgraph.replace('_profiles.bedgraph', '.bw'))])
+        else:
+            conversions.append([])
+    if len(jobs) == 1:
+        bigwig.run_streamed(if_exe_geneabacus.geneabacus, jobs[0], conversions[0], keep_bedgraph=keep_bedgraph, remove_empty=True, logger=logger)
+        return
+    paths = jobs[0].get('path_sam', jobs[0].get('path_bam'))
+    with fanout.open_fanouts({p: len(jobs) for p in paths}, path_tmp, logger=logger) as fifos:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+            fs = []
+            for i, (job, conversion) in enumerate(zip(jobs, conversions)):
+                paths_fifo = [fifos[p][i] for p in paths]
+                job = {**{k: v for k, v in job.items() if k != 'path_bam'}, 'path_sam': paths_fifo}
+                fs.append(executor.submit(fanout.run_reader, bigwig.run_streamed, paths_fifo, if_exe_geneabacus.geneabacus, job, conversion, keep_bedgraph=keep_bedgraph, remove_empty=True, logger=logger))
+            for f in fs:
+                f.result()
+
+def get_job_fingerprint(job):
+    """Fingerprint of GeneAbacus job input(s) and options. Options not changing output (i.e. verbose) are ignored."""
+    options = {k: v for k, v in job.items() if k not in ['path_bam', 'path_sam', 'profile_paths', 'count_path', 'path_report'] + fingerprint_ignored}
+    return utils.get_fingerprint(job.get('path_sam', job.get('path_bam')), options)
+
+def get_sum_fingerprint(job, sources):
+    """Fingerprint of sum of profiles. Profiles made by GeneAbacus are replaced by the fingerprint of their job (sources)."""
+    options = {k: v for k, v in job.items() if k not in ['path_profiles', 'path_cache', 'writer'] + fingerprint_ignored}
+    options['sources'] = [sources[p] for p in job['path_profiles'] if p in sources]
+    return utils.get_fingerprint([p for p in job['path_profiles'] if p not in sources], options)
+
+def get_job_outputs(job, path_tmp_profiles):
+    """Output(s) of GeneAbacus job with fingerprint: bigWig (from bedGraph) and binary profiles."""
+    return [p.replace('_profiles.bedgraph', '.bw') for p in job['profile_paths'] if p not in path_tmp_profiles]
+
+def is_current(fingerprints, path, fingerprint):
+    """Output is up-to-date. Outputs without fingerprint (made by previous versions) are up-to-date if they exist."""
+    if path in fingerprints:
+        return fingerprints[path]['fingerprint'] == fingerprint and (fingerprints[path]['empty'] or os.path.exists(path))
+    else:
+        return os.path.exists(path)
+
+def load_fingerprints(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_fingerprints(path, fingerprints):
+    path_tmp = f'{path}.{os.getpid()}'
+    with open(path_tmp, 'w') as f:
+        json.dump(fingerprints, f, sort_keys=True, indent=1)
+    os.replace(path_tmp, path)
+
+def get_combined_sum_jobs(merging_schema, stranded, path_root_output, path_features, export_binary, mapping=None, path_genome=None, writer=None, path_cache=None, logger=None):
+    """Combined tracks of stranded mergers as sums of their plus and minus binary profiles (temporary unless export_binary).
+    Returns sum jobs and mergers still counted by GeneAbacus."""
+    if export_binary:
+        binary_ext = '.bin.lz4'
+    else:
+        binary_ext = '.bin'
+    sum_jobs = {}
+    for merger in merging_schema:
+        if stranded[merger['name']]:
+            path_output = os.path.join(path_root_output, merger['name'])
+            if export_binary:
+                path_binary = path_output + '_profiles.bin.lz4'
+            else:
+                path_binary = None
+            sum_jobs[path_output] = {'path_profiles': [path_output + '_plus_profiles' + binary_ext, path_output + '_minus_profiles' + binary_ext], 'path_features': path_features, 'path_bigwig': path_output + '.bw', 'path_binary': path_binary, 'mapping': mapping, 'path_genome': path_genome, 'writer': writer, 'path_cache': path_cache, 'logger': logger}
+    return sum_jobs, [m for m in merging_schema if not stranded[m['name']]]
+
+def get_tmp_profiles(jobs, split_strands, export_binary):
+    """Temporary binary profiles of GeneAbacus jobs, only written to sum plus and minus into combined."""
+    if not split_strands or export_binary:
+        return set()
+    return set([p for job in jobs for p in job['profile_paths'] if p.endswith('_profiles.bin')])
+
+def remove_tmp_profiles(path_tmp_profiles):
+    for p in path_tmp_profiles:
+        if os.path.exists(p):
+            os.remove(p)
+
+def make_bigwig(trackhub_config, path_root_bams, bam_folder, bam_names, input_sam, ignore_nh_tag, path_genome, path_features, path_mapping=None, strands=['combined', 'plus', 'minus'], profile_type='all-slice', profile_norm=False, profile_multi=None, profile_untemplated=None, profile_no_untemplated=None, profile_extension_length=None, profile_position_fraction=None, read_min_mapping_quality=None, read_in_proper_pair=None, fragment_min_length=None, fragment_max_length=None, path_root_output='.', delete_bedgraph=False, no_count=False, export_binary=False, update=False, bigwig_writer=None, profile_folder=None, profile_name=None, path_cache=None, scaling=None, num_processor=1, verbose=False, logger=None):
+    # Combined is the sum of plus and minus (except for unstranded data and normalized profiles)
+    split_strands = 'plus' in strands and 'minus' in strands and not profile_norm
+    merger_options = {m['name']: m.get('options', {}) for m in trackhub_config['merging']}
+    stranded = {n: o.get('read_strand') != 'u' for n, o in merger_options.items()}
+    if path_mapping is None:
+        mapping = None
+    else:
+        mapping = read_mapping(path_mapping)
+
+    # GeneAbacus options and merging per strand
+    strand_options = {}
+    for strand in strands:
+        count_options = {
+            'profile_formats': ['bedgraph'],
+            'profile_norm': profile_norm,
+            'profile_no_coord_mapping': True,
+            'profile_type': profile_type,
+            'profile_multi': profile_multi,
+            'profile_untemplated': profile_untemplated,
+            'profile_no_untemplated': profile_no_untemplated,
+            'profile_extension_length': profile_extension_length,
+            'profile_position_fraction': profile_position_fraction,
+            'path_features': path_features,
+            'format_features': 'tab',
+            'path_mapping': path_mapping,
+            'read_min_mapping_quality': read_min_mapping_quality,
+            'read_in_proper_pair': read_in_proper_pair,
+            'fragment_min_length': fragment_min_length,
+            'fragment_max_length': fragment_max_length,
+            'verbose': verbose,
+        }
+        merging_schema = copy.deepcopy(trackhub_config['merging'])
+        label_suffix = ''
+        if strand == 'combined':
+            for merger in merging_schema:
+                merger['options']['read_strand'] = 'u'
+        else:
+            label_suffix += '_' + strand
+            if strand == 'plus':
+                count_options['feature_strand'] = '1'
+            if strand == 'minus':
+                count_options['feature_strand'] = '-1'
+        if ignore_nh_tag:
+            count_options['ignore_nh_tag'] = True
+        if no_count:
+            count_options['count_path'] = ''
+        if export_binary:
+            count_options['profile_formats'].append('binary+lz4')
+        elif split_strands and strand != 'combined':
+            # Temporary binary profile for combined
+            count_options['profile_formats'].append('binary')
+        strand_options[strand] = (count_options, merging_schema, label_suffix)
 
-def make_bigwig(trackhub_config, path_root_bams, bam_folder, bam_names, input_sam, ignore_nh_tag, path_genome, path_features, path_mapping=None, strands=['combined', 'plus', 'minus'], profile_type='all-slice', profile_norm=False, profile_multi=None, profile_untemplated=None, profile_no_untemplated=None, profile_extension_length=None, profile_position_fraction=None, read_min_mapping_quality=None, read_in_proper_pair=None, fragment_min_length=None, fragment_max_length=None, path_root_output='.', delete_bedgraph=False, no_count=False, export_binary=False, update=False, num_processor=1, verbose=False, logger=None):
     # Prepare jobs
     jobs = []
+    # Sum of per-run profiles: GeneAbacus only for runs without profile
+    run_jobs = {}
+    sum_jobs = {}
+    path_run_output = os.path.join(path_root_output, 'runs')
     for bam_fname in bam_names:
         for strand in strands:
-            count_options = {
-                'profile_formats': ['bedgraph'],
-                'profile_norm': profile_norm,
-                'profile_no_coord_mapping': True,
-                'profile_type': profile_type,
-                'profile_multi': profile_multi,
-                'profile_untemplated': profile_untemplated,
-                'profile_no_untemplated': profile_no_untemplated,
-                'profile_extension_length': profile_extension_length,
-                'profile_position_fraction': profile_position_fraction,
-                'path_features': path_features,
-                'format_features': 'tab',
-                'path_mapping': path_mapping,
-                'read_min_mapping_quality': read_min_mapping_quality,
-                'read_in_proper_pair': read_in_proper_pair,
-                'fragment_min_length': fragment_min_length,
-                'fragment_max_length': fragment_max_length,
-                'verbose': verbose,
-            }
-            merging_schema = copy.deepcopy(trackhub_config['merging'])
-            label_suffix = ''
-            if strand == 'combined':
+            count_options, merging_schema, label_suffix = strand_options[strand]
+
+            if profile_folder is not None:
                 for merger in merging_schema:
-                    merger['options']['read_strand'] = 'u'
-            else:
-                label_suffix += '_' + strand
-                if strand == 'plus':
-                    count_options['feature_strand'] = '1'
-                if strand == 'minus':
-                    count_options['feature_strand'] = '-1'
-            if ignore_nh_tag:
-                count_options['ignore_nh_tag'] = True
-            if no_count:
-                count_options['count_path'] = ''
-            if export_binary:
-                count_options['profile_formats'].append('binary+lz4')
+                    path_profiles = []
+                    for ref in merger['refs']:
+                        # Profile from pipeline
+                        fname = get_profile_name(profile_name, strand)
+                        if fname is not None:
+                            path_profile = find_profile(path_root_bams, ref, profile_folder, fname)
+                            if path_profile is not None:
+                                path_profiles.append(path_profile)
+                                continue
+                        # Profile(s) from pipeline or GeneAbacus (first BAM name found)
+                        if strand == 'combined' and split_strands and stranded[merger['name']]:
+                            run_strands = ['plus', 'minus']
+                        else:
+                            run_strands = [strand]
+                        for run_strand in run_strands:
+                            fname = get_profile_name(profile_name, run_strand)
+                            if run_strand != strand and fname is not None:
+                                path_profile = find_profile(path_root_bams, ref, profile_folder, fname)
+                                if path_profile is not None:
+                                    path_profiles.append(path_profile)
+                                    continue
+                            job = get_run_job(ref, run_strand, merger_options[merger['name']], strand_options, run_jobs, path_root_bams, bam_folder, bam_fname, input_sam, path_run_output)
+                            if job is not None:
+                                path_profiles.append(job['profile_paths'][0])
+                    path_output = os.path.join(path_root_output, merger['name'] + label_suffix)
+                    if export_binary:
+                        path_binary = path_output + '_profiles.bin.lz4'
+                    else:
+                        path_binary = None
+                    sum_jobs[path_output] = {'path_profiles': path_profiles, 'path_features': path_features, 'path_bigwig': path_output + '.bw', 'path_binary': path_binary, 'norm': profile_norm, 'mapping': mapping, 'path_genome': path_genome, 'writer': bigwig_writer, 'path_cache': path_cache, 'logger': logger}
+                continue
+
+            if strand == 'combined' and split_strands:
+                combined_jobs, merging_schema = get_combined_sum_jobs(merging_schema, stranded, path_root_output, path_features, export_binary, mapping, path_genome, bigwig_writer, path_cache, logger)
+                sum_jobs.update(combined_jobs)
 
             job = parallel_helpers.get_count_jobs(merging_schema   = merging_schema,
                                                   path_root_bams   = path_root_bams,
@@ -192,29 +480,84 @@ def make_bigwig(trackhub_config, path_root_bams, bam_folder, bam_names, input_sa
                                                   input_sam        = input_sam,
                                                   count_options    = count_options,
                                                   check            = True)
+            jobs.extend(job)
 
-            if update:
-                for j in job:
-                    if not all([os.path.exists(p.replace('_profiles.bedgraph', '.bw')) for p in j['profile_paths']]):
-                        jobs.append(j)
-            else:
-                jobs.extend(job)
-
-    # Run jobs
-    pfu.parallel.run(if_exe_geneabacus.geneabacus, jobs, num_processor=num_processor)
+    # Jobs to run
+    if profile_folder is None:
+        path_tmp_profiles = get_tmp_profiles(jobs, split_strands, export_binary)
+    else:
+        sum_jobs = {k: j for k, j in sum_jobs.items() if len(j['path_profiles']) > 0}
+        run_paths = set([p for j in sum_jobs.values() for p in j['path_profiles']])
+        jobs = [j for j in run_jobs.values() if j['profile_paths'][0] in run_paths]
+        path_tmp_profiles = set()
+    # Fingerprints of outputs: Input(s) and options
+    job_fingerprints = [get_job_fingerprint(job) for job in jobs]
+    sources = {p: fp for job, fp in zip(jobs, job_fingerprints) for p in job['profile_paths']}
+    sum_fingerprints = {k: get_sum_fingerprint(j, sources) for k, j in sum_jobs.items()}
+    path_fingerprints = os.path.join(path_root_output, 'fingerprints.json')
+    fingerprints = load_fingerprints(path_fingerprints)
+    adopted = []
+    if update:
+        # Only output(s) with changed input(s) or options, and profiles required by sums
+        sum_jobs_all = sum_jobs
+        sum_jobs = {k: j for k, j in sum_jobs.items() if not is_current(fingerprints, j['path_bigwig'], sum_fingerprints[k])}
+        required_paths = set([p for j in sum_jobs.values() for p in j['path_profiles']])
+        update_jobs = []
+        update_fingerprints = []
+        for job, fp in zip(jobs, job_fingerprints):
+            if (profile_folder is None and not all([is_current(fingerprints, p, fp) for p in get_job_outputs(job, path_tmp_profiles)])) or any([p in required_paths and not is_current(fingerprints, p, fp) for p in job['profile_paths']]):
+                update_jobs.append(job)
+                update_fingerprints.append(fp)
+        # Outputs created before fingerprints were recorded are kept
+        adopted = [(p, fp) for job, fp in zip(jobs, job_fingerprints) for p in get_job_outputs(job, path_tmp_profiles) if p not in fingerprints and os.path.exists(p)]
+        adopted += [(j['path_bigwig'], sum_fingerprints[k]) for k, j in sum_jobs_all.items() if k not in sum_jobs and j['path_bigwig'] not in fingerprints and os.path.exists(j['path_bigwig'])]
+        jobs, job_fingerprints = update_jobs, update_fingerprints
+    # Outputs to make are invalidated until done
+    outputs = [(p, fp) for job, fp in zip(jobs, job_fingerprints) for p in get_job_outputs(job, path_tmp_profiles)] + [(j['path_bigwig'], sum_fingerprints[k]) for k, j in sum_jobs.items()]
+    for p, fp in outputs:
+        fingerprints[p] = {'fingerprint': None, 'empty': False}
+    os.makedirs(path_root_output, exist_ok=True)
+    save_fingerprints(path_fingerprints, fingerprints)
+
+    # Run jobs: With the native writer, bedGraphs are converted while written by GeneAbacus
+    streamed = profile_folder is None and bigwig.get_writer(bigwig_writer) == 'native'
+    if len(jobs) > 0:
+        groups = group_jobs(jobs)
+        if profile_folder is None:
+            path_tmp = path_root_output
+        else:
+            path_tmp = path_run_output
+            os.makedirs(path_run_output, exist_ok=True)
+        group_jobs_args = [{'jobs': g, 'path_genome': path_genome, 'streamed': streamed, 'keep_bedgraph': not delete_bedgraph, 'path_tmp': path_tmp, 'logger': logger} for g in groups]
+        # Concurrent groups and their number of worker(s) planned from input sizes (without scaling, each job uses a processor)
+        sizes = [parallel_helpers.get_input_size(g[0]) * len(g) for g in groups]
+        if scaling is None:
+            reserved = [len(g) - 1 for g in groups]
+        else:
+            reserved = None
+        parallel_helpers.run_planned(run_geneabacus, group_jobs_args, num_processor=num_processor, sizes=sizes, scaling=scaling, set_num_thread=set_num_worker_group, reserved=reserved)
     # Export to Bigwig
-    convert_jobs = []
-    path_bedgraphs = []
-    for job in jobs:
-        path_bedgraph = [p for p in job['profile_paths'] if p.endswith('.bedgraph')][0]
-        path_bedgraphs.append(path_bedgraph)
-        if os.path.getsize(path_bedgraph) > 0:
-            convert_jobs.append([path_bedgraph, path_genome, path_bedgraph.replace('_profiles.bedgraph', '.bw')])
-    pfu.parallel.run(convert_bedgraph, convert_jobs, num_processor=num_processor)
+    if profile_folder is None and not streamed:
+        convert_jobs = []
+        path_bedgraphs = []
+        for job in jobs:
+            path_bedgraph = [p for p in job['profile_paths'] if p.endswith('.bedgraph')][0]
+            path_bedgraphs.append(path_bedgraph)
+            if os.path.getsize(path_bedgraph) > 0:
+                convert_jobs.append([path_bedgraph, path_genome, path_bedgraph.replace('_profiles.bedgraph', '.bw'), bigwig_writer])
+        pfu.parallel.run(bigwig.convert_bedgraph, convert_jobs, num_processor=num_processor)
+        # Clean
+        if delete_bedgraph:
+            for path_bedgraph in path_bedgraphs:
+                os.remove(path_bedgraph)
+    # Sums
+    pfu.parallel.run(write_summed_profiles, list(sum_jobs.values()), num_processor=num_processor)
     # Clean
-    if delete_bedgraph:
-        for path_bedgraph in path_bedgraphs:
-            os.remove(path_bedgraph)
+    remove_tmp_profiles(path_tmp_profiles)
+    # Save fingerprints
+    for p, fp in outputs + adopted:
+        fingerprints[p] = {'fingerprint': fp, 'empty': not os.path.exists(p)}
+    save_fingerprints(path_fingerprints, fingerprints)
 
 def main(argv=None):
     if argv is None:
@@ -247,11 +590,14 @@ def main(argv=None):
     group.add_argument('-u', '--species_ucsc', dest='species_ucsc', action='store', help='UCSC species name')
     group.add_argument('-m', '--levels', dest='levels', action='store', default='sample,replicate', help='Level to include (comma separated in sample, replicate)')
     group.add_argument('-d', '--delete_bedgraph', dest='delete_bedgraph', action='store_true', help='Delete bedgraph')
+    group.add_argument('--bigwig_writer', dest='bigwig_writer', action='store', choices=['auto', 'native', 'bg2bw'], default='auto', help='BigWig writer (\'auto\' uses bg2bw if available)')
     group.add_argument('--no_count', dest='no_count', action='store_true', help='Don\'t generate count output')
-    group.add_argument('-w', '--update', dest='update', action='store_true', help='Update')
+    group.add_argument('-w', '--update', dest='update', action='store_true', help='Update tracks with changed input(s) or options')
     group.add_argument('-p', '--processor', dest='num_processor', action='store', type=int, default=1, help='Number of processor')
     group.add_argument('-v', '--verbose', dest='verbose', action='store_true', help='Verbose')
     group.add_argument('--path_config', dest='path_config', action='store', help='Path to config')
+    group.add_argument('--path_cache', dest='path_cache', action='store', help='Path to cache directory (default: $XDG_CACHE_HOME/labxpipe)')
+    group.add_argument('--no_cache', dest='no_cache', action='store_true', help='Don\'t use cached directory manifests')
     group.add_argument('--http_url', '--labxdb_http_url', dest='labxdb_http_url', action='store', help='Database HTTP URL')
     group.add_argument('--http_login', '--labxdb_http_login', dest='labxdb_http_login', action='store', help='Database HTTP login')
     group.add_argument('--http_password', '--labxdb_http_password', dest='labxdb_http_password', action='store', help='Database HTTP password')
@@ -272,6 +618,8 @@ def main(argv=None):
     group.add_argument('--fragment_min_length', dest='fragment_min_length', action='store', help='Minimum fragment length')
     group.add_argument('--fragment_max_length', dest='fragment_max_length', action='store', help='Maximum fragment length')
     group.add_argument('--export_binary', dest='export_binary', action='store_true', help='Export to binary')
+    group.add_argument('--profile_folder', dest='profile_folder', action='store', help='Folder of per-run binary profiles (i.e. profiling step): Replicate/sample tracks are the sum of per-run profiles')
+    group.add_argument('--profile_name', dest='profile_name', action='store', default='genome_{strand}.bin.lz4', help='Filename of per-run binary profile (\'{strand}\' is replaced by strand; without it, profile is used for combined strand only)')
     group.add_argument('--path_features', dest='path_features', action='store', help='Path to path_features (tabulated file)')
     group.add_argument('--path_mapping', dest='path_mapping', action='store', help='Path to feature name(s) mapping (tabulated file)')
     # Step
@@ -324,6 +672,11 @@ def main(argv=None):
         assert 'path_genome' in config, 'No path to genome. Please specify one using --path_genome'
         assert 'path_mapping' in config, 'No path to feature mapping. Please specify one using --path_mapping'
 
+    # Cached manifests of input directories
+    if not config['no_cache']:
+        path_manifests = os.path.join(utils.get_path_cache(config), 'manifests.json')
+        manifest.load(path_manifests)
+
     # Make config
     if config['make_config']:
         if 'labxdb_http_path' not in config and 'labxdb_http_db' not in config:
@@ -350,7 +703,11 @@ def main(argv=None):
         else:
             path_features = config['path_genome']
         # Making track data
-        make_bigwig(trackhub_config, config['path_root_bams'], config['bam_folder'], config['bam_names'], config['input_sam'], config['ignore_nh_tag'], config['path_genome'], path_features, path_mapping=config['path_mapping'], strands=config['strands'], profile_type=config['profile_type'], profile_norm=config['profile_norm'], profile_multi=config.get('profile_multi'), profile_untemplated=config.get('profile_untemplated'), profile_no_untemplated=config.get('profile_no_untemplated'), profile_extension_length=config.get('profile_extension_length'), profile_position_fraction=config.get('profile_position_fraction'), read_min_mapping_quality=config.get('read_min_mapping_quality'), read_in_proper_pair=config['read_in_proper_pair'], fragment_min_length=config.get('fragment_min_length'), fragment_max_length=config.get('fragment_max_length'), path_root_output=config['species_ucsc'], export_binary=config['export_binary'], delete_bedgraph=config['delete_bedgraph'], no_count=config['no_count'], update=config['update'], num_processor=config['num_processor'], verbose=config['verbose'], logger=logger)
+        make_bigwig(trackhub_config, config['path_root_bams'], config['bam_folder'], config['bam_names'], config['input_sam'], config['ignore_nh_tag'], config['path_genome'], path_features, path_mapping=config['path_mapping'], strands=config['strands'], profile_type=config['profile_type'], profile_norm=config['profile_norm'], profile_multi=config.get('profile_multi'), profile_untemplated=config.get('profile_untemplated'), profile_no_untemplated=config.get('profile_no_untemplated'), profile_extension_length=config.get('profile_extension_length'), profile_position_fraction=config.get('profile_position_fraction'), read_min_mapping_quality=config.get('read_min_mapping_quality'), read_in_proper_pair=config['read_in_proper_pair'], fragment_min_length=config.get('fragment_min_length'), fragment_max_length=config.get('fragment_max_length'), path_root_output=config['species_ucsc'], export_binary=config['export_binary'], delete_bedgraph=config['delete_bedgraph'], no_count=config['no_count'], update=config['update'], bigwig_writer=config['bigwig_writer'], profile_folder=config.get('profile_folder'), profile_name=config['profile_name'], path_cache=utils.get_path_cache(config), scaling=config.get('geneabacus_scaling'), num_processor=config['num_processor'], verbose=config['verbose'], logger=logger)
+
+    # Save manifests
+    if not config['no_cache']:
+        manifest.save(path_manifests)
 
 if __name__ == '__main__':
     sys.exit(main())
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Write expected counts and reports of the fixture with GeneAbacus (geneabacus on PATH)."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from labxpipe.interfaces import if_exe_geneabacus
+from test_counting import cases, count_multis, path_data, path_features
+
+def main():
+    path_expected = os.path.join(path_data, 'expected')
+    os.makedirs(path_expected, exist_ok=True)
+    print(if_exe_geneabacus.get_geneabacus_version())
+    for name, fname, paired, read_strand, read_min_overlap in cases:
+        if_exe_geneabacus.geneabacus(path_sam=os.path.join(path_data, fname),
+                                     path_features=path_features,
+                                     path_report=os.path.join(path_expected, name + '_report.json'),
+                                     read_strand=read_strand,
+                                     paired=paired,
+                                     read_min_overlap=read_min_overlap,
+                                     count_path=os.path.join(path_expected, name + '.csv'),
+                                     count_multis=count_multis)
+
+if __name__ == '__main__':
+    sys.exit(main())
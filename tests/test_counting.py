@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright © 2013 Charles E. Vejnar
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://www.mozilla.org/MPL/2.0/.
+#
+
+"""Native counting (backend numpy) compared with expected counts and reports of a small SAM/FON fixture.
+
+Expected outputs are in tests/data/counting/expected (see README.md there): make_expected.py writes them with GeneAbacus."""
+
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from labxpipe import counting
+
+path_data = os.path.join(os.path.dirname(__file__), 'data', 'counting')
+path_features = os.path.join(path_data, 'features.fon1.json')
+count_multis = [1, 2, 900]
+
+# Name, SAM, paired, read_strand and read_min_overlap
+cases = [(f'{stem}_{strand_name}_{overlap_name}', stem + '.sam', paired, read_strand, read_min_overlap)
+         for stem, paired in [('single', False), ('paired', True)]
+         for strand_name, read_strand in [('u', None), ('plus', '+'), ('minus', '-')]
+         for overlap_name, read_min_overlap in [('all', None), ('30', 30)]]
+
+def count_native(path_sam, paired, read_strand, read_min_overlap, path_count, path_report):
+    features = counting.load_features(path_features)
+    counter = counting.Counter(features, count_multis, read_strand, read_min_overlap)
+    totals = counting.count(path_sam, 'sam', [counter], paired=paired)
+    counter.write(path_count, path_report, totals[0])
+
+@pytest.mark.parametrize('name,fname,paired,read_strand,read_min_overlap', cases)
+def test_counting_expected(tmp_path, name, fname, paired, read_strand, read_min_overlap):
+    count_native(os.path.join(path_data, fname), paired, read_strand, read_min_overlap, str(tmp_path / 'numpy.csv'), str(tmp_path / 'numpy_report.json'))
+    # Same columns, rows and values
+    expected = pd.read_csv(os.path.join(path_data, 'expected', name + '.csv'))
+    observed = pd.read_csv(tmp_path / 'numpy.csv')
+    pd.testing.assert_frame_equal(observed, expected, check_dtype=False)
+    # Same report
+    with open(os.path.join(path_data, 'expected', name + '_report.json')) as f:
+        assert json.load(open(tmp_path / 'numpy_report.json')) == json.load(f)